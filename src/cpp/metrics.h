@@ -14,11 +14,17 @@
 #include <unistd.h>
 #include <sys/socket.h>
 #include <netinet/in.h>
+#include <netinet/tcp.h>
 #include <arpa/inet.h>
+#include <netdb.h>
 #include <iomanip>  // Added for std::put_time
 #include <csignal>    // Added for signal handling
 #include <signal.h>   // Added for signal handling
 #include <cstdio>     // Added for remove()
+#include <cerrno>
+#include <cstdlib>
+#include <thread>
+#include <algorithm>
 
 struct CPUStats {
     unsigned long long user;
@@ -37,20 +43,63 @@ struct SystemMetrics {
     double disk_io;         // MB/s
     double network_usage;   // MB/s
     std::string timestamp;  // ISO 8601 format
+    long long epoch_ms;     // Same instant, milliseconds since the epoch
     // Add more metrics as needed
     
-    // Helper method to serialize metrics for network transmission
+    // Helper method to serialize metrics for network transmission.
+    // Records are newline-terminated so one connection can carry a stream.
     std::string serialize() const {
         std::stringstream ss;
         ss << cpu_usage << "," 
            << memory_usage << "," 
            << disk_io << "," 
            << network_usage << ","
-           << timestamp;
+           << timestamp << "\n";
         return ss.str();
     }
 };
 
+// Binary frame layout shared with src/python/protocol.py: an 8-byte header
+// (magic 0x93 'S', version, field count, sample count, reserved) followed by
+// one int64 epoch-ms timestamp and FRAME_FIELDS float64 values per sample,
+// all little-endian.
+const unsigned char FRAME_VERSION = 1;
+const unsigned char FRAME_FIELDS = 4;
+const size_t MAX_FRAME_SAMPLES = 1000;  // Keeps frames under the receiver's 64 KiB limit
+
+inline void append_le64(std::string& out, unsigned long long value) {
+    for (int i = 0; i < 8; i++) {
+        out.push_back(static_cast<char>((value >> (8 * i)) & 0xff));
+    }
+}
+
+inline void append_double(std::string& out, double value) {
+    unsigned long long bits;
+    std::memcpy(&bits, &value, sizeof(bits));
+    append_le64(out, bits);
+}
+
+inline std::string encode_frame(const std::vector<SystemMetrics>& samples) {
+    std::string frame;
+    frame.reserve(8 + samples.size() * 8 * (FRAME_FIELDS + 1));
+    frame.push_back(static_cast<char>(0x93));
+    frame.push_back('S');
+    frame.push_back(static_cast<char>(FRAME_VERSION));
+    frame.push_back(static_cast<char>(FRAME_FIELDS));
+    frame.push_back(static_cast<char>(samples.size() & 0xff));
+    frame.push_back(static_cast<char>((samples.size() >> 8) & 0xff));
+    frame.push_back(0);
+    frame.push_back(0);
+    for (const SystemMetrics& m : samples) {
+        append_le64(frame, static_cast<unsigned long long>(m.epoch_ms));
+        append_double(frame, m.cpu_usage);
+        append_double(frame, m.memory_usage);
+        append_double(frame, m.disk_io);
+        append_double(frame, m.network_usage);
+    }
+    return frame;
+}
+
 class MetricsCollector {
 private:
     CPUStats last_cpu_stats;
@@ -58,7 +107,15 @@ private:
     unsigned long long last_disk_bytes_read;
     unsigned long long last_net_bytes;
     std::chrono::steady_clock::time_point last_net_time;  // Added this line
-    int server_socket;
+    int server_socket;  // Listening socket, -1 in push mode
+    int client_socket;  // Connected receiver, -1 when none
+    std::string server_host;  // Ingest server to push to; empty to listen instead
+    int server_port;
+    long reconnect_delay_ms;
+    bool binary;  // Send binary frames instead of CSV records
+    size_t batch_size;  // Samples per binary frame
+    std::vector<SystemMetrics> pending;  // Samples waiting to fill a frame
+    std::chrono::steady_clock::time_point next_connect_time;
     
     CPUStats read_cpu_stats();
     double calculate_cpu_usage(const CPUStats& current, const CPUStats& last);
@@ -67,10 +124,13 @@ private:
     double get_network_usage();
     std::string get_current_timestamp();
     void setup_server_socket();
+    bool connect_to_server();
+    bool send_all(const std::string& data);
 
 public:
-    MetricsCollector();
+    MetricsCollector(const std::string& server_host = "", int server_port = 0);
     ~MetricsCollector();
+    void set_binary(size_t samples_per_frame);
     void collect_metrics(SystemMetrics& metrics);
     void send_metrics(const SystemMetrics& metrics);
 };
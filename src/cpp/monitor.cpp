@@ -2,6 +2,10 @@
 #include "metrics.h"
 
 // Add at the top of monitor.cpp after includes
+// Push-mode reconnect backoff bounds, as in the Python receiver
+const long MIN_RECONNECT_DELAY_MS = 100;
+const long MAX_RECONNECT_DELAY_MS = 5000;
+
 void write_pid_file() {
     std::ofstream pid_file("/tmp/monitor.pid");
     pid_file << getpid();
@@ -11,8 +15,37 @@ void write_pid_file() {
 void remove_pid_file() {
     std::remove("/tmp/monitor.pid");
 }
+
+// A pid file left behind by a monitor that was killed does not block a new one
+bool monitor_running() {
+    std::ifstream pid_file("/tmp/monitor.pid");
+    pid_t pid = 0;
+    if (!(pid_file >> pid) || pid <= 0 || pid == getpid()) {
+        return false;
+    }
+    return kill(pid, 0) == 0 || errno == EPERM;
+}
+
+// Started by the supervisor: report readiness on the pipe it passed in
+// SYSMON_READY_FD (see supervisor.py)
+void notify_ready() {
+    const char* fd_env = std::getenv("SYSMON_READY_FD");
+    if (fd_env == nullptr) {
+        return;
+    }
+    int fd = std::atoi(fd_env);
+    if (fd <= 2) {
+        return;
+    }
+    const char message[] = "READY\n";
+    ssize_t written = write(fd, message, sizeof(message) - 1);
+    (void)written;
+    close(fd);
+    unsetenv("SYSMON_READY_FD");
+}
     
-MetricsCollector::MetricsCollector() {
+MetricsCollector::MetricsCollector(const std::string& server_host, int server_port)
+    : server_host(server_host), server_port(server_port) {
     last_cpu_stats = read_cpu_stats();
     last_disk_read_time = std::chrono::steady_clock::now();
     last_net_time = std::chrono::steady_clock::now();  // Initialize last_net_time
@@ -41,11 +74,20 @@ MetricsCollector::MetricsCollector() {
         }
     }
     
-    setup_server_socket();
+    client_socket = -1;
+    server_socket = -1;
+    reconnect_delay_ms = MIN_RECONNECT_DELAY_MS;
+    binary = false;
+    batch_size = 1;
+    next_connect_time = std::chrono::steady_clock::now();
+    if (server_host.empty()) {
+        setup_server_socket();
+    }
 }
 
 MetricsCollector::~MetricsCollector() {
-    close(server_socket);
+    if (client_socket >= 0) close(client_socket);
+    if (server_socket >= 0) close(server_socket);
 }
 
 void MetricsCollector::setup_server_socket() {
@@ -53,6 +95,10 @@ void MetricsCollector::setup_server_socket() {
     if (server_socket < 0) {
         throw std::runtime_error("Failed to create socket");
     }
+
+    // Allow a restarted collector to rebind while old connections sit in TIME_WAIT
+    int reuse = 1;
+    setsockopt(server_socket, SOL_SOCKET, SO_REUSEADDR, &reuse, sizeof(reuse));
     
     sockaddr_in server_addr;
     server_addr.sin_family = AF_INET;
@@ -66,6 +112,56 @@ void MetricsCollector::setup_server_socket() {
     listen(server_socket, 1);
 }
 
+void MetricsCollector::set_binary(size_t samples_per_frame) {
+    binary = true;
+    batch_size = std::max<size_t>(1, std::min(samples_per_frame, MAX_FRAME_SAMPLES));
+    pending.reserve(batch_size);
+}
+
+bool MetricsCollector::connect_to_server() {
+    // Back off while the ingest server is unreachable; samples taken in the
+    // meantime are dropped rather than queued
+    auto now = std::chrono::steady_clock::now();
+    if (now < next_connect_time) {
+        return false;
+    }
+
+    addrinfo hints = {};
+    hints.ai_family = AF_UNSPEC;
+    hints.ai_socktype = SOCK_STREAM;
+    addrinfo* addresses = nullptr;
+    std::string port = std::to_string(server_port);
+    if (getaddrinfo(server_host.c_str(), port.c_str(), &hints, &addresses) == 0) {
+        for (addrinfo* addr = addresses; addr != nullptr; addr = addr->ai_next) {
+            int fd = socket(addr->ai_family, addr->ai_socktype, addr->ai_protocol);
+            if (fd < 0) continue;
+            if (connect(fd, addr->ai_addr, addr->ai_addrlen) == 0) {
+                client_socket = fd;
+                break;
+            }
+            close(fd);
+        }
+        freeaddrinfo(addresses);
+    }
+
+    if (client_socket < 0) {
+        next_connect_time = now + std::chrono::milliseconds(reconnect_delay_ms);
+        reconnect_delay_ms = std::min(reconnect_delay_ms * 2, MAX_RECONNECT_DELAY_MS);
+        return false;
+    }
+    reconnect_delay_ms = MIN_RECONNECT_DELAY_MS;
+
+    // Name this collector so the server can tag its samples
+    char hostname[256] = {};
+    gethostname(hostname, sizeof(hostname) - 1);
+    if (!send_all(std::string("#host ") + hostname + "\n")) {
+        close(client_socket);
+        client_socket = -1;
+        return false;
+    }
+    return true;
+}
+
 CPUStats MetricsCollector::read_cpu_stats() {
     std::ifstream stat_file("/proc/stat");
     std::string line;
@@ -194,35 +290,137 @@ void MetricsCollector::collect_metrics(SystemMetrics& metrics) {
     metrics.disk_io = get_disk_io();
     metrics.network_usage = get_network_usage();
     metrics.timestamp = get_current_timestamp();
+    metrics.epoch_ms = std::chrono::duration_cast<std::chrono::milliseconds>(
+        std::chrono::system_clock::now().time_since_epoch()).count();
+}
+
+bool MetricsCollector::send_all(const std::string& data) {
+    size_t offset = 0;
+    while (offset < data.length()) {
+        ssize_t sent = send(client_socket, data.c_str() + offset, data.length() - offset, MSG_NOSIGNAL);
+        if (sent <= 0) {
+            return false;
+        }
+        offset += sent;
+    }
+    return true;
 }
 
 void MetricsCollector::send_metrics(const SystemMetrics& metrics) {
-    sockaddr_in client_addr;
-    socklen_t client_len = sizeof(client_addr);
-    int client_socket = accept(server_socket, (struct sockaddr*)&client_addr, &client_len);
-    
-    if (client_socket >= 0) {
-        std::string data = metrics.serialize();
-        send(client_socket, data.c_str(), data.length(), 0);
+    if (binary) {
+        pending.push_back(metrics);
+        if (pending.size() < batch_size) {
+            return;
+        }
+    }
+
+    // Wait for a receiver (or reconnect to the ingest server) only when none
+    // is connected; afterwards every sample goes over the same long-lived
+    // connection.
+    if (client_socket < 0) {
+        if (!server_host.empty()) {
+            if (!connect_to_server()) {
+                // Dropped, not queued: an outage must not grow the next
+                // frame without bound
+                pending.clear();
+                return;
+            }
+        } else {
+            sockaddr_in client_addr;
+            socklen_t client_len = sizeof(client_addr);
+            client_socket = accept(server_socket, (struct sockaddr*)&client_addr, &client_len);
+            if (client_socket < 0) {
+                pending.clear();
+                return;
+            }
+        }
+
+        int nodelay = 1;
+        setsockopt(client_socket, IPPROTO_TCP, TCP_NODELAY, &nodelay, sizeof(nodelay));
+    }
+
+    std::string data;
+    if (binary) {
+        // At most MAX_FRAME_SAMPLES per frame: the sample count is a u16 and
+        // the receiver rejects frames over 64 KiB
+        for (size_t i = 0; i < pending.size(); i += MAX_FRAME_SAMPLES) {
+            size_t end = std::min(pending.size(), i + MAX_FRAME_SAMPLES);
+            data += encode_frame(std::vector<SystemMetrics>(pending.begin() + i, pending.begin() + end));
+        }
+        pending.clear();
+    } else {
+        data = metrics.serialize();
+    }
+    if (!send_all(data)) {
+        // Receiver went away; accept or reconnect on the next sample
         close(client_socket);
+        client_socket = -1;
     }
 }
 
 // Add in main() function, right at the start:
-int main() {
+// Usage: monitor [--binary] [--batch N] [interval_ms [server_host server_port]]
+//   --binary     send binary frames instead of CSV records
+//   --batch N    samples per binary frame (default 1)
+//   interval_ms  time between samples (default 1000ms)
+//   server_host, server_port  push samples to an ingest server instead of
+//                waiting for a receiver to connect on port 12345
+int main(int argc, char* argv[]) {
     try {
+        bool binary = false;
+        long batch = 1;
+        std::vector<char*> positional = {argv[0]};
+        for (int i = 1; i < argc; i++) {
+            std::string arg = argv[i];
+            if (arg == "--binary") {
+                binary = true;
+            } else if (arg == "--batch" && i + 1 < argc) {
+                batch = std::strtol(argv[++i], nullptr, 10);
+                if (batch <= 0) {
+                    std::cerr << "Invalid batch size: " << argv[i] << std::endl;
+                    return 1;
+                }
+            } else {
+                positional.push_back(argv[i]);
+            }
+        }
+        argc = positional.size();
+        argv = positional.data();
+
+        long interval_ms = 1000;
+        if (argc > 1) {
+            interval_ms = std::strtol(argv[1], nullptr, 10);
+            if (interval_ms <= 0) {
+                std::cerr << "Invalid sampling interval: " << argv[1] << std::endl;
+                return 1;
+            }
+        }
+        std::string server_host;
+        int server_port = 0;
+        if (argc > 3) {
+            server_host = argv[2];
+            server_port = std::atoi(argv[3]);
+            if (server_port <= 0 || server_port > 65535) {
+                std::cerr << "Invalid server port: " << argv[3] << std::endl;
+                return 1;
+            }
+        } else if (argc == 3) {
+            std::cerr << "Usage: monitor [--binary] [--batch N] [interval_ms [server_host server_port]]" << std::endl;
+            return 1;
+        }
+
         // Check if already running
-        std::ifstream existing_pid("/tmp/monitor.pid");
-        if (existing_pid.good()) {
-            std::string pid_str;
-            existing_pid.close();
+        if (monitor_running()) {
             std::cerr << "Monitor process already running" << std::endl;
             return 1;
         }
         
         write_pid_file();
         
-        MetricsCollector collector;
+        MetricsCollector collector(server_host, server_port);
+        if (binary) {
+            collector.set_binary(batch);
+        }
         SystemMetrics metrics;
         
         // Set up signal handler for cleanup
@@ -231,10 +429,13 @@ int main() {
             exit(0);
         });
         
+        // Listening (or ready to push) from here on
+        notify_ready();
+
         while (true) {
             collector.collect_metrics(metrics);
             collector.send_metrics(metrics);
-            sleep(1);  // Collect metrics every second
+            std::this_thread::sleep_for(std::chrono::milliseconds(interval_ms));
         }
     } catch (const std::exception& e) {
         remove_pid_file();
@@ -0,0 +1,104 @@
+# SysMoniTool/src/python/actions.py
+import logging
+import os
+import queue
+import signal
+import subprocess
+import threading
+import time
+from selfstats import REGISTRY
+
+ACTION_SECONDS = REGISTRY.histogram('sysmon_action_duration_seconds', 'Run time of action scripts')
+ACTIONS_SUBMITTED = REGISTRY.counter('sysmon_actions_submitted_total', 'Actions queued to run')
+ACTIONS_REJECTED = REGISTRY.counter('sysmon_actions_rejected_total',
+                                    'Actions not queued: duplicate, cooling down or queue full')
+
+class ActionExecutor:
+    """Runs automated action scripts off the ingest path.
+
+    Actions are queued to a small pool of worker threads, so submit() never
+    blocks. Each action has a key (normally the rule that fired it): while an
+    action with the same key is queued or running, or within `cooldown`
+    seconds of the last time it was submitted, further submissions are
+    dropped. Scripts that run longer than `timeout` seconds are killed along
+    with everything they started.
+    """
+
+    def __init__(self, workers=2, max_queue=16, timeout=30.0, cooldown=60.0):
+        self.timeout = timeout
+        self.cooldown = cooldown
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.active = set()
+        self.last_submitted = {}
+        self.lock = threading.Lock()
+        self.threads = []
+        for i in range(workers):
+            thread = threading.Thread(target=self._worker, name=f'action-worker-{i}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+
+    def submit(self, key, command):
+        """Queue command to run; returns False if it was deduplicated, cooling down or the queue is full."""
+        now = time.monotonic()
+        with self.lock:
+            if key in self.active:
+                ACTIONS_REJECTED.inc()
+                return False
+            last = self.last_submitted.get(key)
+            if last is not None and now - last < self.cooldown:
+                ACTIONS_REJECTED.inc()
+                return False
+            try:
+                self.queue.put_nowait((key, command))
+            except queue.Full:
+                ACTIONS_REJECTED.inc()
+                logging.warning(f"Action queue full, dropping action for {key}")
+                return False
+            self.active.add(key)
+            self.last_submitted[key] = now
+        ACTIONS_SUBMITTED.inc()
+        return True
+
+    def queue_depth(self):
+        return self.queue.qsize()
+
+    def _worker(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            key, command = item
+            started = time.perf_counter()
+            try:
+                self.run_command(command)
+            except Exception as e:
+                logging.error(f"Action for {key} failed: {e}")
+            finally:
+                ACTION_SECONDS.observe(time.perf_counter() - started)
+                with self.lock:
+                    self.active.discard(key)
+
+    def run_command(self, command):
+        # Own session so a timeout can kill the script and its children
+        process = subprocess.Popen(command, start_new_session=True,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            return process.wait(timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            logging.error(f"Action {command[0]} timed out after {self.timeout}s, killing it")
+            try:
+                os.killpg(process.pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+            process.wait()
+            return None
+
+    def shutdown(self, timeout=1.0):
+        """Stop the workers, waiting at most timeout seconds for each."""
+        for _ in self.threads:
+            try:
+                self.queue.put(None, timeout=timeout)
+            except queue.Full:
+                break
+        for thread in self.threads:
+            thread.join(timeout)
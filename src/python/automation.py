@@ -1,113 +1,340 @@
 # SysMoniTool/src/python/automation.py
 import socket
 import time
-import subprocess
 import logging
-from datetime import datetime
-from database import Database
+from database import Database, timestamp_to_ms, DEFAULT_HOST
+from actions import ActionExecutor
+from rules import RuleEngine, DEFAULT_THRESHOLDS
+from recent import RecentHistory, DEFAULT_CAPACITY
+from collections import deque
+from protocol import RecordBuffer, parse_records, RECV_SIZE
+from sampler import ProcSampler, SampleClock
+from processes import ProcessSampler, DEFAULT_TOP_N
+from selfstats import REGISTRY, MetricsServer, DEFAULT_STATS_PORT
+from supervisor import notify_ready
+from journal import Journal, Persister, encode_sample, JOURNAL_NAME
+import argparse
 import os
+import signal
+import sys
 
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('data/system_monitor.log'),
-        logging.StreamHandler()
-    ]
-)
+# Reconnect backoff bounds (seconds)
+MIN_RECONNECT_DELAY = 0.1
+MAX_RECONNECT_DELAY = 5.0
+# Top processes are recorded at most this often, whatever the sampling rate
+PROCESS_INTERVAL_MS = 1000
+# Which process column explains an alert on each metric
+PROCESS_SORT_KEYS = {'memory_usage': 3, 'disk_io': 4}
+# How often learned anomaly baselines are checkpointed to the database
+CHECKPOINT_INTERVAL_MS = 60 * 1000
+# How often the database is asked whether thresholds changed; SIGHUP makes
+# the next sample check straight away
+RELOAD_CHECK_INTERVAL = 1.0
+
+SAMPLES_RECEIVED = REGISTRY.counter('sysmon_samples_received_total', 'Samples received or sampled')
+SAMPLES_DROPPED = REGISTRY.counter('sysmon_samples_dropped_total', 'Samples discarded as invalid')
+PARSE_ERRORS = REGISTRY.counter('sysmon_parse_errors_total', 'Records that could not be decoded')
+CONNECT_FAILURES = REGISTRY.counter('sysmon_connect_failures_total', 'Failed attempts to reach the collector')
+RECONNECTS = REGISTRY.counter('sysmon_reconnects_total', 'Connections to the collector after the first')
+ALERTS = REGISTRY.counter('sysmon_alerts_total', 'Rules that fired')
+HANDLE_SECONDS = REGISTRY.histogram('sysmon_handle_sample_seconds',
+                                    'Time to buffer a sample and evaluate rules on it')
+RECONNECT_DELAY = REGISTRY.gauge('sysmon_reconnect_delay_seconds', 'Current wait before the next connect attempt')
+BUFFERED = REGISTRY.gauge('sysmon_write_buffer_samples', 'Journaled samples not yet committed to the database')
+JOURNAL_FILL = REGISTRY.gauge('sysmon_journal_fill_ratio', 'Fraction of the spill journal in use')
+ACTION_QUEUE = REGISTRY.gauge('sysmon_action_queue_depth', 'Actions waiting for a worker')
+
+def setup_logging(log_file='data/system_monitor.log'):
+    # Only the receiver process logs to the file; importing this module
+    # (tests, benchmarks) leaves logging alone
+    os.makedirs(os.path.dirname(log_file), exist_ok=True)
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(log_file),
+            logging.StreamHandler()
+        ]
+    )
 
 class MetricsReceiver:
-    def __init__(self, host='localhost', port=12345, db_path='data/logs.db'):
+    def __init__(self, host='localhost', port=12345, db_path='data/logs.db',
+                 recent_capacity=DEFAULT_CAPACITY, sample_hz=None, process_top_n=DEFAULT_TOP_N):
         self.host = host
         self.port = port
         self.socket = None
+        self.stream = RecordBuffer()
+        # Decoded samples not yet returned; a binary frame carries several
+        self.samples = deque()
+        self.reconnect_delay = MIN_RECONNECT_DELAY
         
         # Ensure data directory exists
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        # This connection only reads (thresholds, baselines); samples go
+        # through the spill journal and are committed by the persister
+        # thread, so receiving never waits on SQLite
         self.db = Database(db_path)
+        self.journal = Journal(os.path.join(os.path.dirname(db_path), 'spill'),
+                               self.db.journal_applied(JOURNAL_NAME) + 1)
+        self.persister = Persister(db_path, self.journal, self.db.batch_size, self.db.flush_interval)
+        self.persister.start()
+        # In-memory recent history shared with the CLI through a mapped file
+        self.recent = RecentHistory.create(os.path.join(os.path.dirname(db_path), 'recent.mmap'),
+                                           recent_capacity)
         
-        # Initialize thresholds
-        self.thresholds = {
-            'cpu_usage': 80.0,
-            'memory_usage': 90.0,
-            'disk_io': 100.0,  # MB/s
-            'network_usage': 50.0  # MB/s
-        }
-        
-        # Load thresholds from database
-        stored_thresholds = self.db.get_thresholds()
-        if stored_thresholds:
-            self.thresholds.update(stored_thresholds)
+        # Thresholds are reloaded when another process changes them: the
+        # cheap data_version check runs at most once per RELOAD_CHECK_INTERVAL
+        # (or after SIGHUP) and the table is only read if its version moved
+        self.data_version = self.db.data_version()
+        self.thresholds_version = self.db.thresholds_version()
+        self.next_reload_check = time.monotonic() + RELOAD_CHECK_INTERVAL
+        self.reload_requested = False
+        self.thresholds = self.load_thresholds()
+        self.rules = RuleEngine.compile(self.thresholds)
+        # Resume anomaly baselines from the last checkpoint instead of
+        # learning them again
+        if self.rules.restore(self.db.load_detector_state(DEFAULT_HOST)):
+            logging.info("Restored anomaly detector baselines")
+        self.last_checkpoint_ms = None
+
+        # Action scripts run on worker threads so they never stall ingestion
+        self.actions = ActionExecutor()
+
+        # With a sampling rate, collect from /proc in this process instead of
+        # reading the C++ collector's stream
+        self.sample_hz = sample_hz
+        self.sampler = ProcSampler() if sample_hz else None
+
+        # Top processes of this host, stored alongside the samples they
+        # explain (0 disables)
+        self.processes = ProcessSampler(process_top_n) if process_top_n else None
+        self.last_processes = []
+        self.last_process_ms = None
+
+        self.connected_before = False
+        BUFFERED.set_function(self.journal.pending)
+        JOURNAL_FILL.set_function(self.journal.fill)
+        ACTION_QUEUE.set_function(self.actions.queue_depth)
     
     def connect(self):
         try:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.socket.connect((self.host, self.port))
+            self.stream = RecordBuffer()
+            if self.connected_before:
+                RECONNECTS.inc()
+            self.connected_before = True
             return True
         except Exception as e:
+            CONNECT_FAILURES.inc()
             logging.error(f"Failed to connect: {e}")
+            self.disconnect()
             return False
 
+    def disconnect(self):
+        if self.socket is not None:
+            try:
+                self.socket.close()
+            except OSError:
+                pass
+            self.socket = None
+
     def receive_metrics(self):
+        """Return the next sample from the stream, or None.
+
+        Blocks until a complete record has arrived. On EOF or a socket error
+        the connection is dropped (``self.socket`` becomes None) so that the
+        caller reconnects.
+        """
+        if self.samples:
+            return self.samples.popleft()
         try:
-            data = self.socket.recv(1024).decode()
-            if not data:
-                return None
-            
-            # Parse CSV formatted metrics
-            values = data.strip().split(',')
-            if len(values) != 5:
-                return None
-            
-            metrics = {
-                'cpu_usage': float(values[0]),
-                'memory_usage': float(values[1]),
-                'disk_io': float(values[2]),
-                'network_usage': float(values[3]),
-                'timestamp': values[4]
-            }
-            return metrics
+            while True:
+                record = self.stream.next_record()
+                if record is not None:
+                    samples = parse_records(record)
+                    if not samples:
+                        SAMPLES_DROPPED.inc()
+                        continue
+                    self.samples.extend(samples)
+                    return self.samples.popleft()
+
+                data = self.socket.recv(RECV_SIZE)
+                if not data:
+                    # Collector closed the stream; an unterminated trailing
+                    # record is still a complete sample (legacy collectors)
+                    record = self.stream.flush()
+                    self.disconnect()
+                    if record:
+                        self.samples.extend(parse_records(record))
+                    return self.samples.popleft() if self.samples else None
+                self.stream.feed(data)
+        except socket.timeout:
+            return None
+        except ValueError as e:
+            PARSE_ERRORS.inc()
+            logging.error(f"Error parsing metrics: {e}")
+            return None
         except Exception as e:
             logging.error(f"Error receiving metrics: {e}")
+            self.disconnect()
             return None
 
-    def trigger_automated_actions(self, metrics):
-        if metrics['cpu_usage'] > self.thresholds['cpu_usage']:
-            logging.warning(f"High CPU usage detected: {metrics['cpu_usage']}%")
-            subprocess.call(['./scripts/cleanup.sh'])
-        
-        if metrics['memory_usage'] > self.thresholds['memory_usage']:
-            logging.warning(f"High memory usage detected: {metrics['memory_usage']}%")
-            subprocess.call(['./scripts/alert.sh'])
-        
-        if metrics['disk_io'] > self.thresholds['disk_io']:
-            logging.warning(f"High disk I/O detected: {metrics['disk_io']} MB/s")
-            subprocess.call(['./scripts/cleanup.sh'])
-        
-        if metrics['network_usage'] > self.thresholds['network_usage']:
-            logging.warning(f"High network usage detected: {metrics['network_usage']} MB/s")
-            subprocess.call(['./scripts/alert.sh'])
+    def handle_sample(self, metrics):
+        started = time.perf_counter()
+        SAMPLES_RECEIVED.inc()
+        ts_ms = metrics.get('ts_epoch_ms')
+        if ts_ms is None:
+            ts_ms = timestamp_to_ms(metrics['timestamp'])
+        self.check_thresholds()
+        self.journal.append(encode_sample(metrics, ts_ms))
+        self.recent.append(ts_ms, metrics['cpu_usage'], metrics['memory_usage'],
+                           metrics['disk_io'], metrics['network_usage'])
+        if self.processes is not None and (self.last_process_ms is None or
+                                           ts_ms - self.last_process_ms >= PROCESS_INTERVAL_MS):
+            self.last_process_ms = ts_ms
+            self.last_processes = self.processes.sample()
+            self.persister.submit_processes(metrics.get('host', DEFAULT_HOST), ts_ms, self.last_processes)
+        self.trigger_automated_actions(metrics, ts_ms / 1000.0)
+        if self.last_checkpoint_ms is None:
+            self.last_checkpoint_ms = ts_ms
+        elif ts_ms - self.last_checkpoint_ms >= CHECKPOINT_INTERVAL_MS:
+            self.checkpoint()
+            self.last_checkpoint_ms = ts_ms
+        HANDLE_SECONDS.observe(time.perf_counter() - started)
+
+    def load_thresholds(self):
+        thresholds = dict(DEFAULT_THRESHOLDS)
+        thresholds.update(self.db.get_thresholds())
+        return thresholds
+
+    def request_reload(self):
+        """Ask for thresholds to be checked on the next sample; safe to call from a signal handler."""
+        self.reload_requested = True
+
+    def check_thresholds(self):
+        """Swap in newly compiled rules if the stored thresholds changed; True if they did."""
+        now = time.monotonic()
+        if not self.reload_requested and now < self.next_reload_check:
+            return False
+        self.next_reload_check = now + RELOAD_CHECK_INTERVAL
+        forced, self.reload_requested = self.reload_requested, False
+        data_version = self.db.data_version()
+        if not forced and data_version == self.data_version:
+            return False
+        self.data_version = data_version
+        version = self.db.thresholds_version()
+        if version == self.thresholds_version:
+            return False
+        self.thresholds_version = version
+
+        thresholds = self.load_thresholds()
+        rules = RuleEngine.compile(thresholds)
+        rules.adopt(self.rules)
+        self.thresholds, self.rules = thresholds, rules
+        logging.info(f"Reloaded thresholds (version {version})")
+        return True
+
+    def checkpoint(self):
+        state = self.rules.state()
+        if state:
+            self.persister.submit_state(DEFAULT_HOST, state)
+
+    def trigger_automated_actions(self, metrics, t=None):
+        if t is None:
+            t = timestamp_to_ms(metrics['timestamp']) / 1000.0
+        for rule in self.rules.evaluate(metrics, t):
+            ALERTS.inc()
+            value = metrics[rule.metric]
+            if self.actions.submit(rule.name, [rule.action, rule.alert_type, str(value)]):
+                logging.warning(rule.describe(value))
+                if self.last_processes:
+                    logging.warning(f"Top processes: {self.describe_processes(rule.metric)}")
+
+    def describe_processes(self, metric, count=3):
+        key = PROCESS_SORT_KEYS.get(metric, 2)
+        top = sorted(self.last_processes, key=lambda p: p[key], reverse=True)[:count]
+        return ', '.join(
+            f"{name} ({pid}) {cpu:.1f}% CPU {rss / 1048576:.0f} MB {io / 1048576:.1f} MB/s"
+            for pid, name, cpu, rss, io in top
+        )
 
     def run(self):
-        while True:
-            if not self.connect():
-                time.sleep(5)
-                continue
-            
-            try:
-                metrics = self.receive_metrics()
-                if metrics:
-                    self.db.insert_data(metrics)
-                    self.trigger_automated_actions(metrics)
-            except Exception as e:
-                logging.error(f"Error in main loop: {e}")
-            finally:
-                self.socket.close()
-            
-            time.sleep(1)
+        if self.sampler is not None:
+            self.run_sampler()
+            return
+        try:
+            while True:
+                if self.socket is None:
+                    if not self.connect():
+                        RECONNECT_DELAY.set(self.reconnect_delay)
+                        time.sleep(self.reconnect_delay)
+                        self.reconnect_delay = min(self.reconnect_delay * 2, MAX_RECONNECT_DELAY)
+                        continue
+
+                try:
+                    metrics = self.receive_metrics()
+                    if metrics:
+                        if self.reconnect_delay != MIN_RECONNECT_DELAY:
+                            self.reconnect_delay = MIN_RECONNECT_DELAY
+                            RECONNECT_DELAY.set(0)
+                        self.handle_sample(metrics)
+                except Exception as e:
+                    logging.error(f"Error in main loop: {e}")
+        finally:
+            self.close()
+
+    def run_sampler(self):
+        clock = SampleClock(self.sample_hz)
+        try:
+            while True:
+                try:
+                    self.handle_sample(self.sampler.sample())
+                except Exception as e:
+                    logging.error(f"Error in sampling loop: {e}")
+                clock.wait()
+        finally:
+            self.close()
+
+    def close(self):
+        self.disconnect()
+        if self.sampler is not None:
+            self.sampler.close()
+        if self.processes is not None:
+            self.processes.close()
+        self.actions.shutdown()
+        self.recent.close()
+        try:
+            self.checkpoint()
+            # Commits what is journaled; anything it cannot is replayed by
+            # the next receiver
+            self.persister.stop()
+        finally:
+            self.journal.close()
+            self.db.close()
 
 if __name__ == '__main__':
-    receiver = MetricsReceiver()
+    parser = argparse.ArgumentParser(description='Metrics receiver and automation')
+    parser.add_argument('--sample-hz', type=float, metavar='HZ',
+                        help='Sample /proc in-process at HZ (0.1-100) instead of reading the collector')
+    parser.add_argument('--stats-port', type=int, default=DEFAULT_STATS_PORT, metavar='PORT',
+                        help=f'Serve internal metrics on http://127.0.0.1:PORT/metrics '
+                             f'(default: {DEFAULT_STATS_PORT}, 0 disables)')
+    args = parser.parse_args()
+    setup_logging()
+
+    # Turn SIGTERM into a normal exit so buffered samples are flushed
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    receiver = MetricsReceiver(sample_hz=args.sample_hz)
+    # cli.py --config sends SIGHUP after changing thresholds
+    signal.signal(signal.SIGHUP, lambda signum, frame: receiver.request_reload())
+    if args.stats_port:
+        try:
+            MetricsServer(port=args.stats_port).start()
+        except OSError as e:
+            logging.error(f"Could not serve internal metrics on port {args.stats_port}: {e}")
+    # Tell the supervisor (cli.py --start) that startup is complete
+    notify_ready()
     receiver.run()
 
 
@@ -0,0 +1,276 @@
+# SysMoniTool/src/python/bench.py
+"""Benchmarks for the ingest, query and alert paths.
+
+    python3 src/python/bench.py --output bench.json
+    python3 src/python/bench.py --rows 1000000 10000000 --compare bench.json
+
+ingest  a synthetic collector process pushes stamped samples to an in-process
+        IngestServer; reports committed samples per second and send-to-commit
+        latency percentiles
+query   query_data() over a minute and an hour, and get_latest_metrics(),
+        against databases filled with each of --rows samples
+alert   MetricsReceiver.handle_sample() per sample, and from a breaching
+        sample to its action being submitted
+
+Results are written as JSON. --compare reports every metric that got worse
+than a previous result file by more than --tolerance and exits non-zero.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from database import Database, ms_to_timestamp
+from ingest_server import IngestServer
+import loadgen
+
+LOADGEN = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'loadgen.py')
+QUERY_REPEATS = 20
+ALERT_SAMPLES = 20000
+# Metric name suffixes where larger is better; everything else is a latency
+HIGHER_IS_BETTER = ('_per_s',)
+
+
+def percentiles(values, scale=1.0):
+    """p50/p95/p99/max of values (multiplied by scale), rounded for the report."""
+    if not values:
+        return {}
+    values = sorted(values)
+    last = len(values) - 1
+    result = {f'p{q}': values[min(last, int(q / 100 * len(values)))] * scale for q in (50, 95, 99)}
+    result['max'] = values[last] * scale
+    return {name: round(value, 4) for name, value in result.items()}
+
+
+class LatencyIngestServer(IngestServer):
+    """IngestServer recording, per committed sample, the time since it was sent.
+
+    Samples must come from a stamping collector (send time in network_usage).
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.latencies = []
+        self.committed = 0
+
+    async def write_batch(self, batch):
+        await super().write_batch(batch)
+        now_ms = time.time() * 1000
+        self.latencies.extend(now_ms - metrics['network_usage'] for metrics in batch)
+        self.committed += len(batch)
+
+
+async def run_ingest(db_path, hosts, rate, duration):
+    server = LatencyIngestServer('127.0.0.1', 0, db_path)
+    await server.start()
+    try:
+        started = time.perf_counter()
+        collector = await asyncio.create_subprocess_exec(
+            sys.executable, LOADGEN, 'collect', '--port', str(server.port), '--hosts', str(hosts),
+            '--rate', str(rate), '--duration', str(duration), '--stamp',
+            stdout=asyncio.subprocess.PIPE)
+        output, _ = await collector.communicate()
+        sent = int(output.decode().strip() or 0)
+        # Everything sent is committed within a flush interval or two
+        deadline = time.perf_counter() + 10 * server.flush_interval
+        while server.committed < sent and time.perf_counter() < deadline:
+            await asyncio.sleep(0.01)
+        elapsed = time.perf_counter() - started
+    finally:
+        await server.stop()
+    return {
+        'hosts': hosts,
+        'rate_per_host': rate,
+        'sent': sent,
+        'committed': server.committed,
+        'samples_per_s': round(server.committed / elapsed, 1),
+        'commit_latency_ms': percentiles(server.latencies),
+    }
+
+
+def bench_ingest(workdir, hosts, rate, duration):
+    return asyncio.run(run_ingest(os.path.join(workdir, 'ingest.db'), hosts, rate, duration))
+
+
+def timed(function, repeats=QUERY_REPEATS):
+    times = []
+    for _ in range(repeats):
+        started = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - started)
+    return percentiles(times, scale=1000.0)
+
+
+def bench_queries(workdir, rows, hosts):
+    db_path = os.path.join(workdir, f'query-{rows}.db')
+    started = time.perf_counter()
+    first_ms, last_ms = loadgen.fill_database(db_path, rows, hosts)
+    fill_s = time.perf_counter() - started
+
+    middle = (first_ms + last_ms) // 2
+    db = Database(db_path)
+    try:
+        result = {'fill_rows_per_s': round(rows / fill_s, 1)}
+        for label, span_ms in (('minute', 60 * 1000), ('hour', 60 * 60 * 1000)):
+            start, end = ms_to_timestamp(middle), ms_to_timestamp(middle + span_ms)
+            result[f'query_data_{label}_rows'] = len(db.query_data(start, end))
+            result[f'query_data_{label}_ms'] = timed(lambda: db.query_data(start, end))
+        result['get_latest_metrics_ms'] = timed(db.get_latest_metrics)
+        result['get_latest_metrics_host_ms'] = timed(lambda: db.get_latest_metrics('synthetic-0'))
+    finally:
+        db.close()
+        os.remove(db_path)
+    return result
+
+
+def bench_alerts(workdir, samples=ALERT_SAMPLES):
+    from automation import MetricsReceiver
+
+    db_path = os.path.join(workdir, 'alert.db')
+    db = Database(db_path)
+    db.update_threshold('cpu_usage', 80.0)
+    db.update_threshold('cpu_usage_duration', 0.0)
+    db.close()
+    receiver = MetricsReceiver(db_path=db_path, process_top_n=0)
+    submitted = []
+
+    def submit(key, command):
+        # Record the time the action would be queued; running scripts is not
+        # part of the path being measured
+        submitted.append(time.perf_counter())
+        return False
+
+    receiver.actions.submit = submit
+    start_ms = int(time.time() * 1000)
+    per_sample, to_action = [], []
+    try:
+        for i in range(samples):
+            ts_ms = start_ms + i * 1000
+            # Alternate breaching and normal samples so every breach fires
+            cpu = 95.0 if i % 2 else 10.0
+            metrics = {'timestamp': ms_to_timestamp(ts_ms), 'ts_epoch_ms': ts_ms, 'cpu_usage': cpu,
+                       'memory_usage': 50.0, 'disk_io': 10.0, 'network_usage': 1.0}
+            fired = len(submitted)
+            started = time.perf_counter()
+            receiver.handle_sample(metrics)
+            per_sample.append(time.perf_counter() - started)
+            if len(submitted) > fired:
+                to_action.append(submitted[-1] - started)
+    finally:
+        receiver.close()
+    return {
+        'samples': samples,
+        'alerts': len(to_action),
+        'handle_sample_ms': percentiles(per_sample, scale=1000.0),
+        'sample_to_action_ms': percentiles(to_action, scale=1000.0),
+    }
+
+
+def git_version():
+    try:
+        return subprocess.run(['git', 'describe', '--always', '--dirty'], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def flatten(results, prefix=''):
+    """{'a': {'b': 1}} -> {'a.b': 1}, numbers only."""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{key}.'))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[prefix + key] = value
+    return flat
+
+
+def compare(baseline, current, tolerance):
+    """Metrics that got worse by more than tolerance (a fraction): [(name, old, new)]."""
+    old, new = flatten(baseline['results']), flatten(current['results'])
+    regressions = []
+    for name, before in old.items():
+        after = new.get(name)
+        if after is None or before <= 0 or not (name.endswith(HIGHER_IS_BETTER) or '_ms.' in name):
+            continue
+        if name.endswith(HIGHER_IS_BETTER):
+            worse = after < before * (1 - tolerance)
+        else:
+            worse = after > before * (1 + tolerance)
+        if worse:
+            regressions.append((name, before, after))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark ingest, query and alert paths')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000000],
+                        help='Database sizes for the query benchmarks (default: 1000000)')
+    parser.add_argument('--hosts', type=int, default=10, help='Simulated hosts')
+    parser.add_argument('--rate', type=float, default=100.0,
+                        help='Ingest samples per second per host (0: unthrottled)')
+    parser.add_argument('--duration', type=float, default=5.0, help='Seconds of ingest load')
+    parser.add_argument('--only', choices=['ingest', 'query', 'alert'], action='append',
+                        help='Run only these benchmarks (repeatable)')
+    parser.add_argument('--output', default='-', help='Result file (default: stdout)')
+    parser.add_argument('--compare', metavar='FILE', help='Previous result file to check against')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='Allowed slowdown for --compare (default: 0.2, i.e. 20%%)')
+    parser.add_argument('--workdir', help='Directory for scratch databases (default: a temp dir)')
+    args = parser.parse_args()
+
+    selected = args.only or ['ingest', 'query', 'alert']
+    workdir = args.workdir or tempfile.mkdtemp(prefix='sysmon-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    results = {}
+    try:
+        if 'ingest' in selected:
+            print("Running ingest benchmark...", file=sys.stderr)
+            results['ingest'] = bench_ingest(workdir, args.hosts, args.rate, args.duration)
+        if 'query' in selected:
+            results['query'] = {}
+            for rows in args.rows:
+                print(f"Running query benchmark on {rows} rows...", file=sys.stderr)
+                results['query'][str(rows)] = bench_queries(workdir, rows, args.hosts)
+        if 'alert' in selected:
+            print("Running alert benchmark...", file=sys.stderr)
+            results['alert'] = bench_alerts(workdir)
+    finally:
+        if args.workdir is None:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    report = {
+        'version': git_version(),
+        'created': datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'config': {'rows': args.rows, 'hosts': args.hosts, 'rate': args.rate, 'duration': args.duration},
+        'results': results,
+    }
+    text = json.dumps(report, indent=2)
+    if args.output == '-':
+        print(text)
+    else:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+        print(f"Wrote results to {args.output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(baseline, report, args.tolerance)
+        for name, before, after in regressions:
+            print(f"REGRESSION {name}: {before} -> {after}", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+        print(f"No regressions against {args.compare} ({baseline.get('version')})", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,164 +1,160 @@
 # SysMoniTool/src/python/cli.py
+"""Command line interface.
+
+The CLI is run from scripts and cron many times a minute, so startup is kept
+short: modules only some commands need (supervisor, subprocess, tabulate,
+export, ...) are imported inside the methods that use them, and read-only
+commands open the database read-only, without DDL or commits. Nothing is
+logged to a file from here; see tests/test_startup.py.
+"""
 import argparse
 import json
+import sys
 import time
-from datetime import datetime, timedelta
-from database import Database
-from automation import MetricsReceiver
-import subprocess
-import signal
 import os
-import psutil
-import tabulate
-import socket
+import sqlite3
+from database import Database, date_to_ms, ms_to_timestamp, DEFAULT_HOST, DAY_MS
+from rules import DEFAULT_THRESHOLDS
+from selfstats import DEFAULT_STATS_PORT
+
+SAMPLE_HEADERS = ['Timestamp', 'CPU Usage (%)', 'Memory Usage (%)', 
+                  'Disk I/O (MB/s)', 'Network Usage (MB/s)']
+# The shared recent history is only trusted while the receiver keeps it current
+RECENT_MAX_AGE_MS = 60 * 1000
+METRIC_LABELS = {
+    'cpu_usage': ('CPU Usage', '%'),
+    'memory_usage': ('Memory Usage', '%'),
+    'disk_io': ('Disk I/O', 'MB/s'),
+    'network_usage': ('Network Usage', 'MB/s')
+}
+STATS_QUANTILES = (0.5, 0.95, 0.99)
+HISTOGRAM_BINS = 10
+HISTOGRAM_WIDTH = 40
+# Mirrors export.FORMATS, so --help does not need to import export
+EXPORT_FORMATS = ('csv', 'ndjson')
+# Commands that only read the database
+READ_ONLY_COMMANDS = ('view', 'watch', 'recent', 'query', 'export', 'stats', 'processes', 'hosts', 'replay')
+
+
+def print_table(data, headers):
+    import tabulate
+    print(tabulate.tabulate(data, headers=headers, tablefmt='grid'))
+
 
 class MonitoringCLI:
-    def __init__(self):
-        self.db = Database('data/logs.db')
+    def __init__(self, readonly=False):
+        self.db_path = 'data/logs.db'
+        self.readonly = readonly
+        self._db = None
+        self.recent_path = 'data/recent.mmap'
         self.pid_file = 'data/monitor.pid'
-        self.cpp_pid_file = '/tmp/monitor.pid'
-        self.port = 12345
+        self.query_socket = 'data/query.sock'
 
-    def is_port_in_use(self):
-        """Check if the monitoring port is already in use."""
-        try:
-            with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-                return s.connect_ex(('localhost', self.port)) == 0
-        except:
-            return False
+    @property
+    def db(self):
+        """The database, opened on first use; read-only when the CLI was created for a read-only command.
 
-    def kill_process_and_children(self, pid):
-        """Recursively kill a process and all its children."""
-        try:
-            parent = psutil.Process(pid)
-            children = parent.children(recursive=True)
-            for child in children:
-                try:
-                    child.kill()
-                except psutil.NoSuchProcess:
-                    pass
-            parent.kill()
-        except psutil.NoSuchProcess:
-            pass
+        Read-only commands go through the query server when one is listening
+        on query_socket (see query_server.py) and open SQLite directly otherwise.
+        The server is only connected to by the first call it serves, so
+        commands that only scan (--watch, --export, --replay) never hold a
+        connection to it.
+        """
+        if self._db is None and self.readonly and os.path.exists(self.query_socket):
+            from query_server import RemoteDatabase
+            self._db = RemoteDatabase(self.query_socket, self.open_db)
+        if self._db is None:
+            self._db = self.open_db()
+        return self._db
 
-    def cleanup_existing_processes(self):
-        """Clean up any existing monitor and automation processes."""
-        # Clean up processes by name
-        for proc in psutil.process_iter(['pid', 'name', 'cmdline']):
+    def open_db(self):
+        db = None
+        if self.readonly:
             try:
-                cmdline = proc.cmdline()
-                if len(cmdline) >= 2:
-                    if './build/monitor' in ' '.join(cmdline) or 'automation.py' in cmdline[1]:
-                        self.kill_process_and_children(proc.pid)
-            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                db = Database(self.db_path, readonly=True)
+            except sqlite3.Error:
+                # Missing or older schema: create/migrate it once
                 pass
+        return db if db is not None else Database(self.db_path)
 
-        # Clean up socket if it exists
-        try:
-            subprocess.run(['pkill', '-f', '12345'], stderr=subprocess.DEVNULL)
-        except subprocess.SubprocessError:
-            pass
+    def start_monitoring(self, sample_hz=None, query_server=False):
+        import supervisor
+        print("Starting monitoring system...")
 
-        # Remove PID files
-        if os.path.exists(self.pid_file):
-            os.remove(self.pid_file)
-        if os.path.exists(self.cpp_pid_file):
-            os.remove(self.cpp_pid_file)
+        # Replace an instance that is already running
+        supervisor.stop(self.pid_file)
 
-        # Wait for port to be released
-        timeout = time.time() + 5  # 5 second timeout
-        while self.is_port_in_use() and time.time() < timeout:
-            time.sleep(0.1)
+        children = []
+        if sample_hz is None:
+            children.append(('cpp', ['./build/monitor']))
+        # With a sampling rate the receiver collects from /proc itself and no
+        # C++ monitor is needed
+        command = [sys.executable, 'src/python/automation.py']
+        if sample_hz is not None:
+            command += ['--sample-hz', str(sample_hz)]
+        children.append(('python', command))
+        if query_server:
+            children.append(('query', [sys.executable, 'src/python/query_server.py', '--socket', self.query_socket]))
 
-    def start_monitoring(self):
-        print("Starting monitoring system...")
-        
-        # Clean up any existing processes first
-        self.cleanup_existing_processes()
-        
-        # Check if port is still in use after cleanup
-        if self.is_port_in_use():
-            print("Error: Port 12345 is still in use after cleanup. Please check for blocking processes.")
-            return
-        
-        try:
-            # Start the C++ monitor process
-            cpp_process = subprocess.Popen(['./build/monitor'])
-            time.sleep(1)  # Give the monitor time to start
-            
-            if not cpp_process.poll() is None:  # Check if process is still running
-                raise Exception("Monitor process failed to start")
-            
-            # Start the Python automation process
-            python_process = subprocess.Popen(['python3', 'src/python/automation.py'])
-            time.sleep(1)  # Give the automation process time to start
-            
-            if not python_process.poll() is None:  # Check if process is still running
-                cpp_process.terminate()
-                raise Exception("Automation process failed to start")
-            
-            # Save PIDs
-            with open(self.pid_file, 'w') as f:
-                json.dump({
-                    'cpp_pid': cpp_process.pid,
-                    'python_pid': python_process.pid,
-                    'start_time': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                }, f)
-            
+        ok, reason = supervisor.start(children, self.pid_file)
+        if ok:
             print("Monitoring started successfully.")
-        except Exception as e:
-            print(f"Failed to start monitoring: {e}")
-            self.cleanup_existing_processes()
+        else:
+            print(f"Failed to start monitoring: {reason}")
 
     def stop_monitoring(self):
+        import supervisor
         print("Stopping monitoring system...")
-        if os.path.exists(self.pid_file):
-            try:
-                with open(self.pid_file, 'r') as f:
-                    pids = json.load(f)
-                
-                # Terminate processes
-                for name, pid in pids.items():
-                    if name != 'start_time':  # Skip the timestamp
-                        try:
-                            process = psutil.Process(pid)
-                            self.kill_process_and_children(pid)
-                        except psutil.NoSuchProcess:
-                            pass
-                
-                self.cleanup_existing_processes()
-                print("Monitoring stopped successfully.")
-            except Exception as e:
-                print(f"Failed to stop monitoring: {e}")
+        if supervisor.stop(self.pid_file):
+            print("Monitoring stopped successfully.")
         else:
             print("Monitoring is not running.")
 
     def is_monitoring_running(self):
-        if not os.path.exists(self.pid_file):
-            return False
-        
-        try:
-            with open(self.pid_file, 'r') as f:
-                pids = json.load(f)
-            
-            # Check each process
-            for name, pid in pids.items():
-                if name != 'start_time':  # Skip the timestamp
-                    if not psutil.pid_exists(pid):
-                        return False
-                    try:
-                        process = psutil.Process(pid)
-                        if process.status() == 'zombie':
-                            return False
-                    except psutil.NoSuchProcess:
-                        return False
-            return True
-        except:
-            return False
+        import supervisor
+        return supervisor.is_running(self.pid_file)
 
     # [Rest of the code remains unchanged: view_current_metrics, query_historical_data, configure_thresholds]
-    def view_current_metrics(self):
-        latest = self.db.get_latest_metrics()
+    def open_recent(self):
+        """Map the receiver's recent history if it is present and current, else None."""
+        from recent import RecentHistory
+        recent = RecentHistory.open(self.recent_path)
+        if recent is None:
+            return None
+        latest_ms = recent.latest_ms()
+        if latest_ms is None or time.time() * 1000 - latest_ms > RECENT_MAX_AGE_MS:
+            recent.close()
+            return None
+        return recent
+
+    def format_samples(self, rows):
+        return [
+            [row[1], f"{row[2]:.1f}", f"{row[3]:.1f}", 
+             f"{row[4]:.1f}", f"{row[5]:.1f}"] 
+            for row in rows
+        ]
+
+    def sample_table(self, rows):
+        """Headers and rows for raw samples, with a Host column when several hosts are mixed."""
+        formatted = self.format_samples(rows)
+        if len({row[6] for row in rows if len(row) > 6}) > 1:
+            return ['Host'] + SAMPLE_HEADERS, [[row[6]] + line for row, line in zip(rows, formatted)]
+        return SAMPLE_HEADERS, formatted
+
+    def open_recent_for(self, host):
+        # The shared recent history only holds the local receiver's samples
+        if host not in (None, DEFAULT_HOST):
+            return None
+        return self.open_recent()
+
+    def view_current_metrics(self, host=None):
+        latest = None
+        recent = self.open_recent_for(host)
+        if recent is not None:
+            latest = recent.latest()
+            recent.close()
+        if latest is None:
+            latest = self.db.get_latest_metrics(host)
         if not latest:
             print("No metrics available.")
             return
@@ -172,48 +168,262 @@ class MonitoringCLI:
             ['Network Usage', f"{latest[5]:.1f} MB/s"]
         ]
         
-        print("\nCurrent System Metrics:")
-        print(tabulate.tabulate(data, headers=headers, tablefmt='grid'))
+        title = f" ({host})" if host else ''
+        print(f"\nCurrent System Metrics{title}:")
+        print_table(data, headers)
 
-    def query_historical_data(self, start_date, end_date):
+    def query_historical_data(self, start_date, end_date, resolution='auto', host=None):
+        from datetime import datetime, timedelta
         try:
             start = datetime.strptime(start_date, '%Y-%m-%d')
             end = datetime.strptime(end_date, '%Y-%m-%d') + timedelta(days=1)
-            data = self.db.query_data(start.strftime('%Y-%m-%d'), end.strftime('%Y-%m-%d'))
+            start_ms = date_to_ms(start.strftime('%Y-%m-%d'))
+            end_ms = date_to_ms(end.strftime('%Y-%m-%d'))
+            if resolution == 'auto':
+                resolution = self.db.choose_resolution(start_ms, end_ms, host=host)
+
+            if resolution == 'raw':
+                data = self.db.query_range(start_ms, end_ms, host)
+                headers, formatted_data = self.sample_table(data)
+            else:
+                # Rollup rows: bucket, count, then avg/min/max/last per metric;
+                # without a host, buckets are merged across hosts
+                data = self.db.query_rollup(start_ms, end_ms, resolution, host)
+                headers = ['Bucket', 'Samples', 'CPU avg/max (%)', 'Memory avg/max (%)',
+                          'Disk I/O avg/max (MB/s)', 'Network avg/max (MB/s)']
+                formatted_data = [
+                    [ms_to_timestamp(row[0]), row[1]] +
+                    [f"{row[i]:.1f} / {row[i + 2]:.1f}" for i in (2, 6, 10, 14)]
+                    for row in data
+                ]
             
             if not data:
                 print("No data found for the specified period.")
                 return
             
-            headers = ['Timestamp', 'CPU Usage (%)', 'Memory Usage (%)', 
-                      'Disk I/O (MB/s)', 'Network Usage (MB/s)']
-            formatted_data = [
-                [row[1], f"{row[2]:.1f}", f"{row[3]:.1f}", 
-                 f"{row[4]:.1f}", f"{row[5]:.1f}"] 
-                for row in data
-            ]
-            
-            print(f"\nHistorical Data ({start_date} to {end_date}):")
-            print(tabulate.tabulate(formatted_data, headers=headers, tablefmt='grid'))
+            label = '' if resolution == 'raw' else f", {resolution} resolution"
+            if host:
+                label += f", host {host}"
+            print(f"\nHistorical Data ({start_date} to {end_date}{label}):")
+            print_table(formatted_data, headers)
         except ValueError:
             print("Invalid date format. Please use YYYY-MM-DD format.")
 
-    def configure_thresholds(self):
-        # Default thresholds if none exist
-        default_thresholds = {
-            'cpu_usage': 80.0,
-            'memory_usage': 90.0,
-            'disk_io': 100.0,
-            'network_usage': 50.0
-        }
+    def view_recent_metrics(self, minutes, host=None):
+        """Show the last N minutes, from the shared recent history when it covers them."""
+        end_ms = int(time.time() * 1000) + 1
+        start_ms = end_ms - int(minutes * 60 * 1000)
+        data = None
+        recent = self.open_recent_for(host)
+        if recent is not None:
+            data = recent.since(start_ms)
+            recent.close()
+        if data is None:
+            data = self.db.query_range(start_ms, end_ms, host)
+
+        if not data:
+            print("No data found for the specified period.")
+            return
+
+        print(f"\nLast {minutes:g} minutes:")
+        headers, formatted_data = self.sample_table(data)
+        print_table(formatted_data, headers)
+
+    def view_processes(self, timestamp=None, host=None):
+        """Show the top processes recorded at (or just before) timestamp, default the latest."""
+        try:
+            ts_ms = date_to_ms(timestamp) if timestamp else None
+        except ValueError:
+            print("Invalid timestamp. Please use YYYY-MM-DD or 'YYYY-MM-DD HH:MM:SS' format.")
+            return
+        tick, rows = self.db.query_processes(ts_ms, host or DEFAULT_HOST)
+        if not rows:
+            print("No process data available.")
+            return
+
+        data = [
+            [pid, name, f"{cpu:.1f}", f"{rss / (1024 * 1024):.1f}", f"{io / (1024 * 1024):.2f}"]
+            for pid, name, cpu, rss, io in rows
+        ]
+        print(f"\nTop processes at {ms_to_timestamp(tick)}:")
+        print_table(data, ['PID', 'Name', 'CPU (%)', 'RSS (MB)', 'I/O (MB/s)'])
+
+    def export_data(self, start, end, fmt='csv', output='-', resolution='raw', host=None):
+        """Stream a range as CSV or NDJSON to output ('-' for stdout), oldest first.
+
+        start and end are dates (end inclusive) or full timestamps.
+        """
+        try:
+            start_ms = date_to_ms(start)
+            end_ms = date_to_ms(end) + (DAY_MS if len(end) == 10 else 1)
+        except ValueError:
+            print("Invalid date format. Please use YYYY-MM-DD or 'YYYY-MM-DD HH:MM:SS' format.",
+                  file=sys.stderr)
+            return
+
+        import export
+        if resolution in ('auto', 'raw'):
+            rows = self.db.iter_range(start_ms, end_ms, host, newest_first=False,
+                                      columns=export.RAW_SELECT)
+            columns = export.RAW_COLUMNS
+        else:
+            rows = self.db.iter_rollup(start_ms, end_ms, resolution, host, newest_first=False)
+            columns = export.ROLLUP_COLUMNS
+
+        out = sys.stdout if output == '-' else open(output, 'w', newline='')
+        try:
+            count = export.write_rows(rows, columns, out, fmt)
+        except BrokenPipeError:
+            # Reader went away (e.g. piped into head); stop quietly without
+            # a second error when the interpreter flushes stdout at exit
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            return
+        finally:
+            if out is not sys.stdout:
+                out.close()
+        if output != '-':
+            print(f"Exported {count} rows to {output}")
 
-        # Get current thresholds, use defaults if none exist
-        current_thresholds = self.db.get_thresholds()
-        if not current_thresholds:
-            current_thresholds = default_thresholds
-            # Initialize database with defaults
-            for name, value in default_thresholds.items():
-                self.db.update_threshold(name, value)
+    def view_stats(self, start, end, host=None):
+        """Percentiles, histogram and time above threshold per metric, merged from rollup sketches."""
+        from datetime import timedelta
+        try:
+            start_ms = date_to_ms(start)
+            end_ms = date_to_ms(end) + (DAY_MS if len(end) == 10 else 1)
+        except ValueError:
+            print("Invalid date format. Please use YYYY-MM-DD or 'YYYY-MM-DD HH:MM:SS' format.")
+            return
+
+        thresholds = dict(DEFAULT_THRESHOLDS)
+        thresholds.update(self.db.get_thresholds())
+        sketches, covered_ms, above_ms = self.db.stats(start_ms, end_ms, host, thresholds)
+        if not sketches['cpu_usage'].count():
+            print("No data found for the specified period.")
+            return
+
+        label = f", host {host}" if host else ''
+        print(f"\nStatistics ({start} to {end}{label}), {covered_ms / 3600000:.1f} h of data:")
+        headers = ['Metric', 'Samples'] + [f"p{q * 100:g}" for q in STATS_QUANTILES] + \
+                  ['Threshold', 'Time above']
+        data = []
+        for field, (name, unit) in METRIC_LABELS.items():
+            sketch = sketches[field]
+            data.append(
+                [name, sketch.count()] +
+                [f"{sketch.quantile(q):.1f} {unit}" for q in STATS_QUANTILES] +
+                [f"{thresholds[field]:g} {unit}",
+                 f"{timedelta(seconds=int(above_ms[field] / 1000))} "
+                 f"({above_ms[field] / (covered_ms or 1):.1%})"]
+            )
+        print_table(data, headers)
+
+        for field, (name, unit) in METRIC_LABELS.items():
+            sketch = sketches[field]
+            high = max(sketch.quantile(1.0), thresholds[field])
+            step = high / HISTOGRAM_BINS or 1.0
+            edges = [i * step for i in range(HISTOGRAM_BINS)]
+            counts = sketch.histogram(edges)
+            peak = max(counts)
+            print(f"\n{name} ({unit}):")
+            for edge, count in zip(edges, counts):
+                bar = '#' * round(count / peak * HISTOGRAM_WIDTH) if peak else ''
+                print(f"{edge:>8.1f} - {edge + step:<8.1f} {bar} {count}")
+
+    def replay_thresholds(self, start, end, candidates=(), host=None):
+        """How often the current thresholds, and each candidate set, would have fired from start to end.
+
+        A candidate is 'key=value,...' (keys as in rules.py) applied on top
+        of the current thresholds.
+        """
+        try:
+            import replay
+        except ImportError:
+            print("--replay needs NumPy: pip install numpy")
+            return
+        try:
+            start_ms = date_to_ms(start)
+            end_ms = date_to_ms(end) + (DAY_MS if len(end) == 10 else 1)
+        except ValueError:
+            print("Invalid date format. Please use YYYY-MM-DD or 'YYYY-MM-DD HH:MM:SS' format.")
+            return
+
+        current = dict(DEFAULT_THRESHOLDS)
+        current.update(self.db.get_thresholds())
+        sets = [('Current thresholds', current)]
+        for candidate in candidates:
+            thresholds = dict(current)
+            try:
+                for item in candidate.split(','):
+                    key, value = item.split('=')
+                    thresholds[key.strip()] = float(value)
+            except ValueError:
+                print(f"Invalid candidate '{candidate}'. Use KEY=VALUE[,KEY=VALUE...], e.g. cpu_usage=85")
+                return
+            sets.append((f"Candidate {candidate}", thresholds))
+
+        host = host or DEFAULT_HOST
+        started = time.perf_counter()
+        result = replay.replay(self.db, start_ms, end_ms, [thresholds for _, thresholds in sets], host)
+        if not result.samples:
+            print("No data found for the specified period.")
+            return
+        print(f"\nReplayed {result.samples} samples of {host} ({ms_to_timestamp(result.first_ms)} to "
+              f"{ms_to_timestamp(result.last_ms)}) in {time.perf_counter() - started:.1f}s")
+
+        def when(t):
+            return ms_to_timestamp(int(t * 1000)) if t is not None else '-'
+
+        headers = ['Rule', 'Trigger', 'Clear', 'Duration', 'Breaches', 'Fires', 'First fire', 'Last fire']
+        for (name, _), rules in zip(sets, result.results):
+            print(f"\n{name}:")
+            print_table([[rule.name, f"{rule.trigger:g}", f"{rule.clear:g}", f"{rule.duration:g}s",
+                          rule.episodes, rule.fires, when(rule.first), when(rule.last)]
+                         for rule in rules], headers)
+
+    def watch(self, interval=1.0, host=None):
+        """Redraw the latest metrics in place every interval seconds until Ctrl-C."""
+        from watch import LiveView
+        view = LiveView(self.db, host)
+        redraw = True
+        try:
+            while True:
+                if redraw:
+                    # Home the cursor and clear the screen, then draw
+                    sys.stdout.write('\x1b[H\x1b[J' + view.render())
+                    sys.stdout.flush()
+                time.sleep(interval)
+                redraw = view.refresh()
+        except KeyboardInterrupt:
+            print()
+
+    def view_selfstats(self, port=DEFAULT_STATS_PORT):
+        """Show the running receiver's internal counters and latency histograms."""
+        import urllib.request
+        import selfstats
+        url = f'http://127.0.0.1:{port}/metrics'
+        try:
+            with urllib.request.urlopen(url, timeout=2) as response:
+                text = response.read().decode()
+        except OSError as e:
+            print(f"Internal metrics not available at {url}: {e}")
+            return
+        rows = selfstats.summarize(selfstats.parse_text(text))
+        print(f"\nMonitoring pipeline ({url}):")
+        print_table(rows, ['Metric', 'Value'])
+
+    def list_hosts(self):
+        hosts = self.db.get_hosts()
+        if not hosts:
+            print("No hosts have reported metrics.")
+            return
+        print("\nReporting hosts:")
+        for host in hosts:
+            print(host)
+
+    def configure_thresholds(self):
+        # The receiver's defaults, overridden by stored thresholds
+        current_thresholds = dict(DEFAULT_THRESHOLDS)
+        current_thresholds.update(self.db.get_thresholds())
 
         print("\nCurrent Thresholds:")
         for name, value in current_thresholds.items():
@@ -243,27 +453,94 @@ class MonitoringCLI:
                     print("Please enter a valid number")
         
         print("\nThresholds updated successfully.")
+        self.notify_receiver()
+
+    def notify_receiver(self):
+        """Tell a running receiver to pick up threshold changes now rather than within a second."""
+        import signal
+        try:
+            with open(self.pid_file, 'r') as f:
+                pid = json.load(f).get('python_pid')
+            if pid:
+                os.kill(pid, signal.SIGHUP)
+        except (OSError, ValueError):
+            pass
 
 def main():
     parser = argparse.ArgumentParser(description='System Monitoring and Automation Tool')
     parser.add_argument('--start', action='store_true', help='Start monitoring')
+    parser.add_argument('--sample-hz', type=float, metavar='HZ',
+                        help='With --start, sample /proc in-process at HZ (0.1-100) instead of '
+                             'running the C++ monitor')
+    parser.add_argument('--query-server', action='store_true',
+                        help='With --start, also run the query server that read-only commands use')
     parser.add_argument('--stop', action='store_true', help='Stop monitoring')
     parser.add_argument('--view', action='store_true', help='View current system metrics')
+    parser.add_argument('--watch', nargs='?', type=float, const=1.0, metavar='SECONDS',
+                        help='Show live metrics, refreshing every SECONDS (default: 1)')
+    parser.add_argument('--recent', nargs='?', type=float, const=15.0, metavar='MINUTES',
+                        help='View metrics from the last MINUTES minutes (default: 15)')
     parser.add_argument('--query', nargs=2, metavar=('START_DATE', 'END_DATE'), 
                         help='Query historical data (format: YYYY-MM-DD)')
+    parser.add_argument('--resolution', choices=['auto', 'raw', '1m', '1h', '1d'], default='auto',
+                        help='Resolution for --query (default: finest that fits the range) '
+                             'and --export (default: raw)')
+    parser.add_argument('--export', nargs=2, metavar=('START', 'END'),
+                        help='Stream samples from START to END (YYYY-MM-DD, end inclusive, or full '
+                             'timestamps) as CSV or NDJSON')
+    parser.add_argument('--format', choices=EXPORT_FORMATS, default='csv',
+                        help='Output format for --export (default: csv)')
+    parser.add_argument('--output', default='-', metavar='FILE',
+                        help='File to write --export to (default: stdout)')
+    parser.add_argument('--stats', nargs=2, metavar=('START', 'END'),
+                        help='Percentiles, histogram and time above threshold from START to END '
+                             '(YYYY-MM-DD, end inclusive, or full timestamps)')
+    parser.add_argument('--replay', nargs=2, metavar=('START', 'END'),
+                        help='Replay stored samples from START to END (YYYY-MM-DD, end inclusive, or full '
+                             'timestamps) through the current thresholds and any --candidate sets')
+    parser.add_argument('--candidate', action='append', default=[], metavar='KEY=VALUE[,...]',
+                        help='With --replay, also evaluate the current thresholds with these changes '
+                             '(repeatable), e.g. cpu_usage=85,cpu_usage_duration=30')
+    parser.add_argument('--processes', nargs='?', const='', metavar='TIMESTAMP',
+                        help='Top processes recorded at TIMESTAMP (default: latest)')
+    parser.add_argument('--host', metavar='NAME',
+                        help='Limit --view, --watch, --recent, --query, --export and --stats to one host '
+                             '(default: all); --processes and --replay default to localhost')
+    parser.add_argument('--hosts', action='store_true', help='List hosts that have reported metrics')
+    parser.add_argument('--selfstats', nargs='?', type=int, const=DEFAULT_STATS_PORT,
+                        metavar='PORT', help='Show the receiver\'s internal metrics '
+                                             f'(default port: {DEFAULT_STATS_PORT})')
     parser.add_argument('--config', action='store_true', help='Configure thresholds')
 
     args = parser.parse_args()
-    cli = MonitoringCLI()
+    readonly = any(getattr(args, command) not in (None, False) for command in READ_ONLY_COMMANDS)
+    cli = MonitoringCLI(readonly=readonly)
 
     if args.start:
-        cli.start_monitoring()
+        cli.start_monitoring(args.sample_hz, args.query_server)
     elif args.stop:
         cli.stop_monitoring()
     elif args.view:
-        cli.view_current_metrics()
+        cli.view_current_metrics(args.host)
+    elif args.watch is not None:
+        cli.watch(args.watch, args.host)
+    elif args.recent is not None:
+        cli.view_recent_metrics(args.recent, args.host)
     elif args.query:
-        cli.query_historical_data(args.query[0], args.query[1])
+        cli.query_historical_data(args.query[0], args.query[1], args.resolution, args.host)
+    elif args.export:
+        cli.export_data(args.export[0], args.export[1], args.format, args.output,
+                        args.resolution, args.host)
+    elif args.stats:
+        cli.view_stats(args.stats[0], args.stats[1], args.host)
+    elif args.replay:
+        cli.replay_thresholds(args.replay[0], args.replay[1], args.candidate, args.host)
+    elif args.processes is not None:
+        cli.view_processes(args.processes, args.host)
+    elif args.hosts:
+        cli.list_hosts()
+    elif args.selfstats is not None:
+        cli.view_selfstats(args.selfstats)
     elif args.config:
         cli.configure_thresholds()
     else:
@@ -0,0 +1,278 @@
+# SysMoniTool/src/python/coldstore.py
+"""Compressed column blocks holding the raw samples of closed partitions.
+
+Database.archive_partitions() moves a daily partition that no longer
+receives samples out of SQLite into DIRECTORY/<partition>.blk. A file is a
+sequence of blocks of up to BLOCK_ROWS samples in (ts_epoch_ms, id) order.
+Each block starts with a fixed header: row count, first and last
+ts_epoch_ms, min and max of every metric, and the sizes of the host list and
+of each column section. Then come the hosts in the block, then one zlib
+section per column: ts_epoch_ms, id, host (an index into the host list) and
+the four metrics.
+
+Integer columns store the delta of deltas, which is all zeros for a steady
+sampling interval. Metric columns store each double XORed with the
+previous one (as in Gorilla), so repeated and nearby values leave the sign,
+exponent and high mantissa bytes zero. Every column is byte-shuffled before
+compression (byte k of every value stored together) so those zero bytes
+form long runs for zlib.
+
+Files are read through mmap. Only the headers are parsed to find the blocks
+overlapping a time range and holding a host.
+"""
+import mmap
+import operator
+import os
+import struct
+import sys
+import zlib
+from array import array
+from itertools import accumulate
+from rollups import METRIC_FIELDS
+
+MAGIC = b'SMB1'
+SUFFIX = '.blk'
+BLOCK_ROWS = 8192
+COMPRESS_LEVEL = 6
+# magic, rows, first_ms, last_ms, (min, max) per metric, host list size,
+# then the size of each column section
+SECTIONS = ('ts_epoch_ms', 'id', 'host') + METRIC_FIELDS
+HEADER = struct.Struct(f'<4sIqq{2 * len(METRIC_FIELDS)}dI{len(SECTIONS)}I')
+# Columns iter_range() can return, as in the partition tables
+COLUMNS = ('id', 'timestamp', 'ts_epoch_ms', 'host') + METRIC_FIELDS
+
+
+def shuffle(data, width):
+    return b''.join(data[i::width] for i in range(width))
+
+
+def unshuffle(data, width):
+    count = len(data) // width
+    out = bytearray(len(data))
+    for i in range(width):
+        out[i::width] = data[i * count:(i + 1) * count]
+    return out
+
+
+def pack(values):
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return zlib.compress(shuffle(values.tobytes(), values.itemsize), COMPRESS_LEVEL)
+
+
+def unpack(typecode, data):
+    values = array(typecode)
+    values.frombytes(unshuffle(zlib.decompress(data), values.itemsize))
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+def encode_ints(values):
+    deltas = [b - a for a, b in zip(values, values[1:])]
+    return pack(array('q', values[:1] + deltas[:1] + [b - a for a, b in zip(deltas, deltas[1:])]))
+
+
+def decode_ints(data):
+    values = unpack('q', data)
+    if len(values) < 2:
+        return list(values)
+    return list(accumulate(accumulate(values[1:]), initial=values[0]))
+
+
+def encode_floats(values):
+    bits = array('Q')
+    bits.frombytes(array('d', values).tobytes())
+    return pack(array('Q', bits[:1]) + array('Q', map(operator.xor, bits[1:], bits[:-1])))
+
+
+def decode_floats(data):
+    bits = array('Q', accumulate(unpack('Q', data), operator.xor))
+    values = array('d')
+    values.frombytes(bits.tobytes())
+    return values.tolist()
+
+
+def encode_block(rows):
+    """Encode (id, ts_epoch_ms, host, cpu, memory, disk, network) rows sorted by time."""
+    ids, times, hosts = [], [], []
+    host_index = {}
+    for row in rows:
+        ids.append(row[0])
+        times.append(row[1])
+        hosts.append(host_index.setdefault(row[2], len(host_index)))
+    metrics = [[row[3 + i] for row in rows] for i in range(len(METRIC_FIELDS))]
+    bounds = []
+    for values in metrics:
+        bounds += [min(values), max(values)]
+    host_list = '\n'.join(host_index).encode()
+    sections = [encode_ints(times), encode_ints(ids), pack(array('H', hosts))]
+    sections += [encode_floats(values) for values in metrics]
+    header = HEADER.pack(MAGIC, len(rows), times[0], times[-1], *bounds, len(host_list),
+                         *(len(section) for section in sections))
+    return b''.join([header, host_list] + sections)
+
+
+class Block:
+    __slots__ = ('count', 'first_ms', 'last_ms', 'mins', 'maxs', 'hosts', 'sections')
+
+    def __init__(self, data, offset):
+        fields = HEADER.unpack_from(data, offset)
+        if fields[0] != MAGIC:
+            raise ValueError(f"Bad block header at offset {offset}")
+        self.count, self.first_ms, self.last_ms = fields[1:4]
+        bounds = fields[4:4 + 2 * len(METRIC_FIELDS)]
+        self.mins, self.maxs = bounds[0::2], bounds[1::2]
+        hosts_size = fields[4 + 2 * len(METRIC_FIELDS)]
+        offset += HEADER.size
+        self.hosts = bytes(data[offset:offset + hosts_size]).decode().split('\n')
+        offset += hosts_size
+        # (start, end) of each column section in the file
+        self.sections = {}
+        for name, size in zip(SECTIONS, fields[5 + 2 * len(METRIC_FIELDS):]):
+            self.sections[name] = (offset, offset + size)
+            offset += size
+
+    @property
+    def end(self):
+        return self.sections[SECTIONS[-1]][1]
+
+
+class ColdFile:
+    """A mapped .blk file and its parsed block headers."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            self.key = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b''
+        self.blocks = []
+        offset = 0
+        while offset < len(self.mm):
+            block = Block(self.mm, offset)
+            self.blocks.append(block)
+            offset = block.end
+
+    def column(self, block, name):
+        start, end = block.sections[name]
+        data = self.mm[start:end]
+        if name == 'host':
+            return [block.hosts[i] for i in unpack('H', data)]
+        if name in ('ts_epoch_ms', 'id'):
+            return decode_ints(data)
+        return decode_floats(data)
+
+    def close(self):
+        if self.mm:
+            self.mm.close()
+
+
+def block_rows(cold, block, start_ms, end_ms, host, newest_first, columns):
+    """Rows of the requested columns from one block, filtered to the range and host."""
+    from database import ms_to_timestamp
+    times = cold.column(block, 'ts_epoch_ms')
+    keep = [i for i, ts in enumerate(times) if start_ms <= ts < end_ms]
+    if host is not None and len(block.hosts) > 1:
+        hosts = cold.column(block, 'host')
+        keep = [i for i in keep if hosts[i] == host]
+    if newest_first:
+        keep.reverse()
+    values = []
+    for column in columns:
+        if column == 'timestamp':
+            values.append([ms_to_timestamp(times[i]) for i in keep])
+        elif column == 'host' and len(block.hosts) == 1:
+            values.append(block.hosts * len(keep))
+        else:
+            data = times if column == 'ts_epoch_ms' else cold.column(block, column)
+            values.append([data[i] for i in keep])
+    return zip(*values)
+
+
+class ColdStore:
+    """The .blk files in directory, one per archived partition."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.files = {}
+
+    def path(self, name):
+        return os.path.join(self.directory, name + SUFFIX)
+
+    def names(self):
+        """Archived partition names, oldest first."""
+        try:
+            entries = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(entry[:-len(SUFFIX)] for entry in entries if entry.endswith(SUFFIX))
+
+    def write(self, name, rows):
+        """Store a partition's (id, ts_epoch_ms, host, cpu, memory, disk, network) rows.
+
+        Rows must be in (ts_epoch_ms, id) order. The file is written under a
+        temporary name, synced and renamed into place. Returns its size.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path(name)
+        temporary = path + '.tmp'
+        with open(temporary, 'wb') as f:
+            for i in range(0, len(rows), BLOCK_ROWS):
+                f.write(encode_block(rows[i:i + BLOCK_ROWS]))
+            f.flush()
+            os.fsync(f.fileno())
+            size = f.tell()
+        os.replace(temporary, path)
+        return size
+
+    def remove(self, name):
+        cached = self.files.pop(name, None)
+        if cached is not None:
+            cached.close()
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+
+    def open(self, name):
+        """The mapped file for name, re-opened if it was replaced since it was last mapped."""
+        path = self.path(name)
+        cached = self.files.get(name)
+        if cached is not None:
+            stat = os.stat(path)
+            if cached.key == (stat.st_ino, stat.st_mtime_ns, stat.st_size):
+                return cached
+            cached.close()
+        self.files[name] = ColdFile(path)
+        return self.files[name]
+
+    def range(self, name):
+        """[start_ms, end_ms) spanned by name's samples, from its block headers.
+
+        Not derived from the name: the partition migrated from a pre-v3
+        database (metrics_legacy) is not a single day.
+        """
+        blocks = self.open(name).blocks
+        if not blocks:
+            return 0, 0
+        return blocks[0].first_ms, blocks[-1].last_ms + 1
+
+    def blocks(self, name, start_ms, end_ms, host=None):
+        """(file, block) for the blocks of name with samples in [start_ms, end_ms) from host, oldest first."""
+        cold = self.open(name)
+        return [(cold, block) for block in cold.blocks
+                if block.first_ms < end_ms and block.last_ms >= start_ms
+                and (host is None or host in block.hosts)]
+
+    def iter_range(self, name, start_ms, end_ms, host=None, newest_first=True, columns=COLUMNS):
+        """Yield rows of the requested columns with start_ms <= ts_epoch_ms < end_ms, like Database.iter_range."""
+        blocks = self.blocks(name, start_ms, end_ms, host)
+        if newest_first:
+            blocks.reverse()
+        for cold, block in blocks:
+            yield from block_rows(cold, block, start_ms, end_ms, host, newest_first, columns)
+
+    def close(self):
+        for cold in self.files.values():
+            cold.close()
+        self.files = {}
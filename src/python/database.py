@@ -1,27 +1,196 @@
 # SysMoniTool/src/python/database.py
+import math
+import os
 import sqlite3
 import logging
-from datetime import datetime
+import time
+import rollups
+import sketches
+from coldstore import ColdStore
+from selfstats import REGISTRY, AGE_BUCKETS
+
+SYNCHRONOUS_MODES = ('OFF', 'NORMAL', 'FULL', 'EXTRA')
+SCHEMA_VERSION = 5
+
+DAY_MS = 24 * 60 * 60 * 1000
+# Raw samples live in one table per UTC day (metrics_pYYYYMMDD)
+PARTITION_MS = DAY_MS
+# SQLite caps compound SELECTs at 500 terms; the 'metrics' view covers at
+# most that many of the newest partitions
+MAX_VIEW_PARTITIONS = 500
+
+# Partitions older than this are moved to compressed column blocks (see
+# coldstore.py); they still count as raw data for retention
+COLD_AFTER_MS = 7 * DAY_MS
+
+# How long data is kept per resolution, in milliseconds (None keeps forever).
+# Raw samples, including history migrated from older versions, are only
+# expired when a retention is passed explicitly.
+DEFAULT_RETENTION = {
+    'raw': None,
+    '1m': 90 * DAY_MS,
+    '1h': 730 * DAY_MS,
+    '1d': None,
+}
+
+METRIC_COLUMNS = 'id, timestamp, cpu_usage, memory_usage, disk_io, network_usage, host'
+# Host recorded for samples that do not name one (the local collector)
+DEFAULT_HOST = 'localhost'
+# Rows fetched per round trip by the iter_* query methods
+CHUNK_SIZE = 1000
+
+COMMIT_SECONDS = REGISTRY.histogram('sysmon_commit_seconds', 'Time to write and commit a batch of samples')
+SAMPLE_AGE = REGISTRY.histogram('sysmon_sample_age_at_commit_seconds',
+                                'Time from a sample being taken to it being committed', AGE_BUCKETS)
+SAMPLES_DROPPED = REGISTRY.counter('sysmon_samples_dropped_total', 'Samples discarded as invalid')
+
+# Epoch of the start of each local 'YYYY-MM-DD HH' seen recently. Samples
+# arrive in time order, so this turns timestamp parsing into a dict lookup
+# and two int() calls instead of a strptime per row.
+_hour_cache = {}
+
+def timestamp_to_ms(timestamp):
+    """Convert a local 'YYYY-MM-DD HH:MM:SS' timestamp to epoch milliseconds.
+
+    Raises ValueError for anything that is not a valid timestamp.
+    """
+    if len(timestamp) != 19 or timestamp[13] != ':' or timestamp[16] != ':':
+        raise ValueError(f"Invalid timestamp: {timestamp!r}")
+    minute = timestamp[14:16]
+    second = timestamp[17:19]
+    if not (minute.isdigit() and second.isdigit()) or minute > '59' or second > '59':
+        raise ValueError(f"Invalid timestamp: {timestamp!r}")
+
+    hour = timestamp[:13]
+    base = _hour_cache.get(hour)
+    if base is None:
+        base = int(time.mktime(time.strptime(hour, '%Y-%m-%d %H'))) * 1000
+        if len(_hour_cache) >= 4096:
+            _hour_cache.clear()
+        _hour_cache[hour] = base
+    return base + (int(minute) * 60 + int(second)) * 1000
+
+# (epoch minute, formatted 'YYYY-MM-DD HH:MM:') of the last ms_to_timestamp()
+# call; consecutive samples share the minute, and UTC offsets are whole
+# minutes, so only the seconds need formatting
+_last_formatted = (None, None)
+
+def ms_to_timestamp(ms):
+    """Format epoch milliseconds as a local 'YYYY-MM-DD HH:MM:SS' timestamp."""
+    global _last_formatted
+    minute, second = divmod(ms // 1000, 60)
+    cached_minute, prefix = _last_formatted
+    if minute != cached_minute:
+        prefix = time.strftime('%Y-%m-%d %H:%M:', time.localtime(minute * 60))
+        _last_formatted = (minute, prefix)
+    return f'{prefix}{second:02d}'
+
+def iter_cursor(cursor, chunk_size):
+    """Yield a cursor's rows, fetching chunk_size at a time."""
+    while True:
+        rows = cursor.fetchmany(chunk_size)
+        if not rows:
+            return
+        yield from rows
+
+def date_to_ms(value):
+    """Convert a 'YYYY-MM-DD' date or full timestamp to epoch milliseconds."""
+    if len(value) == 10:
+        value += ' 00:00:00'
+    return timestamp_to_ms(value)
 
 class Database:
-    def __init__(self, db_file):
+    """SQLite storage for metrics and thresholds.
+
+    Samples can be written immediately with insert_data()/insert_many(), or
+    handed to buffer_data(), which keeps them in a write-behind buffer and
+    commits them as one transaction once batch_size rows are pending or the
+    oldest pending row is flush_interval seconds old. The buffered path bounds
+    data loss on a crash to that window.
+
+    Raw samples are stored in daily partition tables listed in
+    metrics_partitions; a 'metrics' view unions them for ad-hoc reads. Expiring
+    raw data drops whole partitions, see apply_retention().
+
+    Partitions older than cold_after are archived to column block files in
+    cold_dir (default: the database path with a .cold suffix) and read back
+    transparently by iter_range() and the queries built on it; the 'metrics'
+    view only covers the partitions still in SQLite.
+    """
+
+    def __init__(self, db_file, journal_mode='WAL', synchronous='NORMAL',
+                 batch_size=500, flush_interval=1.0, retention=None, readonly=False,
+                 cold_dir=None, cold_after=COLD_AFTER_MS):
+        if cold_dir is None and db_file != ':memory:':
+            cold_dir = os.path.splitext(db_file)[0] + '.cold'
+        self.cold = ColdStore(cold_dir) if cold_dir else None
+        self.cold_after = cold_after
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.retention = dict(DEFAULT_RETENTION)
+        if retention:
+            self.retention.update(retention)
+        self.pending = []
+        self.pending_since = None
+        self.pending_processes = []
+        self.partitions = set()
+        # Archived partitions brought back by the current write; they stay in
+        # SQLite until the next day starts rather than being archived again
+        self.thawed = set()
+        self.readonly = readonly
+        if readonly:
+            self.open_readonly(db_file)
+            return
         try:
             self.conn = sqlite3.connect(db_file)
+            self.configure(journal_mode, synchronous)
             self.create_tables()
         except Exception as e:
             logging.error(f"Database initialization error: {e}")
             raise
 
+    def open_readonly(self, db_file):
+        """Open an existing database for queries only: no PRAGMA changes, DDL or commits.
+
+        Raises sqlite3.Error if the file is missing or needs migrating, in
+        which case it has to be opened normally first.
+        """
+        path = db_file.replace('%', '%25').replace('?', '%3f').replace('#', '%23')
+        self.conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+        try:
+            version = self.conn.execute('PRAGMA user_version').fetchone()[0]
+            if version != SCHEMA_VERSION:
+                raise sqlite3.OperationalError(f"Schema version {version} needs migrating")
+            self.partitions = {row[0] for row in self.conn.execute('SELECT name FROM metrics_partitions')}
+        except sqlite3.Error:
+            self.conn.close()
+            self.conn = None
+            raise
+
+    def configure(self, journal_mode, synchronous):
+        # PRAGMA values cannot be bound as parameters, so validate them here
+        synchronous = synchronous.upper()
+        if synchronous not in SYNCHRONOUS_MODES:
+            raise ValueError(f"Invalid synchronous mode: {synchronous}")
+        if not journal_mode.isalpha():
+            raise ValueError(f"Invalid journal mode: {journal_mode}")
+
+        cursor = self.conn.cursor()
+        # Only takes effect on a new database; lets dropped partitions be
+        # handed back to the filesystem with PRAGMA incremental_vacuum
+        cursor.execute('PRAGMA auto_vacuum=INCREMENTAL')
+        cursor.execute(f'PRAGMA journal_mode={journal_mode}')
+        cursor.execute(f'PRAGMA synchronous={synchronous}')
+        # Used by the rollup upsert to merge per-bucket quantile sketches
+        self.conn.create_function('sketch_merge', 2, sketches.merge_blobs, deterministic=True)
+
     def create_tables(self):
         cursor = self.conn.cursor()
         cursor.execute('''
-            CREATE TABLE IF NOT EXISTS metrics (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
-                cpu_usage REAL,
-                memory_usage REAL,
-                disk_io REAL,
-                network_usage REAL
+            CREATE TABLE IF NOT EXISTS metrics_partitions (
+                name TEXT PRIMARY KEY,
+                start_ms INTEGER,
+                end_ms INTEGER
             )
         ''')
         
@@ -33,63 +202,735 @@ class Database:
                 updated_at DATETIME DEFAULT CURRENT_TIMESTAMP
             )
         ''')
+        for resolution in rollups.RESOLUTIONS:
+            cursor.execute(rollups.create_table_sql(resolution))
+        # Top processes per tick, linked to the metrics row taken at the same
+        # (host, ts_epoch_ms)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS process_samples (
+                host TEXT NOT NULL,
+                ts_epoch_ms INTEGER NOT NULL,
+                pid INTEGER,
+                name TEXT,
+                cpu_percent REAL,
+                rss_bytes INTEGER,
+                io_bytes_per_s REAL
+            )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_process_samples_host_ts '
+                       'ON process_samples (host, ts_epoch_ms)')
+        # For the cross-host retention delete, see apply_retention()
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_process_samples_ts '
+                       'ON process_samples (ts_epoch_ms)')
+        # Bumped with every threshold change so running receivers can notice
+        # without re-reading the thresholds
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS config_version (
+                name TEXT PRIMARY KEY,
+                version INTEGER NOT NULL
+            )
+        ''')
+        cursor.execute("INSERT OR IGNORE INTO config_version (name, version) VALUES ('thresholds', 0)")
+        # Checkpointed anomaly detector baselines (see rules.RuleEngine.state)
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS detector_state (
+                host TEXT NOT NULL,
+                name TEXT NOT NULL,
+                state BLOB,
+                updated_ms INTEGER,
+                PRIMARY KEY (host, name)
+            )
+        ''')
+        # Last sequence number of each spill journal whose samples are
+        # committed, written in the same transaction as the samples
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS journal_applied (
+                name TEXT PRIMARY KEY,
+                seq INTEGER NOT NULL
+            )
+        ''')
         self.conn.commit()
+        self.migrate()
+        for resolution in rollups.RESOLUTIONS:
+            cursor.execute(rollups.create_index_sql(resolution))
+        self.load_partitions()
+        if not self.has_legacy_table(cursor) and \
+                cursor.execute("SELECT 1 FROM sqlite_master WHERE name = 'metrics'").fetchone() is None:
+            self.refresh_view(cursor)
+
+    def load_partitions(self):
+        cursor = self.conn.cursor()
+        self.partitions = {row[0] for row in cursor.execute('SELECT name FROM metrics_partitions')}
+
+    def has_legacy_table(self, cursor):
+        # Before schema v3 all raw samples lived in a single 'metrics' table
+        row = cursor.execute("SELECT type FROM sqlite_master WHERE name = 'metrics'").fetchone()
+        return row is not None and row[0] == 'table'
+
+    def migrate(self):
+        """Upgrade databases created by older versions, tracked by PRAGMA user_version."""
+        cursor = self.conn.cursor()
+        version = cursor.execute('PRAGMA user_version').fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+
+        try:
+            if self.has_legacy_table(cursor):
+                if version < 1:
+                    self.migrate_epoch_column(cursor)
+                if version < 2:
+                    self.backfill_rollups(cursor)
+                if version < 3:
+                    self.migrate_partitions(cursor)
+            if version < 4:
+                self.migrate_hosts(cursor)
+            if version < 5:
+                # Rollups backfilled from legacy raw data above already have sketches
+                self.migrate_sketches(cursor, backfill=version >= 2)
+            self.refresh_view(cursor)
+            cursor.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+            self.conn.commit()
+        except Exception as e:
+            self.conn.rollback()
+            logging.error(f"Database migration failed: {e}")
+            raise
+
+    def migrate_epoch_column(self, cursor):
+        # v1: integer epoch-ms time column plus index, so range and latest-row
+        # queries are index seeks instead of scanning and sorting text
+        columns = [row[1] for row in cursor.execute('PRAGMA table_info(metrics)')]
+        if 'ts_epoch_ms' not in columns:
+            cursor.execute('ALTER TABLE metrics ADD COLUMN ts_epoch_ms INTEGER')
+        # Stored timestamps are local time; the 'utc' modifier converts them
+        cursor.execute('''
+            UPDATE metrics
+            SET ts_epoch_ms = CAST(strftime('%s', timestamp, 'utc') AS INTEGER) * 1000
+            WHERE ts_epoch_ms IS NULL
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_metrics_ts_epoch ON metrics (ts_epoch_ms)')
+
+    def backfill_rollups(self, cursor, chunk_size=50000):
+        # v2: rollups are maintained at insert time from now on; fold in the
+        # raw history that predates them once
+        reader = self.conn.cursor()
+        reader.execute('''
+            SELECT ts_epoch_ms, cpu_usage, memory_usage, disk_io, network_usage
+            FROM metrics ORDER BY ts_epoch_ms
+        ''')
+        while True:
+            samples = reader.fetchmany(chunk_size)
+            if not samples:
+                break
+            self.update_rollups(cursor, DEFAULT_HOST, samples)
+
+    def migrate_partitions(self, cursor):
+        # v3: keep the old single table as one read-only partition covering
+        # its whole time range; new samples go to daily partitions
+        count, first, last = cursor.execute(
+            'SELECT COUNT(*), MIN(ts_epoch_ms), MAX(ts_epoch_ms) FROM metrics').fetchone()
+        if not count:
+            cursor.execute('DROP TABLE metrics')
+        else:
+            cursor.execute('ALTER TABLE metrics RENAME TO metrics_legacy')
+            cursor.execute('INSERT OR REPLACE INTO metrics_partitions (name, start_ms, end_ms) VALUES (?, ?, ?)',
+                           ('metrics_legacy', first, last + 1))
+
+    def migrate_hosts(self, cursor):
+        # v4: host dimension. Existing samples came from the local collector.
+        for (name,) in cursor.execute('SELECT name FROM metrics_partitions').fetchall():
+            columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({name})')]
+            if 'host' not in columns:
+                cursor.execute(f"ALTER TABLE {name} ADD COLUMN host TEXT NOT NULL DEFAULT '{DEFAULT_HOST}'")
+            cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{name}_host_ts ON {name} (host, ts_epoch_ms)')
+
+        # Rollups need (host, bucket_ms) as their key, so rebuild them
+        for resolution in rollups.RESOLUTIONS:
+            table = rollups.table_name(resolution)
+            columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({table})')]
+            if 'host' in columns:
+                continue
+            cursor.execute(rollups.create_table_sql(resolution, name=f'{table}_v4'))
+            names = ', '.join(columns)
+            cursor.execute(f"INSERT INTO {table}_v4 (host, {names}) SELECT '{DEFAULT_HOST}', {names} FROM {table}")
+            cursor.execute(f'DROP TABLE {table}')
+            cursor.execute(f'ALTER TABLE {table}_v4 RENAME TO {table}')
+
+    def migrate_sketches(self, cursor, backfill=True, chunk_size=50000):
+        # v5: a quantile sketch per metric and the first sample time in every
+        # rollup bucket. Buckets still covered by raw partitions get them
+        # rebuilt from the raw samples; older buckets keep NULL sketches,
+        # which stats() skips, and count from the bucket start.
+        for resolution in rollups.RESOLUTIONS:
+            table = rollups.table_name(resolution)
+            columns = [row[1] for row in cursor.execute(f'PRAGMA table_info({table})')]
+            if 'first_ms' not in columns:
+                cursor.execute(f'ALTER TABLE {table} ADD COLUMN first_ms INTEGER')
+            for field in rollups.METRIC_FIELDS:
+                if f'{field}_sketch' not in columns:
+                    cursor.execute(f'ALTER TABLE {table} ADD COLUMN {field}_sketch BLOB')
+
+        sets = 'first_ms = coalesce(min(first_ms, ?), ?), ' + ', '.join(
+            f'{field}_sketch = sketch_merge({field}_sketch, ?)' for field in rollups.METRIC_FIELDS)
+        reader = self.conn.cursor()
+        names = [row[0] for row in cursor.execute('SELECT name FROM metrics_partitions')] if backfill else []
+        for name in names:
+            reader.execute(f'SELECT host, ts_epoch_ms, cpu_usage, memory_usage, disk_io, network_usage '
+                           f'FROM {name} ORDER BY host, ts_epoch_ms')
+            while True:
+                rows = reader.fetchmany(chunk_size)
+                if not rows:
+                    break
+                by_host = {}
+                for row in rows:
+                    by_host.setdefault(row[0], []).append(row[1:])
+                for host, samples in by_host.items():
+                    for resolution, buckets in rollups.aggregate_all(samples).items():
+                        cursor.executemany(
+                            f'UPDATE {rollups.table_name(resolution)} SET {sets} WHERE host = ? AND bucket_ms = ?',
+                            [(agg[rollups.FIRST_MS], agg[rollups.FIRST_MS],
+                              *rollups.upsert_row(host, bucket, agg)[-len(rollups.METRIC_FIELDS):], host, bucket)
+                             for bucket, agg in buckets.items()]
+                        )
+        for resolution in rollups.RESOLUTIONS:
+            cursor.execute(f'UPDATE {rollups.table_name(resolution)} SET first_ms = bucket_ms WHERE first_ms IS NULL')
+
+    def refresh_view(self, cursor):
+        """Recreate the read-only 'metrics' view over the newest partitions."""
+        names = [row[0] for row in cursor.execute(
+            'SELECT name FROM metrics_partitions ORDER BY start_ms DESC LIMIT ?', (MAX_VIEW_PARTITIONS,))]
+        if names:
+            body = ' UNION ALL '.join(f'SELECT {METRIC_COLUMNS}, ts_epoch_ms FROM {name}' for name in names)
+        else:
+            body = ('SELECT NULL AS id, NULL AS timestamp, NULL AS cpu_usage, NULL AS memory_usage, '
+                    'NULL AS disk_io, NULL AS network_usage, NULL AS host, NULL AS ts_epoch_ms WHERE 0')
+        cursor.execute('DROP VIEW IF EXISTS metrics')
+        cursor.execute(f'CREATE VIEW metrics AS {body}')
+
+    def ensure_partition(self, cursor, index):
+        """Return the name of partition number index (ts_ms // PARTITION_MS), creating it if needed."""
+        start_ms = index * PARTITION_MS
+        name = 'metrics_p' + time.strftime('%Y%m%d', time.gmtime(start_ms // 1000))
+        if name in self.partitions:
+            return name
+
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {name} (
+                id INTEGER PRIMARY KEY,
+                timestamp DATETIME,
+                cpu_usage REAL,
+                memory_usage REAL,
+                disk_io REAL,
+                network_usage REAL,
+                ts_epoch_ms INTEGER,
+                host TEXT NOT NULL DEFAULT '{DEFAULT_HOST}'
+            )
+        ''')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{name}_ts_epoch ON {name} (ts_epoch_ms)')
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS idx_{name}_host_ts ON {name} (host, ts_epoch_ms)')
+        cursor.execute('INSERT OR IGNORE INTO metrics_partitions (name, start_ms, end_ms) VALUES (?, ?, ?)',
+                       (name, start_ms, start_ms + PARTITION_MS))
+        if self.cold is not None and os.path.exists(self.cold.path(name)):
+            self.thaw_partition(cursor, name)
+            self.thawed.add(name)
+        self.refresh_view(cursor)
+        self.partitions.add(name)
+        return name
+
+    def partitions_between(self, start_ms, end_ms):
+        """Names of the partitions overlapping [start_ms, end_ms), newest first."""
+        cursor = self.conn.cursor()
+        cursor.execute('''
+            SELECT name FROM metrics_partitions
+            WHERE start_ms < ? AND end_ms > ?
+            ORDER BY start_ms DESC
+        ''', (end_ms, start_ms))
+        return [row[0] for row in cursor.fetchall()]
+
+    def archived_between(self, start_ms, end_ms):
+        """Names of the archived partitions overlapping [start_ms, end_ms), oldest first."""
+        if self.cold is None:
+            return []
+        names = []
+        for name in self.cold.names():
+            first_ms, last_ms = self.cold.range(name)
+            if first_ms < end_ms and last_ms > start_ms:
+                names.append(name)
+        return names
+
+    def apply_retention(self, now_ms=None):
+        """Expire data older than the retention configured per resolution.
+
+        Raw data is expired by dropping whole partitions. The rollup tables are
+        small and keyed by bucket, so expiring them is a bounded range delete
+        on the primary key.
+        """
+        if now_ms is None:
+            now_ms = int(time.time() * 1000)
+        cursor = self.conn.cursor()
+        try:
+            keep = self.retention.get('raw')
+            if keep is not None:
+                expired = [row[0] for row in cursor.execute(
+                    'SELECT name FROM metrics_partitions WHERE end_ms <= ?', (now_ms - keep,))]
+                for name in expired:
+                    cursor.execute(f'DROP TABLE IF EXISTS {name}')
+                    cursor.execute('DELETE FROM metrics_partitions WHERE name = ?', (name,))
+                    self.partitions.discard(name)
+                    logging.info(f"Dropped expired partition {name}")
+                if expired:
+                    self.refresh_view(cursor)
+                cursor.execute('DELETE FROM process_samples WHERE ts_epoch_ms < ?', (now_ms - keep,))
+                if self.cold is not None:
+                    for name in self.cold.names():
+                        if self.cold.range(name)[1] <= now_ms - keep:
+                            self.cold.remove(name)
+                            logging.info(f"Removed expired archived partition {name}")
+
+            for resolution in rollups.RESOLUTIONS:
+                keep = self.retention.get(resolution)
+                if keep is not None:
+                    cursor.execute(f'DELETE FROM {rollups.table_name(resolution)} WHERE bucket_ms < ?',
+                                   (now_ms - keep,))
+            self.conn.commit()
+            if self.cold is not None and self.cold_after is not None:
+                self.archive_partitions(now_ms - self.cold_after)
+            cursor.execute('PRAGMA incremental_vacuum').fetchall()
+        except Exception as e:
+            self.conn.rollback()
+            raise sqlite3.Error(str(e))
+
+    def archive_partitions(self, before_ms):
+        """Move partitions ending at or before before_ms to the cold store; returns how many.
+
+        Each file is synced before its table is dropped, so a crash in between
+        leaves the rows in both places and reads keep using the table.
+        Partitions the current write thawed are left for a later day, so a
+        trickle of late samples does not rewrite the same file every batch.
+        """
+        cursor = self.conn.cursor()
+        names = [row[0] for row in cursor.execute(
+            'SELECT name FROM metrics_partitions WHERE end_ms <= ? ORDER BY start_ms', (before_ms,))
+            if row[0] not in self.thawed]
+        for name in names:
+            rows = cursor.execute(f'''
+                SELECT id, ts_epoch_ms, host, {', '.join(rollups.METRIC_FIELDS)} FROM {name}
+                ORDER BY ts_epoch_ms, id
+            ''').fetchall()
+            size = self.cold.write(name, rows) if rows else 0
+            cursor.execute(f'DROP TABLE IF EXISTS {name}')
+            cursor.execute('DELETE FROM metrics_partitions WHERE name = ?', (name,))
+            self.refresh_view(cursor)
+            self.conn.commit()
+            self.partitions.discard(name)
+            logging.info(f"Archived partition {name}: {len(rows)} rows in {size} bytes")
+        return len(names)
+
+    def thaw_partition(self, cursor, name):
+        """Copy an archived partition back into its (just created) table before late samples join it.
+
+        The file stays until the partition is archived again; reads prefer
+        the table.
+        """
+        columns = ('id', 'timestamp', 'ts_epoch_ms', 'host') + rollups.METRIC_FIELDS
+        rows = self.cold.iter_range(name, 0, 2 ** 62, newest_first=False, columns=columns)
+        cursor.executemany(f'''
+            INSERT OR IGNORE INTO {name} ({', '.join(columns)})
+            VALUES ({', '.join('?' * len(columns))})
+        ''', rows)
+
+    def update_rollups(self, cursor, host, samples):
+        """Merge one host's (ts_ms, cpu, memory, disk, network) samples into every rollup table."""
+        for resolution, buckets in rollups.aggregate_all(samples).items():
+            cursor.executemany(
+                rollups.upsert_sql(resolution),
+                [rollups.upsert_row(host, bucket, agg) for bucket, agg in buckets.items()]
+            )
+
+    def prepare_rows(self, batch):
+        """Validate a batch of metrics dicts and convert it to insert tuples.
+
+        The whole batch is converted in one pass; any bad row, including
+        NaN or infinite metrics, fails the batch with sqlite3.Error. Samples
+        decoded from binary frames already carry ts_epoch_ms, so their
+        timestamp is not parsed again.
+        """
+        try:
+            rows = [
+                (m['timestamp'], float(m['cpu_usage']), float(m['memory_usage']),
+                 float(m['disk_io']), float(m['network_usage']), m.get('host', DEFAULT_HOST),
+                 m.get('ts_epoch_ms'))
+                for m in batch
+            ]
+        except KeyError as e:
+            raise sqlite3.Error(f"Missing required field: {e}")
+        except (ValueError, TypeError) as e:
+            raise sqlite3.Error(f"Invalid numeric value: {e}")
+        # float() accepts 'nan' and 'inf', which the rollup sketches cannot bin
+        isfinite = math.isfinite
+        for row in rows:
+            if not (isfinite(row[1]) and isfinite(row[2]) and isfinite(row[3]) and isfinite(row[4])):
+                raise sqlite3.Error(f"Non-finite metric value: {row[1:5]}")
+
+        try:
+            return [
+                row[:5] + (timestamp_to_ms(row[0]) if row[6] is None else int(row[6]), row[5])
+                for row in rows
+            ]
+        except (ValueError, TypeError):
+            raise sqlite3.Error("Invalid timestamp format")
 
     def insert_data(self, metrics):
+        self.insert_many([metrics])
+
+    def insert_many(self, batch):
+        """Insert a batch of samples in a single transaction."""
+        if batch:
+            self.write_rows(self.prepare_rows(batch))
+
+    def write_rows(self, rows, journal=None):
+        """Commit prepared rows in one transaction.
+
+        With journal=(name, seq), journal_applied records in the same
+        transaction that the journal is applied up to seq, so replaying it
+        after a crash never writes a sample twice (see journal.py).
+        """
         cursor = self.conn.cursor()
+        known_partitions = set(self.partitions)
+        self.thawed = set()
+        started = time.perf_counter()
         try:
-            # Validate metrics data
-            required_fields = ['timestamp', 'cpu_usage', 'memory_usage', 'disk_io', 'network_usage']
-            for field in required_fields:
-                if field not in metrics or metrics[field] is None:
-                    raise sqlite3.Error(f"Missing or null required field: {field}")
-                
-            # Validate numeric fields
-            numeric_fields = ['cpu_usage', 'memory_usage', 'disk_io', 'network_usage']
-            for field in numeric_fields:
-                try:
-                    float(metrics[field])
-                except (ValueError, TypeError):
-                    raise sqlite3.Error(f"Invalid numeric value for field: {field}")
-            
-            # Validate timestamp format
+            by_partition = {}
+            by_host = {}
+            for row in rows:
+                by_partition.setdefault(row[5] // PARTITION_MS, []).append(row)
+                by_host.setdefault(row[6], []).append((row[5], row[1], row[2], row[3], row[4]))
+            for index, partition_rows in by_partition.items():
+                name = self.ensure_partition(cursor, index)
+                cursor.executemany(f'''
+                    INSERT INTO {name} (timestamp, cpu_usage, memory_usage, disk_io, network_usage,
+                                        ts_epoch_ms, host)
+                    VALUES (?, ?, ?, ?, ?, ?, ?)
+                ''', partition_rows)
+            for host, samples in by_host.items():
+                self.update_rollups(cursor, host, samples)
+            if journal is not None:
+                cursor.execute('INSERT OR REPLACE INTO journal_applied (name, seq) VALUES (?, ?)', journal)
+            self.conn.commit()
+            COMMIT_SECONDS.observe(time.perf_counter() - started)
+            now_ms = time.time() * 1000
+            for row in rows:
+                SAMPLE_AGE.observe((now_ms - row[5]) / 1000.0)
+        except Exception as e:
+            self.conn.rollback()
+            self.load_partitions()
+            raise sqlite3.Error(str(e))
+
+        # A new partition means a new day has started: expire old ones. The
+        # rows are committed by now, so a failure here must not make the
+        # caller retry (and store) them again; the next new day retries it.
+        # A thawed partition is an old day coming back, not a new one.
+        if self.partitions - known_partitions - self.thawed:
             try:
-                datetime.strptime(metrics['timestamp'], '%Y-%m-%d %H:%M:%S')
-            except ValueError:
-                raise sqlite3.Error("Invalid timestamp format")
-            
-            cursor.execute('''
-                INSERT INTO metrics (timestamp, cpu_usage, memory_usage, disk_io, network_usage)
-                VALUES (?, ?, ?, ?, ?)
-            ''', (
-                metrics['timestamp'],
-                float(metrics['cpu_usage']),
-                float(metrics['memory_usage']),
-                float(metrics['disk_io']),
-                float(metrics['network_usage'])
-            ))
+                self.apply_retention()
+            except sqlite3.Error as e:
+                logging.error(f"Retention failed: {e}")
+
+    def buffer_data(self, metrics):
+        """Queue a sample in the write-behind buffer, flushing when due."""
+        if not self.pending:
+            self.pending_since = time.monotonic()
+        self.pending.append(metrics)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+        else:
+            self.flush_if_due()
+
+    def flush_if_due(self):
+        if self.pending and time.monotonic() - self.pending_since >= self.flush_interval:
+            self.flush()
+
+    def flush(self):
+        """Commit every buffered sample.
+
+        Invalid samples are logged and dropped without failing the rest of
+        the batch. If the write itself fails the samples stay buffered and
+        are retried by the next flush.
+        """
+        if self.pending_processes:
+            self.write_processes(self.pending_processes)
+            self.pending_processes = []
+        if not self.pending:
+            return
+        self.write_rows(self.prepare_valid_rows(self.pending))
+        self.pending = []
+        self.pending_since = None
+
+    def prepare_valid_rows(self, batch):
+        """Like prepare_rows(), but invalid samples are logged and dropped instead of failing the batch."""
+        try:
+            return self.prepare_rows(batch)
+        except sqlite3.Error:
+            rows = []
+            for metrics in batch:
+                try:
+                    rows.extend(self.prepare_rows([metrics]))
+                except sqlite3.Error as e:
+                    SAMPLES_DROPPED.inc()
+                    logging.error(f"Dropping invalid sample {metrics!r}: {e}")
+            return rows
+
+    def buffer_processes(self, host, ts_ms, processes):
+        """Queue one tick of (pid, name, cpu %, rss bytes, io bytes/s) rows; written by the next flush."""
+        self.pending_processes.extend((host, ts_ms) + tuple(process) for process in processes)
+
+    def write_processes(self, rows):
+        cursor = self.conn.cursor()
+        try:
+            cursor.executemany('''
+                INSERT INTO process_samples (host, ts_epoch_ms, pid, name, cpu_percent,
+                                             rss_bytes, io_bytes_per_s)
+                VALUES (?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
             self.conn.commit()
         except Exception as e:
             self.conn.rollback()
             raise sqlite3.Error(str(e))
 
-    def query_data(self, start_date, end_date):
+    def query_processes(self, ts_ms=None, host=DEFAULT_HOST):
+        """Top processes recorded at or before ts_ms (default: latest), busiest first.
+
+        Returns (ts_epoch_ms, rows) with rows of (pid, name, cpu %, rss bytes,
+        io bytes/s), or (None, []) if nothing was recorded.
+        """
+        self.flush()
         cursor = self.conn.cursor()
+        if ts_ms is None:
+            ts_ms = 2 ** 62
+        tick = cursor.execute(
+            'SELECT MAX(ts_epoch_ms) FROM process_samples WHERE host = ? AND ts_epoch_ms <= ?',
+            (host, ts_ms)).fetchone()[0]
+        if tick is None:
+            return None, []
         cursor.execute('''
-            SELECT * FROM metrics
-            WHERE timestamp BETWEEN ? AND ?
-            ORDER BY timestamp DESC
-        ''', (start_date, end_date))
-        return cursor.fetchall()
+            SELECT pid, name, cpu_percent, rss_bytes, io_bytes_per_s FROM process_samples
+            WHERE host = ? AND ts_epoch_ms = ?
+            ORDER BY cpu_percent DESC
+        ''', (host, tick))
+        return tick, cursor.fetchall()
+
+    def query_data(self, start_date, end_date):
+        """Return samples from start_date up to end_date, newest first.
+
+        A date-only end ('YYYY-MM-DD') is exclusive, a full timestamp is
+        inclusive.
+        """
+        end_ms = date_to_ms(end_date)
+        if len(end_date) != 10:
+            end_ms += 1
+        return self.query_range(date_to_ms(start_date), end_ms)
+
+    def query_range(self, start_ms, end_ms, host=None):
+        """Return samples with start_ms <= ts_epoch_ms < end_ms, newest first.
+
+        host limits the result to one host's series. See iter_range() for
+        ranges too large to hold in memory.
+        """
+        return list(self.iter_range(start_ms, end_ms, host))
 
-    def get_latest_metrics(self):
+    def iter_range(self, start_ms, end_ms, host=None, newest_first=True,
+                   columns=METRIC_COLUMNS, chunk_size=CHUNK_SIZE):
+        """Yield samples with start_ms <= ts_epoch_ms < end_ms, fetched chunk_size rows at a time.
+
+        Only partitions overlapping the range are read; each one is an index
+        seek and partitions do not overlap, so rows come out in time order
+        without a sort, and memory use does not depend on the range. Archived
+        partitions are read from the cold store, decoding only the blocks
+        that overlap the range.
+        """
+        self.flush()
+        where, params = 'ts_epoch_ms >= ? AND ts_epoch_ms < ?', (start_ms, end_ms)
+        if host is not None:
+            where, params = 'host = ? AND ' + where, (host,) + params
+        order = 'DESC' if newest_first else 'ASC'
+        names = self.partitions_between(start_ms, end_ms)
+        hot = set(names)
+        names += [name for name in self.archived_between(start_ms, end_ms) if name not in hot]
+        names.sort(reverse=newest_first)
+        for name in names:
+            if name not in hot:
+                yield from self.cold.iter_range(name, start_ms, end_ms, host, newest_first,
+                                                [column.strip() for column in columns.split(',')])
+                continue
+            cursor = self.conn.cursor()
+            cursor.execute(f'''
+                SELECT {columns} FROM {name}
+                WHERE {where}
+                ORDER BY ts_epoch_ms {order}
+            ''', params)
+            yield from iter_cursor(cursor, chunk_size)
+
+    def data_version(self):
+        """SQLite's data_version: changes whenever another connection commits."""
+        return self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def high_water_mark(self):
+        """{partition: newest row id} for the partitions in SQLite, the starting point for rows_since()."""
+        self.flush()
         cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT * FROM metrics
-            ORDER BY timestamp DESC
-            LIMIT 1
-        ''')
-        return cursor.fetchone()
+        names = [row[0] for row in cursor.execute('SELECT name FROM metrics_partitions')]
+        return {name: cursor.execute(f'SELECT MAX(id) FROM {name}').fetchone()[0] or 0 for name in names}
+
+    def rows_since(self, mark):
+        """Rows inserted after mark, oldest partition first and then in insertion order, and the next mark.
+
+        Every partition in SQLite is read from an id seek, so samples that
+        arrive late into an older day (remote agents, a journal backlog) are
+        included, and the cost depends on the number of new rows and of
+        partitions, not on history. A partition brought back from the cold
+        store for a late sample is read from past its archived rows.
+        """
+        self.flush()
+        cursor = self.conn.cursor()
+        names = [row[0] for row in cursor.execute('SELECT name FROM metrics_partitions ORDER BY start_ms')]
+        rows, next_mark = [], {}
+        for name in names:
+            last_id = mark.get(name)
+            if last_id is None:
+                last_id = 0
+                if self.cold is not None and os.path.exists(self.cold.path(name)):
+                    last_id = max((row[0] for row in self.cold.iter_range(name, 0, 2 ** 62, columns=('id',))),
+                                  default=0)
+            try:
+                cursor.execute(f'SELECT {METRIC_COLUMNS} FROM {name} WHERE id > ? ORDER BY id', (last_id,))
+            except sqlite3.OperationalError:
+                # Dropped by retention or archived since it was listed
+                continue
+            new_rows = cursor.fetchall()
+            rows.extend(new_rows)
+            next_mark[name] = new_rows[-1][0] if new_rows else last_id
+        return rows, next_mark
+
+    def query_rollup(self, start_ms, end_ms, resolution, host=None):
+        """Return rollup buckets overlapping [start_ms, end_ms), newest first.
+
+        Each row is (bucket_ms, sample_count) followed by avg, min, max and
+        last for cpu_usage, memory_usage, disk_io and network_usage. Without a
+        host, buckets are merged across all hosts.
+        """
+        return list(self.iter_rollup(start_ms, end_ms, resolution, host))
+
+    def iter_rollup(self, start_ms, end_ms, resolution, host=None, newest_first=True,
+                    chunk_size=CHUNK_SIZE):
+        """Yield the rows of query_rollup() chunk_size at a time."""
+        self.flush()
+        size = rollups.RESOLUTIONS[resolution]
+        params = (start_ms - start_ms % size, end_ms)
+        cursor = self.conn.cursor()
+        if host is None:
+            cursor.execute(rollups.select_sql(resolution, per_host=False, newest_first=newest_first),
+                           params)
+        else:
+            cursor.execute(rollups.select_sql(resolution, newest_first=newest_first), (host,) + params)
+        yield from iter_cursor(cursor, chunk_size)
+
+    def stats(self, start_ms, end_ms, host=None, thresholds=None):
+        """Distribution of every metric over [start_ms, end_ms) from the rollup sketches.
+
+        The range is covered with the coarsest whole rollup buckets that fit
+        (see rollups.split_range()) and only the sub-minute edges are read
+        from raw data, so the cost depends on the number of buckets, not of
+        samples. Returns (sketches, covered_ms, above_ms): a merged Sketch per
+        metric, the time that has data and, for each metric in thresholds,
+        the estimated time spent above it (see rollups.covered_ms()); with no
+        host, time is summed over hosts.
+        """
+        self.flush()
+        thresholds = thresholds or {}
+        merged = {field: sketches.Sketch() for field in rollups.METRIC_FIELDS}
+        above_ms = {field: 0.0 for field in thresholds if field in merged}
+        covered_ms = 0
+
+        def add(span, bucket_sketches):
+            for field, sketch in zip(rollups.METRIC_FIELDS, bucket_sketches):
+                merged[field].merge(sketch)
+                if field in above_ms:
+                    above_ms[field] += span * sketch.count_above(thresholds[field]) / sketch.count()
+
+        pieces, edges = rollups.split_range(start_ms, end_ms)
+        cursor = self.conn.cursor()
+        for resolution, start, end in pieces:
+            size = rollups.RESOLUTIONS[resolution]
+            if host is None:
+                cursor.execute(rollups.sketch_select_sql(resolution, per_host=False), (start, end))
+            else:
+                cursor.execute(rollups.sketch_select_sql(resolution), (host, start, end))
+            for row in cursor:
+                if row[3] is None:
+                    # Older than the sketches, see migrate_sketches()
+                    continue
+                span = min(size, rollups.covered_ms(*row[:3]))
+                covered_ms += span
+                add(span, [sketches.Sketch.decode(blob) for blob in row[3:]])
+
+        columns = 'ts_epoch_ms, ' + ', '.join(rollups.METRIC_FIELDS)
+        for start, end in edges:
+            edge = [sketches.Sketch() for _ in rollups.METRIC_FIELDS]
+            count, first_ms, last_ms = 0, None, None
+            for row in self.iter_range(start, end, host, newest_first=False, columns=columns):
+                count += 1
+                first_ms = row[0] if first_ms is None else first_ms
+                last_ms = row[0]
+                for sketch, value in zip(edge, row[1:]):
+                    sketch.add(value)
+            if count:
+                span = min(end - start, rollups.covered_ms(count, first_ms, last_ms))
+                covered_ms += span
+                add(span, edge)
+        return merged, covered_ms, above_ms
+
+    def choose_resolution(self, start_ms, end_ms, max_points=rollups.MAX_POINTS, host=None):
+        """Pick 'raw' or the rollup resolution that answers a range in at most max_points rows."""
+        self.flush()
+        size = rollups.RESOLUTIONS['1h']
+        cursor = self.conn.cursor()
+        # Hourly sample counts bound the raw row count without touching raw rows
+        query = 'SELECT SUM(sample_count) FROM metrics_1h WHERE bucket_ms >= ? AND bucket_ms < ?'
+        params = (start_ms - start_ms % size, end_ms)
+        if host is not None:
+            query += ' AND host = ?'
+            params += (host,)
+        raw_count = cursor.execute(query, params).fetchone()[0] or 0
+        return rollups.choose_resolution(start_ms, end_ms, raw_count, max_points)
+
+    def get_latest_metrics(self, host=None):
+        self.flush()
+        cursor = self.conn.cursor()
+        where, params = ('WHERE host = ?', (host,)) if host is not None else ('', ())
+        cursor.execute('SELECT name FROM metrics_partitions ORDER BY start_ms DESC')
+        for (name,) in cursor.fetchall():
+            cursor.execute(f'''
+                SELECT {METRIC_COLUMNS} FROM {name}
+                {where}
+                ORDER BY ts_epoch_ms DESC
+                LIMIT 1
+            ''', params)
+            row = cursor.fetchone()
+            if row:
+                return row
+        # Everything recent has expired: the newest archived sample, if any
+        if self.cold is not None:
+            for name in reversed(self.cold.names()):
+                for row in self.cold.iter_range(name, 0, 2 ** 62, host,
+                                                columns=METRIC_COLUMNS.split(', ')):
+                    return row
+        return None
+
+    def get_hosts(self):
+        """Hosts that have reported samples, from the small daily rollup table."""
+        self.flush()
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT DISTINCT host FROM metrics_1d ORDER BY host')
+        return [row[0] for row in cursor.fetchall()]
     
     def update_threshold(self, name, value):
         cursor = self.conn.cursor()
@@ -97,15 +938,57 @@ class Database:
             INSERT OR REPLACE INTO thresholds (name, value, updated_at)
             VALUES (?, ?, CURRENT_TIMESTAMP)
         ''', (name, value))
+        cursor.execute("UPDATE config_version SET version = version + 1 WHERE name = 'thresholds'")
         self.conn.commit()
+
+    def thresholds_version(self):
+        """Counter bumped by every update_threshold() call, from any process."""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT version FROM config_version WHERE name = 'thresholds'")
+        return cursor.fetchone()[0]
     
     def get_thresholds(self):
         cursor = self.conn.cursor()
         cursor.execute('SELECT name, value FROM thresholds')
         return dict(cursor.fetchall())
 
-    def __del__(self):
-        if hasattr(self, 'conn'):
+    def save_detector_state(self, host, state, now_ms=None):
+        """Checkpoint {detector name: bytes} for host, replacing the previous checkpoint."""
+        if now_ms is None:
+            now_ms = int(time.time() * 1000)
+        cursor = self.conn.cursor()
+        cursor.executemany(
+            'INSERT OR REPLACE INTO detector_state (host, name, state, updated_ms) VALUES (?, ?, ?, ?)',
+            [(host, name, blob, now_ms) for name, blob in state.items()]
+        )
+        self.conn.commit()
+
+    def load_detector_state(self, host):
+        cursor = self.conn.cursor()
+        cursor.execute('SELECT name, state FROM detector_state WHERE host = ?', (host,))
+        return dict(cursor.fetchall())
+
+    def journal_applied(self, name):
+        """Sequence number up to which the spill journal name is committed, 0 if none."""
+        cursor = self.conn.cursor()
+        row = cursor.execute('SELECT seq FROM journal_applied WHERE name = ?', (name,)).fetchone()
+        return row[0] if row else 0
+
+    def close(self):
+        if getattr(self, 'conn', None) is None:
+            return
+        try:
+            self.flush()
+        finally:
             self.conn.close()
+            self.conn = None
+            if self.cold is not None:
+                self.cold.close()
+
+    def __del__(self):
+        try:
+            self.close()
+        except Exception as e:
+            logging.error(f"Error closing database: {e}")
 
 
@@ -0,0 +1,48 @@
+# SysMoniTool/src/python/export.py
+"""Streaming CSV / NDJSON writers for exported query results.
+
+Rows are written as they come from the database iterators, so exporting a
+range takes constant memory however large it is.
+"""
+import csv
+import json
+import rollups
+
+FORMATS = ('csv', 'ndjson')
+
+RAW_COLUMNS = ('timestamp', 'ts_epoch_ms', 'host') + rollups.METRIC_FIELDS
+# Database.iter_range column list producing rows in RAW_COLUMNS order
+RAW_SELECT = ', '.join(RAW_COLUMNS)
+
+ROLLUP_COLUMNS = ('bucket_ms', 'sample_count') + tuple(
+    f'{field}_{stat}' for field in rollups.METRIC_FIELDS for stat in ('avg', 'min', 'max', 'last')
+)
+
+
+def write_rows(rows, columns, out, fmt='csv'):
+    """Write rows (tuples in columns order) to the text stream out; returns the row count.
+
+    The stream is flushed after the first row so consumers see output
+    straight away; after that the stream's own buffering applies.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    count = 0
+    if fmt == 'csv':
+        writer = csv.writer(out, lineterminator='\n')
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(row)
+            count += 1
+            if count == 1:
+                out.flush()
+    else:
+        encode = json.JSONEncoder(separators=(',', ':')).encode
+        for row in rows:
+            out.write(encode(dict(zip(columns, row))))
+            out.write('\n')
+            count += 1
+            if count == 1:
+                out.flush()
+    out.flush()
+    return count
@@ -0,0 +1,218 @@
+# SysMoniTool/src/python/ingest_server.py
+"""Central ingestion server for many collectors.
+
+Collectors connect *to* this server (``monitor INTERVAL_MS SERVER PORT``) and
+stream the same CSV records or binary frames MetricsReceiver reads. A collector may
+name itself with a first line of ``#host <name>``; otherwise samples are
+tagged with the peer address.
+
+Every connection is handled by a coroutine on one event loop. Parsed samples
+go into a bounded queue shared by all connections; when the writer falls
+behind, connections block on the queue and stop reading, so TCP flow control
+pushes back on the collectors instead of memory growing. A single writer task
+drains the queue in batches into SQLite on a dedicated thread. A batch that
+fails to commit (e.g. the database is locked) is retried with backoff while
+the queue fills up and throttles the collectors, and is only dropped after
+MAX_BATCH_ATTEMPTS failures.
+"""
+import argparse
+import asyncio
+import logging
+import os
+import signal
+from concurrent.futures import ThreadPoolExecutor
+from database import Database
+from journal import MAX_BATCH_ATTEMPTS, MIN_RETRY_DELAY, MAX_RETRY_DELAY
+from protocol import RecordBuffer, parse_records, RECV_SIZE
+
+INGEST_PORT = 12400
+HOST_PREFIX = b'#host '
+MAX_HOST_LENGTH = 255
+
+# Samples buffered between the connections and the writer; roughly ten
+# seconds of 1 Hz samples from a thousand agents
+DEFAULT_MAX_QUEUE = 10000
+
+
+class IngestServer:
+    def __init__(self, host='0.0.0.0', port=INGEST_PORT, db_path='data/logs.db',
+                 max_queue=DEFAULT_MAX_QUEUE, batch_size=500, flush_interval=1.0):
+        self.host = host
+        self.port = port
+        self.db_path = db_path
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.db = None
+        self.queue = None
+        self.server = None
+        self.writer_task = None
+        self.batch = []
+        self.connections = set()
+        # SQLite connections belong to the thread that opened them, so the
+        # database is created, written and closed on this one thread
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ingest-writer')
+
+    async def start(self):
+        loop = asyncio.get_running_loop()
+        os.makedirs(os.path.dirname(self.db_path) or '.', exist_ok=True)
+        self.db = await loop.run_in_executor(self.executor, Database, self.db_path)
+        self.queue = asyncio.Queue(maxsize=self.max_queue)
+        self.server = await asyncio.start_server(self.handle_connection, self.host, self.port)
+        # Report the real port when asked to bind port 0
+        self.port = self.server.sockets[0].getsockname()[1]
+        self.writer_task = asyncio.create_task(self.write_loop())
+        logging.info(f"Ingest server listening on {self.host}:{self.port}")
+
+    async def handle_connection(self, reader, writer):
+        peer = writer.get_extra_info('peername')
+        host = peer[0] if peer else 'unknown'
+        stream = RecordBuffer()
+        task = asyncio.current_task()
+        self.connections.add(task)
+        try:
+            while True:
+                data = await reader.read(RECV_SIZE)
+                if not data:
+                    break
+                stream.feed(data)
+                while True:
+                    try:
+                        record = stream.next_record()
+                    except ValueError as e:
+                        logging.error(f"Error parsing metrics from {host}: {e}")
+                        continue
+                    if record is None:
+                        break
+                    host = await self.handle_record(record, host)
+            record = stream.flush()
+            if record:
+                await self.handle_record(record, host)
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+        finally:
+            self.connections.discard(task)
+            writer.close()
+
+    async def handle_record(self, record, host):
+        """Queue one record from host; returns the (possibly renamed) host."""
+        if record.startswith(HOST_PREFIX):
+            name = record[len(HOST_PREFIX):].decode(errors='replace').strip()
+            if name and len(name) <= MAX_HOST_LENGTH:
+                return name
+            logging.error(f"Ignoring invalid host name from {host}")
+            return host
+        try:
+            samples = parse_records(record)
+        except ValueError as e:
+            logging.error(f"Error parsing metrics from {host}: {e}")
+            return host
+        for metrics in samples:
+            metrics['host'] = host
+            # Blocks this connection only, while the writer catches up
+            await self.queue.put(metrics)
+        return host
+
+    async def write_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            # Kept on self so stop() can still write a batch cut short
+            self.batch = [await self.queue.get()]
+            deadline = loop.time() + self.flush_interval
+            while len(self.batch) < self.batch_size:
+                if self.queue.empty():
+                    timeout = deadline - loop.time()
+                    if timeout <= 0:
+                        break
+                    try:
+                        self.batch.append(await asyncio.wait_for(self.queue.get(), timeout))
+                    except asyncio.TimeoutError:
+                        break
+                else:
+                    self.batch.append(self.queue.get_nowait())
+            batch, self.batch = self.batch, []
+            await self.write_batch(batch)
+
+    async def write_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        delay = MIN_RETRY_DELAY
+        for attempt in range(1, MAX_BATCH_ATTEMPTS + 1):
+            try:
+                await loop.run_in_executor(self.executor, self.write_valid, batch)
+                return
+            except Exception as e:
+                if attempt == MAX_BATCH_ATTEMPTS:
+                    logging.error(f"Dropping {len(batch)} samples after {attempt} failed writes: {e}")
+                    return
+                logging.error(f"Error writing {len(batch)} samples, retrying in {delay:.1f}s: {e}")
+            try:
+                await asyncio.sleep(delay)
+            except asyncio.CancelledError:
+                # stop() writes it once more before closing the database
+                self.batch = batch
+                raise
+            delay = min(delay * 2, MAX_RETRY_DELAY)
+
+    def write_valid(self, batch):
+        # Batches mix hosts: one agent's invalid sample is logged and dropped
+        # instead of failing everyone else's
+        rows = self.db.prepare_valid_rows(batch)
+        if rows:
+            self.db.write_rows(rows)
+
+    async def stop(self):
+        """Stop accepting, write whatever is queued and close the database."""
+        if self.server is not None:
+            self.server.close()
+        # Connections must be gone before wait_closed() returns
+        for task in list(self.connections):
+            task.cancel()
+        if self.server is not None:
+            await self.server.wait_closed()
+        if self.writer_task is not None:
+            self.writer_task.cancel()
+            try:
+                await self.writer_task
+            except asyncio.CancelledError:
+                pass
+        if self.queue is not None:
+            batch, self.batch = self.batch, []
+            while not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            if batch:
+                await self.write_batch(batch)
+        if self.db is not None:
+            await asyncio.get_running_loop().run_in_executor(self.executor, self.db.close)
+        self.executor.shutdown()
+
+    async def serve(self):
+        await self.start()
+        stopped = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(signum, stopped.set)
+        try:
+            await stopped.wait()
+        finally:
+            await self.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Central metrics ingestion server')
+    parser.add_argument('--bind', default='0.0.0.0', help='Address to listen on')
+    parser.add_argument('--port', type=int, default=INGEST_PORT, help='Port to listen on')
+    parser.add_argument('--db', default='data/logs.db', help='Database file')
+    parser.add_argument('--max-queue', type=int, default=DEFAULT_MAX_QUEUE,
+                        help='Samples buffered before collectors are throttled')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    server = IngestServer(args.bind, args.port, args.db, max_queue=args.max_queue)
+    asyncio.run(server.serve())
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,437 @@
+# SysMoniTool/src/python/journal.py
+"""Spill journal between receiving samples and committing them.
+
+MetricsReceiver appends every sample to a Journal and goes on with the next
+one; a Persister thread reads the journal in batches and commits them to
+SQLite. A locked database, a slow commit or retention/archiving work only
+makes the journal grow, and a crash loses nothing that was appended: the
+next receiver replays whatever was not committed.
+
+The journal is a directory of segment files, each a fixed-size memory-mapped
+file named after the sequence number of its first record. A segment starts
+with a header (magic, version, first seq) followed by records appended back
+to back:
+
+    payload size (u32), crc32 of the payload (u32), seq (u64), payload
+
+Sequence numbers are consecutive across segments. Segments are never
+rewritten: a new one is created when the last is full and a segment is
+deleted once every record in it is committed. Opening the journal scans
+each segment up to the first record that is empty, fails its checksum or
+breaks the sequence (a write cut short by a crash).
+
+The Persister commits each batch together with its last seq in the
+database's journal_applied table, in the same transaction. Records at or
+below that seq are skipped on replay, so replay is idempotent.
+
+When max_segments are full, Journal.append() waits for the Persister to free
+one. The receiver then stops reading its socket and the collector's writes
+block: backpressure instead of dropped samples.
+"""
+import fcntl
+import json
+import logging
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from database import Database, DEFAULT_HOST
+from selfstats import REGISTRY
+
+MAGIC = b'SMJ1'
+VERSION = 1
+SEGMENT_HEADER = struct.Struct('<4sIQ')  # magic, version, first seq
+RECORD = struct.Struct('<IIQ')  # payload size, crc32, seq
+SUFFIX = '.seg'
+# 1 MiB holds about 16000 samples; 64 of them bound the journal to 64 MiB
+SEGMENT_BYTES = 1024 * 1024
+MAX_SEGMENTS = 64
+# Name under which the applied seq is stored in journal_applied
+JOURNAL_NAME = 'spill'
+
+# ts_epoch_ms, cpu, memory, disk, network, host size; then host and timestamp
+SAMPLE = struct.Struct('<q4dB')
+
+# Commit retry backoff bounds (seconds)
+MIN_RETRY_DELAY = 0.1
+MAX_RETRY_DELAY = 5.0
+# Failed attempts at a batch before its records are committed one at a time
+# and those that still fail are moved to the reject log
+MAX_BATCH_ATTEMPTS = 5
+# In the journal directory; one JSON object per rejected record
+REJECT_LOG = 'rejected.ndjson'
+
+PERSIST_FAILURES = REGISTRY.counter('sysmon_persist_failures_total', 'Journal batches that failed to commit')
+SAMPLES_REJECTED = REGISTRY.counter('sysmon_journal_rejected_total',
+                                    'Journaled samples moved to the reject log after failing to commit')
+BACKPRESSURE_SECONDS = REGISTRY.counter('sysmon_journal_backpressure_seconds_total',
+                                        'Time the receiver waited for space in a full journal')
+
+
+def encode_sample(metrics, ts_ms):
+    host = metrics.get('host', DEFAULT_HOST).encode()
+    return SAMPLE.pack(ts_ms, metrics['cpu_usage'], metrics['memory_usage'], metrics['disk_io'],
+                       metrics['network_usage'], len(host)) + host + metrics['timestamp'].encode()
+
+
+def decode_sample(payload):
+    ts_ms, cpu, memory, disk, network, host_size = SAMPLE.unpack_from(payload)
+    start = SAMPLE.size + host_size
+    return {'timestamp': payload[start:].decode(), 'ts_epoch_ms': ts_ms, 'cpu_usage': cpu,
+            'memory_usage': memory, 'disk_io': disk, 'network_usage': network,
+            'host': payload[SAMPLE.size:start].decode()}
+
+
+class Segment:
+    def __init__(self, path, mm):
+        self.path = path
+        self.mm = mm
+        self.first_seq = SEGMENT_HEADER.unpack_from(mm)[2]
+        self.last_seq = self.first_seq - 1
+        # Write position, and the reader's position (Persister thread only)
+        self.end = SEGMENT_HEADER.size
+        self.read_offset = SEGMENT_HEADER.size
+        self.synced_end = self.end
+
+    @classmethod
+    def create(cls, path, size, first_seq):
+        fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_EXCL, 0o644)
+        try:
+            os.ftruncate(fd, size)
+            os.pwrite(fd, SEGMENT_HEADER.pack(MAGIC, VERSION, first_seq), 0)
+            mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        return cls(path, mm)
+
+    @classmethod
+    def open(cls, path):
+        """The segment at path with its valid records, or None if it is not a segment."""
+        fd = os.open(path, os.O_RDWR)
+        try:
+            size = os.fstat(fd).st_size
+            header = os.pread(fd, SEGMENT_HEADER.size, 0)
+            if len(header) < SEGMENT_HEADER.size or SEGMENT_HEADER.unpack(header)[:2] != (MAGIC, VERSION):
+                return None
+            mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        segment = cls(path, mm)
+        offset, seq = segment.end, segment.first_seq
+        while offset + RECORD.size <= size:
+            payload_size, crc, record_seq = RECORD.unpack_from(mm, offset)
+            start = offset + RECORD.size
+            if payload_size == 0 or record_seq != seq or start + payload_size > size or \
+                    zlib.crc32(mm[start:start + payload_size]) != crc:
+                break
+            offset = start + payload_size
+            seq += 1
+        segment.end = segment.synced_end = offset
+        segment.last_seq = seq - 1
+        return segment
+
+    def append(self, seq, payload):
+        """Write one record; False if it does not fit."""
+        end = self.end + RECORD.size + len(payload)
+        if end > len(self.mm):
+            return False
+        # Payload first: a record whose header is written is complete
+        self.mm[self.end + RECORD.size:end] = payload
+        RECORD.pack_into(self.mm, self.end, len(payload), zlib.crc32(payload), seq)
+        self.end = end
+        self.last_seq = seq
+        return True
+
+    def sync(self):
+        end = self.end
+        if end != self.synced_end:
+            start = self.synced_end - self.synced_end % mmap.PAGESIZE
+            self.mm.flush(start, end - start)
+            self.synced_end = end
+
+    def close(self):
+        self.mm.close()
+
+
+class Journal:
+    """Segmented append-only journal: one writer thread (append) and one reader (read/release)."""
+
+    def __init__(self, directory, first_seq=1, segment_bytes=SEGMENT_BYTES, max_segments=MAX_SEGMENTS):
+        """Open or create the journal in directory.
+
+        first_seq is the first record not yet committed (the applied seq
+        plus one); older records are skipped and their segments deleted.
+        Raises OSError if another process has the journal open.
+        """
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_segments = max_segments
+        os.makedirs(directory, exist_ok=True)
+        self.lock_file = open(os.path.join(directory, 'lock'), 'a')
+        try:
+            fcntl.flock(self.lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.lock_file.close()
+            raise OSError(f"Journal {directory} is in use by another process")
+
+        self.segments = []
+        for name in sorted(os.listdir(directory)):
+            if name.endswith(SUFFIX):
+                segment = Segment.open(os.path.join(directory, name))
+                if segment is not None:
+                    self.segments.append(segment)
+        self.applied = first_seq - 1
+        last_seq = self.segments[-1].last_seq if self.segments else 0
+        self.next_seq = max(first_seq, last_seq + 1)
+        self.replayed = max(0, last_seq - self.applied)
+        self.cond = threading.Condition()
+        # Pending count the reader is waiting for, see wait()
+        self.wanted = None
+        self.woken = False
+        # Appends must continue the last segment's sequence, so a segment
+        # with nothing left to replay is not reused
+        self.remove_applied(keep=0)
+
+    def path(self, first_seq):
+        return os.path.join(self.directory, f'{first_seq:020d}{SUFFIX}')
+
+    def append(self, payload):
+        """Append one record and return its seq; waits while the journal is full."""
+        if RECORD.size + len(payload) > self.segment_bytes - SEGMENT_HEADER.size:
+            raise ValueError(f"Record of {len(payload)} bytes does not fit in a segment")
+        with self.cond:
+            waited = None
+            while not self.segments or not self.segments[-1].append(self.next_seq, payload):
+                if len(self.segments) < self.max_segments:
+                    self.segments.append(Segment.create(self.path(self.next_seq), self.segment_bytes,
+                                                        self.next_seq))
+                    continue
+                if waited is None:
+                    waited = time.monotonic()
+                    logging.warning(f"Spill journal full ({self.pending()} samples); waiting for the database")
+                self.cond.wait()
+            if waited is not None:
+                BACKPRESSURE_SECONDS.inc(time.monotonic() - waited)
+            seq = self.next_seq
+            self.next_seq += 1
+            if self.wanted is not None and self.pending() >= self.wanted:
+                self.cond.notify_all()
+            return seq
+
+    def pending(self):
+        """Records appended but not yet released."""
+        return self.next_seq - 1 - self.applied
+
+    def fill(self):
+        """Fraction of the journal's capacity in use."""
+        used = sum(segment.end for segment in self.segments)
+        return used / (self.segment_bytes * self.max_segments)
+
+    def wait(self, count, timeout):
+        """Wait until count records are pending, timeout seconds pass or wake() is called."""
+        with self.cond:
+            if self.pending() < count and not self.woken:
+                self.wanted = count
+                self.cond.wait(timeout)
+                self.wanted = None
+            self.woken = False
+
+    def wake(self):
+        with self.cond:
+            self.woken = True
+            self.cond.notify_all()
+
+    def read(self, limit):
+        """Up to limit (seq, payload) records after the last ones read, oldest first."""
+        with self.cond:
+            segments = [(segment, segment.end) for segment in self.segments]
+        records = []
+        for segment, end in segments:
+            while segment.read_offset < end and len(records) < limit:
+                size, _, seq = RECORD.unpack_from(segment.mm, segment.read_offset)
+                start = segment.read_offset + RECORD.size
+                segment.read_offset = start + size
+                if seq > self.applied:
+                    records.append((seq, segment.mm[start:start + size]))
+            if len(records) >= limit:
+                break
+        return records
+
+    def release(self, seq):
+        """Mark records up to seq committed and delete the segments holding only such records."""
+        with self.cond:
+            self.applied = max(self.applied, seq)
+            # The last segment is kept for appending
+            self.remove_applied(keep=1)
+            self.cond.notify_all()
+
+    def remove_applied(self, keep):
+        while len(self.segments) > keep and self.segments[0].last_seq <= self.applied:
+            segment = self.segments.pop(0)
+            segment.close()
+            os.remove(segment.path)
+
+    def sync(self):
+        """Flush appended records to disk, so they also survive a power loss."""
+        with self.cond:
+            segments = list(self.segments)
+        for segment in segments:
+            segment.sync()
+
+    def close(self):
+        with self.cond:
+            for segment in self.segments:
+                segment.close()
+            self.segments = []
+            self.cond.notify_all()
+        self.lock_file.close()
+
+
+class Persister(threading.Thread):
+    """Commits journaled samples to the database on its own connection.
+
+    Samples are committed once batch_size are pending or flush_interval has
+    passed; a failed commit is retried with backoff and the journal keeps
+    growing meanwhile. Each retry first skips records journal_applied shows
+    were committed after all. After MAX_BATCH_ATTEMPTS failures the batch is
+    committed record by record, and a record that fails on its own while
+    the database accepts other writes is moved to REJECT_LOG, so one bad
+    sample cannot stall the journal. Process rows and detector checkpoints handed to
+    submit_*() are written with the next batch; unlike samples they are only
+    kept in memory.
+    """
+
+    def __init__(self, db_path, journal, batch_size=500, flush_interval=1.0):
+        super().__init__(name='persister', daemon=True)
+        self.db_path = db_path
+        self.journal = journal
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.lock = threading.Lock()
+        self.processes = []
+        self.states = {}
+        self.stopping = False
+
+    def submit_processes(self, host, ts_ms, processes):
+        rows = [(host, ts_ms) + tuple(process) for process in processes]
+        with self.lock:
+            self.processes.extend(rows)
+
+    def submit_state(self, host, state):
+        with self.lock:
+            self.states[host] = state
+
+    def open_database(self):
+        """This thread's connection, retried until it opens; None if stopped first."""
+        delay = MIN_RETRY_DELAY
+        while True:
+            try:
+                return Database(self.db_path, batch_size=self.batch_size, flush_interval=self.flush_interval)
+            except sqlite3.Error as e:
+                if self.stopping:
+                    return None
+                logging.error(f"Could not open the database, retrying in {delay:.1f}s: {e}")
+                time.sleep(delay)
+                delay = min(delay * 2, MAX_RETRY_DELAY)
+
+    def run(self):
+        db = self.open_database()
+        if db is None:
+            return
+        if self.journal.replayed:
+            logging.info(f"Replaying {self.journal.replayed} journaled samples")
+        batch = []
+        attempts = 0
+        delay = MIN_RETRY_DELAY
+        try:
+            while True:
+                if not batch:
+                    if self.stopping and not self.journal.pending():
+                        self.write_extras(db)
+                        break
+                    self.journal.wait(self.batch_size, self.flush_interval)
+                    batch = self.journal.read(self.batch_size)
+                    attempts = 0
+                try:
+                    if batch and attempts:
+                        batch = self.unapplied(db, batch)
+                    if batch:
+                        if attempts < MAX_BATCH_ATTEMPTS:
+                            self.commit(db, batch)
+                        else:
+                            self.commit_each(db, batch)
+                        self.journal.release(batch[-1][0])
+                        batch = []
+                    self.write_extras(db)
+                    self.journal.sync()
+                    delay = MIN_RETRY_DELAY
+                except (sqlite3.Error, ValueError, struct.error) as e:
+                    attempts += 1
+                    PERSIST_FAILURES.inc()
+                    logging.error(f"Commit failed, retrying in {delay:.1f}s: {e}")
+                    if self.stopping:
+                        # The rest is replayed from the journal on restart
+                        break
+                    time.sleep(delay)
+                    delay = min(delay * 2, MAX_RETRY_DELAY)
+        finally:
+            db.close()
+
+    def commit(self, db, batch):
+        rows = db.prepare_valid_rows([decode_sample(payload) for _, payload in batch])
+        db.write_rows(rows, (JOURNAL_NAME, batch[-1][0]))
+
+    def unapplied(self, db, batch):
+        """The records of batch after the committed seq: an attempt may fail after its commit."""
+        applied = db.journal_applied(JOURNAL_NAME)
+        if applied >= batch[0][0]:
+            self.journal.release(min(applied, batch[-1][0]))
+        return [record for record in batch if record[0] > applied]
+
+    def commit_each(self, db, batch):
+        for seq, payload in batch:
+            try:
+                self.commit(db, [(seq, payload)])
+            except (sqlite3.Error, ValueError, struct.error) as e:
+                # Raises, and the batch is retried later, unless the database
+                # takes other writes: then it is this record that fails
+                db.write_rows([], (JOURNAL_NAME, seq - 1))
+                self.reject(seq, payload, e)
+                db.write_rows([], (JOURNAL_NAME, seq))
+
+    def reject(self, seq, payload, error):
+        try:
+            record = {'seq': seq, 'sample': decode_sample(payload)}
+        except (ValueError, struct.error):
+            record = {'seq': seq, 'payload': bytes(payload).hex()}
+        record['error'] = str(error)
+        with open(os.path.join(self.journal.directory, REJECT_LOG), 'a') as f:
+            f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        SAMPLES_REJECTED.inc()
+        logging.error(f"Moved journaled sample {seq} to {REJECT_LOG}: {error}")
+
+    def write_extras(self, db):
+        with self.lock:
+            processes, self.processes = self.processes, []
+            states, self.states = self.states, {}
+        try:
+            if processes:
+                db.write_processes(processes)
+            for host, state in states.items():
+                db.save_detector_state(host, state)
+        except sqlite3.Error:
+            with self.lock:
+                self.processes = processes + self.processes
+                self.states = {**states, **self.states}
+            raise
+
+    def stop(self, timeout=None):
+        """Commit everything journaled so far and stop."""
+        self.stopping = True
+        self.journal.wake()
+        self.join(timeout)
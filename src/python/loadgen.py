@@ -0,0 +1,193 @@
+# SysMoniTool/src/python/loadgen.py
+"""Synthetic load for benchmarks: fake collectors and pre-filled databases.
+
+SyntheticCollector speaks the collector's CSV protocol. In 'push' mode it
+opens one connection per simulated host to an ingest server and names each
+with a '#host' line, like ``monitor INTERVAL_MS SERVER PORT``; in 'serve'
+mode it listens like the C++ monitor until a MetricsReceiver connects.
+
+With stamp=True the network_usage field carries the wall-clock send time in
+epoch milliseconds, so the receiving side can measure collector-to-commit
+latency per sample.
+
+fill_database() writes rows through Database.insert_many, spreading them
+evenly over the last few days so they stay inside the raw retention.
+"""
+import argparse
+import math
+import socket
+import sys
+import time
+from database import Database, ms_to_timestamp, DAY_MS
+
+# Records sent per sendall() when catching up or running unthrottled
+SEND_BATCH = 500
+FILL_BATCH = 50000
+DEFAULT_FILL_SPAN_MS = 7 * DAY_MS
+
+
+def synthetic_metrics(i, host_index=0):
+    """Deterministic, plausible (cpu, memory, disk, network) for sample i of a host."""
+    phase = i / 600.0 + host_index
+    cpu = 40.0 + 30.0 * math.sin(phase) + (i * 7919 + host_index * 104729) % 17
+    memory = 55.0 + 10.0 * math.sin(phase / 10.0)
+    disk = 20.0 + 15.0 * math.sin(phase * 3.0) + (i * 31) % 5
+    network = 5.0 + 4.0 * math.cos(phase * 2.0)
+    return cpu, memory, disk, network
+
+
+def format_record(values, timestamp):
+    cpu, memory, disk, network = values
+    return f"{cpu:.2f},{memory:.2f},{disk:.2f},{network:.3f},{timestamp}\n"
+
+
+class SyntheticCollector:
+    """Streams synthetic samples at rate per host (0: as fast as possible).
+
+    Stops after count samples per host or duration seconds, whichever comes
+    first; run() returns the total number of samples sent.
+    """
+
+    def __init__(self, host='127.0.0.1', port=12400, rate=1.0, hosts=1, mode='push',
+                 count=None, duration=None, stamp=False, host_prefix='synthetic'):
+        if mode not in ('push', 'serve'):
+            raise ValueError(f"Unknown collector mode: {mode}")
+        if count is None and duration is None:
+            raise ValueError("Either count or duration is required")
+        self.host = host
+        self.port = port
+        self.rate = rate
+        self.hosts = 1 if mode == 'serve' else hosts
+        self.mode = mode
+        self.count = count
+        self.duration = duration
+        self.stamp = stamp
+        self.host_prefix = host_prefix
+
+    def connect(self):
+        if self.mode == 'serve':
+            with socket.create_server((self.host, self.port)) as server:
+                conn, _ = server.accept()
+            return [conn]
+        connections = []
+        for index in range(self.hosts):
+            conn = socket.create_connection((self.host, self.port))
+            conn.sendall(f"#host {self.host_prefix}-{index}\n".encode())
+            connections.append(conn)
+        return connections
+
+    def records(self, host_index, first, last):
+        now_ms = time.time() * 1000
+        timestamp = ms_to_timestamp(int(now_ms))
+        lines = []
+        for i in range(first, last):
+            cpu, memory, disk, network = synthetic_metrics(i, host_index)
+            if self.stamp:
+                network = now_ms
+            lines.append(format_record((cpu, memory, disk, network), timestamp))
+        return ''.join(lines).encode()
+
+    def run(self):
+        connections = self.connect()
+        sent = [0] * len(connections)
+        limit = self.count if self.count is not None else float('inf')
+        start = time.monotonic()
+        deadline = start + self.duration if self.duration is not None else float('inf')
+        try:
+            while True:
+                now = time.monotonic()
+                if now >= deadline or min(sent) >= limit:
+                    break
+                due = limit if self.rate <= 0 else min(limit, int((now - start) * self.rate) + 1)
+                for index, conn in enumerate(connections):
+                    if sent[index] < due:
+                        last = int(min(due, sent[index] + SEND_BATCH))
+                        conn.sendall(self.records(index, sent[index], last))
+                        sent[index] = last
+                if self.rate > 0 and min(sent) >= due:
+                    time.sleep(max(0.0, min(deadline, start + due / self.rate) - time.monotonic()))
+        finally:
+            for conn in connections:
+                try:
+                    conn.shutdown(socket.SHUT_WR)
+                except OSError:
+                    pass
+                conn.close()
+        return sum(sent)
+
+
+def fill_database(db_path, rows, hosts=1, span_ms=DEFAULT_FILL_SPAN_MS, end_ms=None,
+                  batch_size=FILL_BATCH, progress=None):
+    """Append rows synthetic samples split across hosts, evenly spaced over span_ms up to end_ms.
+
+    Returns (first_ms, last_ms) of the generated samples.
+    """
+    if end_ms is None:
+        end_ms = int(time.time() * 1000)
+    per_host = max(1, rows // hosts)
+    interval_ms = max(1, span_ms // per_host)
+    first_ms = end_ms - interval_ms * per_host
+    db = Database(db_path)
+    try:
+        batch = []
+        written = 0
+        for i in range(per_host):
+            ts_ms = first_ms + i * interval_ms
+            timestamp = ms_to_timestamp(ts_ms)
+            for host_index in range(hosts):
+                cpu, memory, disk, network = synthetic_metrics(i, host_index)
+                batch.append({'timestamp': timestamp, 'ts_epoch_ms': ts_ms, 'cpu_usage': cpu,
+                              'memory_usage': memory, 'disk_io': disk, 'network_usage': network,
+                              'host': f'synthetic-{host_index}'})
+            if len(batch) >= batch_size:
+                db.insert_many(batch)
+                written += len(batch)
+                batch = []
+                if progress is not None:
+                    progress(written)
+        db.insert_many(batch)
+    finally:
+        db.close()
+    return first_ms, first_ms + interval_ms * (per_host - 1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Synthetic metrics load generator')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    collect = commands.add_parser('collect', help='Stream synthetic samples over the CSV protocol')
+    collect.add_argument('--mode', choices=['push', 'serve'], default='push',
+                         help='push to an ingest server, or serve like the C++ monitor')
+    collect.add_argument('--host', default='127.0.0.1', help='Server address (push) or bind address (serve)')
+    collect.add_argument('--port', type=int, default=12400)
+    collect.add_argument('--rate', type=float, default=1.0, help='Samples per second per host (0: unthrottled)')
+    collect.add_argument('--hosts', type=int, default=1, help='Simulated hosts, one connection each')
+    collect.add_argument('--count', type=int, help='Samples per host')
+    collect.add_argument('--duration', type=float, help='Seconds to run')
+    collect.add_argument('--stamp', action='store_true',
+                         help='Send the send time in network_usage, for latency measurement')
+
+    fill = commands.add_parser('fill', help='Fill a database with synthetic rows')
+    fill.add_argument('db', help='Database file')
+    fill.add_argument('rows', type=int, help='Rows to write, e.g. 1000000')
+    fill.add_argument('--hosts', type=int, default=1)
+    fill.add_argument('--days', type=float, default=DEFAULT_FILL_SPAN_MS / DAY_MS,
+                      help='Days the rows are spread over, ending now')
+    args = parser.parse_args()
+
+    if args.command == 'collect':
+        if args.count is None and args.duration is None:
+            parser.error('collect needs --count or --duration')
+        collector = SyntheticCollector(args.host, args.port, args.rate, args.hosts, args.mode,
+                                       args.count, args.duration, args.stamp)
+        print(collector.run())
+    else:
+        started = time.perf_counter()
+        fill_database(args.db, args.rows, args.hosts, int(args.days * DAY_MS),
+                      progress=lambda n: print(f"{n} rows", file=sys.stderr))
+        elapsed = time.perf_counter() - started
+        print(f"Wrote {args.rows} rows in {elapsed:.1f}s ({args.rows / elapsed:.0f} rows/s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+# SysMoniTool/src/python/processes.py
+"""Per-process sampler keeping state between ticks.
+
+Every tick the sampler lists /proc, re-reads /proc/<pid>/stat for each
+process and turns the change in CPU time since the previous tick into a CPU
+percentage. The stat files of known processes stay open (up to a descriptor
+budget) and are re-read with os.pread, so a steady-state tick opens only the
+files of processes that started since the last one. Process names are read
+once per process, and /proc/<pid>/io is only read for processes that used
+CPU since the last tick, since a process that did not run issued no I/O.
+
+sample() returns the union of the top N processes by CPU, by resident memory
+and by I/O rate, which is what gets stored next to each metrics sample.
+"""
+import heapq
+import os
+import resource
+import time
+
+DEFAULT_TOP_N = 5
+CLOCK_TICKS = os.sysconf('SC_CLK_TCK')
+PAGE_SIZE = os.sysconf('SC_PAGE_SIZE')
+READ_SIZE = 4096
+
+
+class ProcessState:
+    __slots__ = ('fd', 'start_time', 'name', 'cpu_ticks', 'io_bytes',
+                 'cpu_percent', 'rss_bytes', 'io_rate')
+
+    def __init__(self, fd, start_time, name):
+        self.fd = fd
+        self.start_time = start_time
+        self.name = name
+        self.cpu_ticks = None
+        self.io_bytes = None
+        self.cpu_percent = 0.0
+        self.rss_bytes = 0
+        self.io_rate = 0.0
+
+
+def parse_stat(data):
+    """Return (name, cpu_ticks, start_time, rss_pages) from /proc/<pid>/stat contents."""
+    # The command name is in parentheses and may itself contain spaces or ')'
+    close = data.rindex(b')')
+    name = data[data.index(b'(') + 1:close].decode(errors='replace')
+    fields = data[close + 2:].split()
+    # fields[0] is field 3 (state) of proc(5)
+    return name, int(fields[11]) + int(fields[12]), int(fields[19]), int(fields[21])
+
+
+class ProcessSampler:
+    def __init__(self, top_n=DEFAULT_TOP_N, proc_root='/proc', max_open_files=None):
+        self.top_n = top_n
+        self.proc_root = proc_root
+        if max_open_files is None:
+            # Leave most of the descriptor limit to the rest of the process
+            max_open_files = resource.getrlimit(resource.RLIMIT_NOFILE)[0] // 2
+        self.max_open_files = max_open_files
+        self.open_files = 0
+        self.processes = {}
+        self.last_time = None
+
+    def read_stat(self, pid, state):
+        if state is not None and state.fd is not None:
+            return os.pread(state.fd, READ_SIZE, 0)
+        with open(os.path.join(self.proc_root, str(pid), 'stat'), 'rb') as f:
+            return f.read()
+
+    def track(self, pid):
+        """Start tracking a new process; returns its state, or None if it is already gone."""
+        path = os.path.join(self.proc_root, str(pid), 'stat')
+        fd = None
+        try:
+            if self.open_files < self.max_open_files:
+                fd = os.open(path, os.O_RDONLY)
+                self.open_files += 1
+                data = os.pread(fd, READ_SIZE, 0)
+            else:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            name, _, start_time, _ = parse_stat(data)
+        except (OSError, ValueError, IndexError):
+            self.release(fd)
+            return None
+        return ProcessState(fd, start_time, name)
+
+    def release(self, fd):
+        if fd is not None:
+            os.close(fd)
+            self.open_files -= 1
+
+    def read_io(self, pid):
+        """Bytes read plus written by the process so far, or None if not permitted."""
+        try:
+            with open(os.path.join(self.proc_root, str(pid), 'io'), 'rb') as f:
+                data = f.read()
+        except OSError:
+            return None
+        total = 0
+        for line in data.split(b'\n'):
+            if line.startswith(b'read_bytes:') or line.startswith(b'write_bytes:'):
+                total += int(line.split()[1])
+        return total
+
+    def sample(self):
+        """Update every process and return the top ones as (pid, name, cpu %, rss bytes, io bytes/s) tuples."""
+        now = time.monotonic()
+        elapsed = None if self.last_time is None else max(now - self.last_time, 0.001)
+        self.last_time = now
+
+        seen = set()
+        for entry in os.listdir(self.proc_root):
+            if not entry.isdigit():
+                continue
+            pid = int(entry)
+            state = self.processes.get(pid)
+            if state is None:
+                state = self.track(pid)
+                if state is None:
+                    continue
+                self.processes[pid] = state
+            try:
+                _, cpu_ticks, start_time, rss_pages = parse_stat(self.read_stat(pid, state))
+            except (OSError, ValueError, IndexError):
+                # Exited between listing and reading
+                continue
+            if start_time != state.start_time:
+                # PID reused by a new process; start over next tick
+                continue
+            seen.add(pid)
+
+            state.rss_bytes = rss_pages * PAGE_SIZE
+            first = state.cpu_ticks is None
+            if first or elapsed is None:
+                state.cpu_percent = 0.0
+                busy = False
+            else:
+                delta = cpu_ticks - state.cpu_ticks
+                state.cpu_percent = 100.0 * delta / CLOCK_TICKS / elapsed
+                busy = delta > 0
+            state.cpu_ticks = cpu_ticks
+
+            if busy or first:
+                io_bytes = self.read_io(pid)
+                if io_bytes is not None and state.io_bytes is not None and elapsed is not None:
+                    state.io_rate = max(io_bytes - state.io_bytes, 0) / elapsed
+                else:
+                    state.io_rate = 0.0
+                state.io_bytes = io_bytes
+            else:
+                state.io_rate = 0.0
+
+        for pid in [pid for pid in self.processes if pid not in seen]:
+            self.release(self.processes.pop(pid).fd)
+
+        return self.top(self.top_n)
+
+    def top(self, n):
+        states = self.processes.items()
+        chosen = {}
+        for key in (lambda s: s[1].cpu_percent, lambda s: s[1].rss_bytes, lambda s: s[1].io_rate):
+            for pid, state in heapq.nlargest(n, states, key=key):
+                # Idle processes only fill the list when few are active
+                if key((pid, state)) > 0:
+                    chosen[pid] = state
+        return [
+            (pid, state.name, state.cpu_percent, state.rss_bytes, state.io_rate)
+            for pid, state in sorted(chosen.items(), key=lambda s: s[1].cpu_percent, reverse=True)
+        ]
+
+    def close(self):
+        for state in self.processes.values():
+            self.release(state.fd)
+        self.processes = {}
@@ -0,0 +1,190 @@
+# SysMoniTool/src/python/protocol.py
+"""Framing for the collector -> receiver metrics stream.
+
+The collector keeps one TCP connection open and writes one newline-terminated
+CSV record per sample:
+
+    cpu_usage,memory_usage,disk_io,network_usage,timestamp\\n
+
+Older collectors sent a single unterminated record per connection and then
+closed it; that case is handled by flushing the partial buffer on EOF.
+
+Collectors started with --binary send binary frames instead, which may be
+mixed freely with CSV records on the same stream. A frame is an 8-byte
+little-endian header
+
+    magic (2 bytes, 0x93 'S'), version (u8), fields (u8), count (u16), reserved (u16)
+
+followed by `count` samples, each an int64 epoch-milliseconds timestamp and
+`fields` float64 values (cpu_usage, memory_usage, disk_io, network_usage, then
+any fields added by later versions). The magic's first byte can never start
+a CSV line. Receivers ignore trailing fields they do not know, so collectors
+can append metrics without breaking older receivers; `version` is bumped only
+for incompatible layout changes.
+"""
+import math
+import struct
+from database import ms_to_timestamp
+
+MAX_RECORD_SIZE = 1024
+RECV_SIZE = 4096
+
+FRAME_MAGIC = b'\x93S'
+FRAME_VERSION = 1
+FRAME_HEADER = struct.Struct('<2sBBHH')
+# cpu_usage, memory_usage, disk_io and network_usage
+FRAME_FIELDS = 4
+MAX_FRAME_SIZE = 64 * 1024
+
+_sample_structs = {}
+
+
+def _sample_struct(fields):
+    sample = _sample_structs.get(fields)
+    if sample is None:
+        sample = _sample_structs[fields] = struct.Struct('<q' + 'd' * fields)
+    return sample
+
+
+def frame_size(header):
+    """Total size of the frame starting with header (bytes-like); ValueError if invalid."""
+    magic, version, fields, count, _ = FRAME_HEADER.unpack_from(header)
+    if magic != FRAME_MAGIC:
+        raise ValueError("Not a binary frame")
+    if version != FRAME_VERSION:
+        raise ValueError(f"Unsupported frame version {version}")
+    if fields < FRAME_FIELDS:
+        raise ValueError(f"Frame has {fields} fields, expected at least {FRAME_FIELDS}")
+    size = FRAME_HEADER.size + count * 8 * (fields + 1)
+    if size > MAX_FRAME_SIZE:
+        raise ValueError(f"Frame of {size} bytes exceeds {MAX_FRAME_SIZE} bytes")
+    return size
+
+
+def encode_frame(samples, fields=FRAME_FIELDS):
+    """Pack (epoch_ms, cpu, memory, disk, network, ...) tuples into one frame."""
+    sample = _sample_struct(fields)
+    frame = bytearray(FRAME_HEADER.size + len(samples) * sample.size)
+    FRAME_HEADER.pack_into(frame, 0, FRAME_MAGIC, FRAME_VERSION, fields, len(samples), 0)
+    offset = FRAME_HEADER.size
+    for values in samples:
+        sample.pack_into(frame, offset, *values)
+        offset += sample.size
+    return bytes(frame)
+
+
+def parse_frame(frame):
+    """Decode a complete binary frame (bytes-like) into a list of metrics dicts.
+
+    Values are unpacked straight from the buffer; each dict also carries
+    ts_epoch_ms so the timestamp never has to be parsed back. Raises
+    ValueError for a malformed frame or one carrying NaN or infinite values.
+    """
+    view = memoryview(frame)
+    size = frame_size(view)
+    if len(view) != size:
+        raise ValueError(f"Frame is {len(view)} bytes, header says {size}")
+    fields = view[3]
+    samples = []
+    for values in _sample_struct(fields).iter_unpack(view[FRAME_HEADER.size:]):
+        ms = values[0]
+        _check_finite(values[1:FRAME_FIELDS + 1])
+        samples.append({
+            'cpu_usage': values[1],
+            'memory_usage': values[2],
+            'disk_io': values[3],
+            'network_usage': values[4],
+            'timestamp': ms_to_timestamp(ms),
+            'ts_epoch_ms': ms,
+        })
+    return samples
+
+
+def parse_records(record):
+    """Decode one record from RecordBuffer (CSV line or binary frame) into a list of samples.
+
+    Invalid CSV records yield an empty list; ValueError is raised for
+    unparseable or non-finite numbers and malformed frames.
+    """
+    if record[:2] == FRAME_MAGIC:
+        return parse_frame(record)
+    metrics = parse_record(record)
+    return [metrics] if metrics else []
+
+
+def parse_record(record):
+    """Parse one CSV record (bytes, without the newline) into a metrics dict.
+
+    Returns None if the record does not have exactly five fields; raises
+    ValueError if a numeric field cannot be parsed or is NaN or infinite.
+    """
+    values = record.decode().strip().split(',')
+    if len(values) != 5:
+        return None
+
+    numbers = [float(value) for value in values[:4]]
+    _check_finite(numbers)
+    return {
+        'cpu_usage': numbers[0],
+        'memory_usage': numbers[1],
+        'disk_io': numbers[2],
+        'network_usage': numbers[3],
+        'timestamp': values[4]
+    }
+
+
+def _check_finite(values):
+    # float() accepts "nan" and "inf", and a frame can carry any bit pattern;
+    # either would stick in the rule windows and the EWMA baselines
+    for value in values:
+        if not math.isfinite(value):
+            raise ValueError(f"Non-finite metric value {value}")
+
+
+class RecordBuffer:
+    """Accumulates raw socket reads and splits them into complete records.
+
+    A record is either a CSV line (without its newline) or a whole binary
+    frame including its header.
+    """
+
+    def __init__(self, max_record_size=MAX_RECORD_SIZE):
+        self.max_record_size = max_record_size
+        self.buffer = bytearray()
+
+    def feed(self, data):
+        self.buffer += data
+
+    def next_record(self):
+        """Return the next complete record, or None if only a partial one is buffered."""
+        if self.buffer[:1] == FRAME_MAGIC[:1]:
+            if len(self.buffer) < FRAME_HEADER.size:
+                return None
+            try:
+                end = frame_size(self.buffer)
+            except ValueError:
+                # The stream cannot be resynchronised inside a bad frame
+                self.buffer.clear()
+                raise
+            if len(self.buffer) < end:
+                return None
+            record = bytes(self.buffer[:end])
+            del self.buffer[:end]
+            return record
+
+        end = self.buffer.find(b'\n')
+        if end < 0:
+            if len(self.buffer) > self.max_record_size:
+                self.buffer.clear()
+                raise ValueError(f"Record exceeds {self.max_record_size} bytes without a terminator")
+            return None
+
+        record = bytes(self.buffer[:end])
+        del self.buffer[:end + 1]
+        return record
+
+    def flush(self):
+        """Return and discard whatever partial record is left in the buffer."""
+        record = bytes(self.buffer)
+        self.buffer.clear()
+        return record
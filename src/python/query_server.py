@@ -0,0 +1,460 @@
+# SysMoniTool/src/python/query_server.py
+"""Resident query service for the CLI.
+
+    python3 src/python/query_server.py [--db data/logs.db] [--socket data/query.sock]
+
+Keeps one read-only Database open (warm page cache, mapped cold blocks)
+and answers requests on a local Unix socket, one JSON object per line:
+``{"method": ..., "args": [...], "kwargs": {...}}`` answered with
+``{"result": ...}`` or ``{"error": ...}``. Only the read methods in SERVED
+are available.
+
+Past data does not change, so the encoded response for a request whose
+range ended at least CLOSED_AFTER_MS before the committed high-water mark
+(for rollups: whose last bucket did) is kept in an LRU cache bounded in
+bytes and sent again as is. The high-water mark is the newest minute with
+committed samples of the host furthest behind (see committed_ms()), so a
+persister backlog, a journal replay or a lagging collector keeps its range
+uncached until its samples are in. A sample can still arrive late into a
+closed range (a replayed journal, a collector catching up), so the cache
+key includes the range's sample count from the daily rollup (see
+written_token()) and such a write makes the old entry unreachable.
+Retention and archiving change past results too: the cache is cleared
+whenever the set of partitions or archived files changes. Ranges still open
+and live lookups (latest sample, hosts, thresholds) are always answered from
+SQLite.
+
+Clients are served by one thread with non-blocking sockets: replies are
+queued per connection and the client is not read from again until it has
+taken them, so one that stops reading only holds up itself.
+
+The CLI uses RemoteDatabase when the socket exists and falls back to its own
+SQLite connection when the service is not running or a call fails.
+"""
+import argparse
+import json
+import logging
+import os
+import selectors
+import socket
+import sqlite3
+import time
+from collections import OrderedDict
+from database import Database, DAY_MS
+import rollups
+import sketches
+
+DEFAULT_SOCKET = 'data/query.sock'
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+# Slack for samples still in flight (in a batch or on the network); a range
+# is treated as final once it ended this long before the high-water mark
+CLOSED_AFTER_MS = 60 * 1000
+# A host that has not reported for this long no longer holds the
+# high-water mark back
+ACTIVE_HOST_MS = DAY_MS
+# A connected client that neither sends requests nor takes replies for
+# longer is dropped
+IDLE_TIMEOUT = 60.0
+MAX_REQUEST_BYTES = 1024 * 1024
+# How often serve_forever() checks for idle clients and shutdown()
+POLL_INTERVAL = 1.0
+CONNECT_TIMEOUT = 0.5
+
+
+def encode_stats(result):
+    merged, covered_ms, above_ms = result
+    return [{field: sketch.encode().hex() for field, sketch in merged.items()}, covered_ms, above_ms]
+
+
+def decode_stats(result):
+    merged, covered_ms, above_ms = result
+    return ({field: sketches.Sketch.decode(bytes.fromhex(blob)) for field, blob in merged.items()},
+            covered_ms, above_ms)
+
+
+def rows(result):
+    return [tuple(row) for row in result]
+
+
+def encode_row(result):
+    return list(result) if result is not None else None
+
+
+def row(result):
+    return tuple(result) if result is not None else None
+
+
+def processes(result):
+    tick, process_rows = result
+    return tick, rows(process_rows)
+
+
+def ceil_to(ms, size):
+    return -(-ms // size) * size
+
+
+# Served method: (encode result, decode result, last ms the answer depends
+# on given the bound arguments, or None if it is never cached)
+SERVED = {
+    'query_range': (list, rows, lambda a: a['end_ms']),
+    'query_rollup': (list, rows, lambda a: ceil_to(a['end_ms'], rollups.RESOLUTIONS[a['resolution']])),
+    'choose_resolution': (str, str, lambda a: ceil_to(a['end_ms'], rollups.RESOLUTIONS['1h'])),
+    'stats': (encode_stats, decode_stats, lambda a: a['end_ms']),
+    'get_latest_metrics': (encode_row, row, None),
+    'get_hosts': (list, list, None),
+    'get_thresholds': (dict, dict, None),
+    'query_processes': (list, processes, None),
+}
+
+
+class ResultCache:
+    """Encoded responses by request, least recently used evicted first, bounded by total bytes."""
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        value = self.entries.get(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def put(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        old = self.entries.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        while self.entries and self.size + len(value) > self.max_bytes:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
+        self.entries[key] = value
+        self.size += len(value)
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+
+class QueryServer:
+    def __init__(self, db_path='data/logs.db', socket_path=DEFAULT_SOCKET, cache_bytes=DEFAULT_CACHE_BYTES):
+        self.db_path = db_path
+        self.socket_path = socket_path
+        self.cache = ResultCache(cache_bytes)
+        self.db = None
+        self.sock = None
+        self.stopping = False
+        # Partitions and archived files the cached results were read from
+        self.generation = None
+
+    def open(self):
+        """Bind the socket, replacing a stale one; raises OSError if a server is already running."""
+        if os.path.exists(self.socket_path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.socket_path)
+                raise OSError(f"A query server is already listening on {self.socket_path}")
+            except (ConnectionRefusedError, FileNotFoundError):
+                os.remove(self.socket_path)
+            finally:
+                probe.close()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.bind(self.socket_path)
+        self.sock.listen(16)
+        return self
+
+    def database(self):
+        if self.db is None:
+            try:
+                self.db = Database(self.db_path, readonly=True)
+            except sqlite3.Error:
+                # Missing or older schema: create/migrate it once
+                Database(self.db_path).close()
+                self.db = Database(self.db_path, readonly=True)
+            # Read-only connection: a larger page cache and mapped I/O only
+            # affect this process
+            self.db.conn.execute('PRAGMA cache_size=-65536')
+            self.db.conn.execute('PRAGMA mmap_size=268435456')
+        return self.db
+
+    def handle(self, line, now_ms=None):
+        """The encoded response line for one request line."""
+        try:
+            request = json.loads(line)
+            method = request['method']
+            args, kwargs = request.get('args', []), request.get('kwargs', {})
+            encode, _, last_ms = SERVED[method]
+            # Server side only: the CLI imports this module for RemoteDatabase
+            import inspect
+            bound = inspect.signature(getattr(Database, method)).bind(None, *args, **kwargs)
+            bound.apply_defaults()
+        except (ValueError, KeyError, TypeError) as e:
+            return json.dumps({'error': f"Bad request: {e}"}).encode() + b'\n'
+
+        if now_ms is None:
+            now_ms = int(time.time() * 1000)
+        try:
+            cacheable = last_ms is not None and last_ms(bound.arguments) <= now_ms - CLOSED_AFTER_MS
+            if cacheable:
+                self.check_generation()
+                committed = self.committed_ms(bound.arguments.get('host'), now_ms)
+                cacheable = last_ms(bound.arguments) <= committed - CLOSED_AFTER_MS
+            key = None
+            if cacheable:
+                token = self.written_token(bound.arguments['start_ms'], last_ms(bound.arguments),
+                                           bound.arguments.get('host'))
+                key = json.dumps([method, args, kwargs, token], sort_keys=True)
+            if cacheable:
+                response = self.cache.get(key)
+                if response is not None:
+                    return response
+            result = encode(getattr(self.database(), method)(*args, **kwargs))
+            response = json.dumps({'result': result}).encode() + b'\n'
+        except Exception as e:
+            logging.error(f"Query {method} failed: {e}")
+            return json.dumps({'error': str(e)}).encode() + b'\n'
+        if cacheable:
+            self.cache.put(key, response)
+        return response
+
+    def check_generation(self):
+        """Clear the cache if partitions were created, expired or archived since the last check."""
+        db = self.database()
+        generation = db.conn.execute(
+            'SELECT COUNT(*), MIN(start_ms), MAX(start_ms) FROM metrics_partitions').fetchone()
+        if db.cold is not None:
+            generation += tuple(db.cold.names())
+        if generation != self.generation:
+            self.cache.clear()
+            self.generation = generation
+
+    def written_token(self, start_ms, end_ms, host):
+        """Samples committed in the days overlapping [start_ms, end_ms), from the daily rollup.
+
+        Every write updates the rollups in the same transaction, so a late
+        sample anywhere in the range changes it.
+        """
+        day = rollups.RESOLUTIONS['1d']
+        query = (f'SELECT TOTAL(sample_count) FROM {rollups.table_name("1d")} '
+                 'WHERE bucket_ms >= ? AND bucket_ms < ?')
+        params = (start_ms // day * day, end_ms)
+        if host is not None:
+            query += ' AND host = ?'
+            params += (host,)
+        return self.database().conn.execute(query, params).fetchone()[0]
+
+    def committed_ms(self, host, now_ms):
+        """The high-water mark: the start of the newest minute with committed samples.
+
+        That of host, or of the host furthest behind among those that
+        reported in the last ACTIVE_HOST_MS; now_ms if none did.
+        """
+        table = rollups.table_name('1m')
+        query = f'SELECT MAX(bucket_ms) AS newest FROM {table} WHERE bucket_ms >= ?'
+        params = (now_ms - ACTIVE_HOST_MS,)
+        if host is not None:
+            query += ' AND host = ?'
+            params += (host,)
+        row = self.database().conn.execute(
+            f'SELECT MIN(newest) FROM ({query} GROUP BY host)', params).fetchone()
+        return now_ms if row[0] is None else row[0]
+
+    def serve_forever(self):
+        # One thread and one warm connection, but any number of clients: a
+        # request is handled once its whole line has arrived, so an idle
+        # client (e.g. a CLI command that only reads locally) holds nothing
+        selector = selectors.DefaultSelector()
+        selector.register(self.sock, selectors.EVENT_READ)
+        # socket -> [bytes received so far, monotonic time of the last
+        # request or reply progress, replies not sent yet]
+        clients = {}
+        try:
+            while not self.stopping:
+                for key, events in selector.select(POLL_INTERVAL):
+                    if key.fileobj is self.sock:
+                        try:
+                            conn, _ = self.sock.accept()
+                        except OSError:
+                            if self.stopping:
+                                break
+                            raise
+                        conn.setblocking(False)
+                        clients[conn] = [b'', time.monotonic(), bytearray()]
+                        selector.register(conn, selectors.EVENT_READ)
+                    elif not self.serve_ready(key.fileobj, clients[key.fileobj], events):
+                        selector.unregister(key.fileobj)
+                        del clients[key.fileobj]
+                        key.fileobj.close()
+                    else:
+                        # Read no further requests until the replies are taken
+                        wanted = selectors.EVENT_WRITE if clients[key.fileobj][2] else selectors.EVENT_READ
+                        if wanted != key.events:
+                            selector.modify(key.fileobj, wanted)
+                idle_since = time.monotonic() - IDLE_TIMEOUT
+                for conn, (_, last, _) in list(clients.items()):
+                    if last < idle_since:
+                        selector.unregister(conn)
+                        del clients[conn]
+                        conn.close()
+        finally:
+            for conn in clients:
+                conn.close()
+            selector.close()
+            self.close()
+
+    def serve_ready(self, conn, client, events=selectors.EVENT_READ):
+        """Answer the complete request lines a client sent and send what it can take; False once it is gone."""
+        try:
+            if events & selectors.EVENT_READ:
+                data = conn.recv(65536)
+                if not data:
+                    return False
+                lines = (client[0] + data).split(b'\n')
+                client[0] = lines.pop()
+                if len(client[0]) > MAX_REQUEST_BYTES:
+                    return False
+                for line in lines:
+                    client[2] += self.handle(line)
+                client[1] = time.monotonic()
+            if client[2]:
+                sent = conn.send(client[2])
+                del client[2][:sent]
+                client[1] = time.monotonic()
+            return True
+        except BlockingIOError:
+            return True
+        except OSError:
+            return False
+
+    def shutdown(self):
+        """Make serve_forever() return, from another thread."""
+        self.stopping = True
+        sock = self.sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                # serve_forever() saw stopping first and closed it already
+                pass
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+            try:
+                os.remove(self.socket_path)
+            except FileNotFoundError:
+                pass
+        if self.db is not None:
+            self.db.close()
+            self.db = None
+
+
+class RemoteDatabase:
+    """Database stand-in for the CLI.
+
+    SERVED methods are answered by the query server, connected to on the
+    first such call; everything else, and any call the server cannot
+    answer, goes to a local Database opened by open_local() on first use.
+    """
+
+    def __init__(self, socket_path, open_local, timeout=CONNECT_TIMEOUT):
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self.sock = None
+        self.reader = None
+        # Set once the server could not be reached; everything then goes local
+        self.unavailable = False
+        self.open_local = open_local
+        self.local = None
+
+    @classmethod
+    def connect(cls, socket_path, open_local, timeout=CONNECT_TIMEOUT):
+        """A connected RemoteDatabase, or None if no server is listening on socket_path."""
+        remote = cls(socket_path, open_local, timeout)
+        return remote if remote.connection() is not None else None
+
+    def connection(self):
+        """The socket to the server, connecting on first use; None if it is unavailable."""
+        if self.sock is None and not self.unavailable:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.socket_path)
+            except OSError:
+                sock.close()
+                self.unavailable = True
+                return None
+            sock.settimeout(None)
+            self.sock, self.reader = sock, sock.makefile('rb')
+        return self.sock
+
+    def local_db(self):
+        if self.local is None:
+            self.local = self.open_local()
+        return self.local
+
+    def call(self, method, *args, **kwargs):
+        sock = self.connection()
+        if sock is not None:
+            try:
+                sock.sendall(json.dumps({'method': method, 'args': args, 'kwargs': kwargs}).encode() + b'\n')
+                response = json.loads(self.reader.readline())
+                if 'result' in response:
+                    return SERVED[method][1](response['result'])
+            except (OSError, ValueError):
+                self.disconnect()
+        return getattr(self.local_db(), method)(*args, **kwargs)
+
+    def __getattr__(self, name):
+        if name in SERVED:
+            return lambda *args, **kwargs: self.call(name, *args, **kwargs)
+        return getattr(self.local_db(), name)
+
+    def disconnect(self):
+        self.unavailable = True
+        if self.sock is not None:
+            self.reader.close()
+            self.sock.close()
+            self.sock = None
+
+    def close(self):
+        self.disconnect()
+        if self.local is not None:
+            self.local.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve CLI queries from a warm, caching process')
+    parser.add_argument('--db', default='data/logs.db', help='Database file')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET, help='Unix socket to listen on')
+    parser.add_argument('--cache-mb', type=float, default=DEFAULT_CACHE_BYTES / 1048576,
+                        help='Memory for cached results of closed ranges')
+    args = parser.parse_args()
+
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    import signal
+    import sys
+    from supervisor import notify_ready
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    server = QueryServer(args.db, args.socket, int(args.cache_mb * 1048576)).open()
+    logging.info(f"Query server listening on {args.socket}")
+    notify_ready()
+    try:
+        server.serve_forever()
+    finally:
+        server.close()
+
+
+if __name__ == '__main__':
+    main()
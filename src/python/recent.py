@@ -0,0 +1,168 @@
+# SysMoniTool/src/python/recent.py
+"""Recent-history ring buffer shared through a memory-mapped file.
+
+The receiver appends every sample to a fixed-size file holding one column
+per field (epoch ms, cpu, memory, disk, network) as packed float64 arrays.
+The CLI maps the same file read-only and answers "current" and "last N
+minutes" without opening SQLite.
+
+Layout: a 64-byte header followed by the five columns, `capacity` slots each.
+The header holds a sequence counter that is odd while the writer is updating
+a slot, so readers can detect and retry torn reads (a seqlock).
+"""
+import mmap
+import os
+import struct
+import time
+from database import ms_to_timestamp
+
+MAGIC = b'SMRH'
+VERSION = 1
+HEADER = struct.Struct('<4sIIIQQ')  # magic, version, capacity, reserved, seq, head
+HEADER_SIZE = 64
+SEQ_OFFSET = 16
+COLUMNS = 5
+
+# Four hours of 1 Hz samples
+DEFAULT_CAPACITY = 4 * 60 * 60
+# Torn reads retried before giving up and letting the caller use SQLite
+READ_RETRIES = 1000
+
+
+class RecentHistory:
+    """Writer/reader for the shared recent-history file.
+
+    Use RecentHistory.create() in the ingest process and RecentHistory.open()
+    in readers; open() returns None if no receiver has created the file.
+    """
+
+    def __init__(self, path, mm, capacity):
+        self.path = path
+        self.mm = mm
+        self.capacity = capacity
+        view = memoryview(mm)
+        size = 8 * capacity
+        self.columns = [
+            view[HEADER_SIZE + i * size:HEADER_SIZE + (i + 1) * size].cast('d')
+            for i in range(COLUMNS)
+        ]
+        self.seq, self.head = struct.unpack_from('<QQ', mm, SEQ_OFFSET)
+
+    @classmethod
+    def create(cls, path, capacity=DEFAULT_CAPACITY):
+        size = HEADER_SIZE + COLUMNS * 8 * capacity
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            header = os.pread(fd, HEADER.size, 0)
+            if len(header) == HEADER.size and os.fstat(fd).st_size == size:
+                magic, version, stored_capacity, _, seq, _ = HEADER.unpack(header)
+                reuse = (magic, version, stored_capacity) == (MAGIC, VERSION, capacity)
+            else:
+                reuse = False
+            if reuse:
+                if seq & 1:
+                    # The previous writer died mid-append; readers would
+                    # wait for it forever
+                    os.pwrite(fd, struct.pack('<Q', seq + 1), SEQ_OFFSET)
+            else:
+                os.ftruncate(fd, 0)
+                os.ftruncate(fd, size)
+                os.pwrite(fd, HEADER.pack(MAGIC, VERSION, capacity, 0, 0, 0), 0)
+            mm = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        return cls(path, mm, capacity)
+
+    @classmethod
+    def open(cls, path):
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            return None
+        try:
+            header = os.pread(fd, HEADER.size, 0)
+            if len(header) < HEADER.size:
+                return None
+            magic, version, capacity = HEADER.unpack(header)[:3]
+            if magic != MAGIC or version != VERSION:
+                return None
+            try:
+                mm = mmap.mmap(fd, HEADER_SIZE + COLUMNS * 8 * capacity, prot=mmap.PROT_READ)
+            except ValueError:
+                # Shorter than its header says: create() is resizing it
+                return None
+        finally:
+            os.close(fd)
+        return cls(path, mm, capacity)
+
+    def append(self, ts_ms, cpu_usage, memory_usage, disk_io, network_usage):
+        slot = self.head % self.capacity
+        self.seq += 1
+        struct.pack_into('<Q', self.mm, SEQ_OFFSET, self.seq)
+        self.columns[0][slot] = ts_ms
+        self.columns[1][slot] = cpu_usage
+        self.columns[2][slot] = memory_usage
+        self.columns[3][slot] = disk_io
+        self.columns[4][slot] = network_usage
+        self.head += 1
+        self.seq += 1
+        struct.pack_into('<QQ', self.mm, SEQ_OFFSET, self.seq, self.head)
+
+    def _read(self, since_ms, limit):
+        """Copy rows newest first until since_ms or limit; retries torn reads.
+
+        Returns (rows, covers), or None if no consistent copy could be made
+        within READ_RETRIES attempts.
+        """
+        for _ in range(READ_RETRIES):
+            seq, head = struct.unpack_from('<QQ', self.mm, SEQ_OFFSET)
+            if seq & 1:
+                time.sleep(0)
+                continue
+            oldest = max(0, head - self.capacity)
+            ts, cpu, memory, disk, network = self.columns
+            rows = []
+            # Whether a sample older than since_ms is still in the buffer,
+            # i.e. the rows returned are the complete window
+            covers = False
+            i = head - 1
+            while i >= oldest and len(rows) < limit:
+                slot = i % self.capacity
+                ms = int(ts[slot])
+                if ms < since_ms:
+                    covers = True
+                    break
+                rows.append((ms, cpu[slot], memory[slot], disk[slot], network[slot]))
+                i -= 1
+            if struct.unpack_from('<Q', self.mm, SEQ_OFFSET)[0] == seq:
+                return rows, covers
+        return None
+
+    def latest(self):
+        """Newest sample as a metrics row (id, timestamp, cpu, memory, disk, network), or None."""
+        result = self._read(0, 1)
+        if not result or not result[0]:
+            return None
+        row = result[0][0]
+        return (None, ms_to_timestamp(row[0])) + row[1:]
+
+    def latest_ms(self):
+        result = self._read(0, 1)
+        return result[0][0][0] if result and result[0] else None
+
+    def since(self, since_ms):
+        """Samples at or after since_ms, newest first, shaped like Database.query_range rows.
+
+        Returns None when the buffer does not reach back to since_ms or the
+        writer kept it busy, so the caller can fall back to the database.
+        """
+        result = self._read(since_ms, self.capacity)
+        if not result or not result[1]:
+            return None
+        return [(None, ms_to_timestamp(row[0])) + row[1:] for row in result[0]]
+
+    def close(self):
+        for column in self.columns:
+            column.release()
+        self.columns = []
+        self.mm.close()
@@ -0,0 +1,253 @@
+# SysMoniTool/src/python/replay.py
+"""Replay threshold rules over stored history ("what if").
+
+    replay = Replay([current, candidate])
+    for chunk in chunks:          # arrays of (ts_epoch_ms, cpu, memory, disk, network)
+        replay.feed(chunk)
+    replay.results                # [[RuleResult, ...] per thresholds dict]
+
+Each thresholds dict is compiled with RuleEngine.compile(), so keys and
+defaults are exactly those of the receiver, and every rule is evaluated
+over NumPy arrays a chunk at a time instead of sample by sample:
+
+- level rules: the value, or its moving average from a cumulative sum;
+- rate rules: change per second between each sample and the oldest one in
+  its window;
+- anomaly rules: the EWMA mean and variance per baseline slot are linear
+  recurrences, solved blockwise with cumulative sums (see recurrence());
+- breach state: a sample above trigger breaches, one at or below clear
+  clears, and in between the previous state carries over (a forward fill).
+  A breach fires at its first sample duration seconds after it started.
+
+Window tails, baselines and breach state carry over from one chunk to the
+next, so results do not depend on the chunk size. Baselines start empty:
+anomaly rules flag nothing until a slot has seen rules.WARMUP_SAMPLES
+values, as after a receiver's first start.
+"""
+import math
+import numpy as np
+from rules import RuleEngine, AnomalyRule, WARMUP_SAMPLES
+from rollups import METRIC_FIELDS
+
+# Rows converted to arrays at a time
+CHUNK_ROWS = 262144
+# Largest growth of c ** -k allowed within one block of recurrence(); bounds
+# the rounding error the blockwise solution adds
+MAX_BLOCK_GROWTH = 10.0
+
+COLUMNS = 'ts_epoch_ms, ' + ', '.join(METRIC_FIELDS)
+
+
+def recurrence(c, b, y0):
+    """y[k] = c * y[k-1] + b[k] for every k, starting from y[-1] = y0.
+
+    Within a block y[k] = c**(k+1) * (y0 + sum(b[j] * c**-(j+1) for j <= k)),
+    a cumulative sum; blocks are short enough that c**-(k+1) stays below
+    e**MAX_BLOCK_GROWTH.
+    """
+    out = np.empty(len(b))
+    if c >= 1.0:
+        np.cumsum(b, out=out)
+        return out + y0
+    block = max(1, int(MAX_BLOCK_GROWTH / -math.log(c)))
+    powers = c ** np.arange(1, min(block, len(b)) + 1)
+    for start in range(0, len(b), block):
+        end = min(start + block, len(b))
+        p = powers[:end - start]
+        out[start:end] = p * (y0 + np.cumsum(b[start:end] / p))
+        y0 = out[end - 1]
+    return out
+
+
+def forward_fill(mask, values, default):
+    """values at the last index where mask is set, up to each position; default before the first."""
+    index = np.where(mask, np.arange(len(mask)), -1)
+    np.maximum.accumulate(index, out=index)
+    return np.where(index >= 0, values[np.maximum(index, 0)], default)
+
+
+class RuleResult:
+    __slots__ = ('name', 'trigger', 'clear', 'duration', 'episodes', 'fires', 'first', 'last')
+
+    def __init__(self, rule):
+        self.name = rule.name
+        self.trigger = rule.trigger
+        self.clear = rule.clear
+        self.duration = rule.duration
+        # Breaches, breaches that fired, and the first and last firing time
+        # (seconds since the epoch)
+        self.episodes = 0
+        self.fires = 0
+        self.first = None
+        self.last = None
+
+
+class RuleReplay:
+    """One compiled rule evaluated over chunks of samples."""
+
+    def __init__(self, rule):
+        self.rule = rule
+        self.size = rule.window.size
+        self.result = RuleResult(rule)
+        # Last size - 1 samples of the previous chunk
+        self.tail_t = np.empty(0)
+        self.tail_v = np.empty(0)
+        if isinstance(rule, AnomalyRule):
+            self.baseline = np.zeros((rule.baseline.slots, 3))  # count, mean, variance
+        self.breached = False
+        self.breach_start = 0.0
+        self.fired = False
+
+    def signal(self, t, v):
+        """(times, signal) of the samples the rule checks."""
+        if isinstance(self.rule, AnomalyRule):
+            return self.anomaly(t, v)
+        if self.size == 1:
+            return t, v
+        n = len(self.tail_v)
+        all_t = np.concatenate((self.tail_t, t))
+        all_v = np.concatenate((self.tail_v, v))
+        self.tail_t, self.tail_v = all_t[-(self.size - 1):], all_v[-(self.size - 1):]
+        # Samples in each window: fewer than size until that many were seen
+        index = np.arange(n, len(all_v))
+        oldest = index - np.minimum(index + 1, self.size) + 1
+        if self.rule.kind == 'rate':
+            dt = all_t[index] - all_t[oldest]
+            with np.errstate(divide='ignore', invalid='ignore'):
+                rate = (all_v[index] - all_v[oldest]) / dt
+            return t, np.where(dt > 0, rate, 0.0)
+        total = np.concatenate(([0.0], np.cumsum(all_v)))
+        return t, (total[index + 1] - total[oldest]) / (index + 1 - oldest)
+
+    def anomaly(self, t, v):
+        baseline = self.rule.baseline
+        alpha, c = baseline.alpha, 1.0 - baseline.alpha
+        if baseline.slots == 1:
+            slots = np.zeros(len(t), dtype=np.int64)
+        else:
+            slots = ((t + baseline.utc_offset) // 3600).astype(np.int64) % baseline.slots
+        score = np.full(len(t), np.nan)
+        # Indexes grouped by slot, each group in time order
+        order = np.argsort(slots, kind='stable')
+        bounds = np.flatnonzero(np.diff(slots[order])) + 1
+        for index in np.split(order, bounds):
+            slot = slots[index[0]]
+            x = v[index]
+            count, mean, var = self.baseline[slot]
+            means, variances = np.empty(len(x)), np.empty(len(x))
+            first = 0
+            if count == 0:
+                # The first value becomes the mean as is
+                mean, means[0], variances[0], first = x[0], 0.0, 0.0, 1
+            rest = x[first:]
+            if len(rest):
+                # mean += alpha * diff; var = (1 - alpha) * (var + alpha * diff ** 2)
+                new_means = recurrence(c, alpha * rest, mean)
+                means[first:] = np.concatenate(([mean], new_means[:-1]))
+                diff = rest - means[first:]
+                new_variances = recurrence(c, c * alpha * diff * diff, var)
+                variances[first:] = np.concatenate(([var], new_variances[:-1]))
+                mean, var = new_means[-1], new_variances[-1]
+            counts = count + np.arange(len(x))
+            std = np.maximum(np.sqrt(variances), baseline.min_std)
+            score[index] = np.where(counts >= WARMUP_SAMPLES, (x - means) / std, np.nan)
+            self.baseline[slot] = (count + len(x), mean, var)
+        valid = ~np.isnan(score)
+        return t[valid], score[valid]
+
+    def key(self):
+        """Rules with the same key compute the same signal."""
+        rule = self.rule
+        if isinstance(rule, AnomalyRule):
+            baseline = rule.baseline
+            return (rule.metric, rule.kind, baseline.alpha, baseline.slots, baseline.min_std,
+                    baseline.utc_offset)
+        return (rule.metric, rule.kind if self.size > 1 else 'level', self.size)
+
+    def check(self, t, s):
+        """Update breach state and results with the rule's signal s at times t."""
+        if not len(t):
+            return
+        rule, result = self.rule, self.result
+        # 1 above trigger, 0 at or below clear, else unchanged
+        mark = np.where(s > rule.trigger, 1, np.where(s <= rule.clear, 0, -1))
+        breached = forward_fill(mark >= 0, mark, int(self.breached)).astype(bool)
+        before = np.concatenate(([self.breached], breached[:-1]))
+        starts = breached & ~before
+        result.episodes += int(starts.sum())
+        start_t = forward_fill(starts, t, self.breach_start)
+        # Breach 0 is the one carried over from the previous chunk
+        episode = np.cumsum(starts)
+        due = breached & (t - start_t >= rule.duration)
+        if self.fired:
+            due &= episode > 0
+        candidates = np.nonzero(due)[0]
+        fires = candidates[np.concatenate(([True], np.diff(episode[candidates]) != 0))] \
+            if len(candidates) else candidates
+        if len(fires):
+            result.fires += len(fires)
+            if result.first is None:
+                result.first = float(t[fires[0]])
+            result.last = float(t[fires[-1]])
+
+        self.breached = bool(breached[-1])
+        if self.breached:
+            self.breach_start = float(start_t[-1])
+            self.fired = bool(len(fires) and episode[fires[-1]] == episode[-1]) or \
+                (self.fired and episode[-1] == 0)
+
+
+class Replay:
+    """Evaluate several threshold sets over the same samples."""
+
+    def __init__(self, threshold_sets):
+        self.rules = [[RuleReplay(rule) for rule in RuleEngine.compile(thresholds).rules]
+                      for thresholds in threshold_sets]
+        # One signal per key, computed by the first rule with it and checked
+        # by all of them, so sets that differ only in levels cost little more
+        # than one
+        self.signals = {}
+        for rules in self.rules:
+            for rule in rules:
+                self.signals.setdefault(rule.key(), []).append(rule)
+        self.samples = 0
+        self.first_ms = None
+        self.last_ms = None
+
+    def feed(self, chunk):
+        """Evaluate an array of (ts_epoch_ms, cpu, memory, disk, network) rows in time order."""
+        if not len(chunk):
+            return
+        t = chunk[:, 0] / 1000.0
+        values = {field: chunk[:, 1 + i] for i, field in enumerate(METRIC_FIELDS)}
+        for rules in self.signals.values():
+            signal_t, signal = rules[0].signal(t, values[rules[0].rule.metric])
+            for rule in rules:
+                rule.check(signal_t, signal)
+        self.samples += len(chunk)
+        if self.first_ms is None:
+            self.first_ms = int(chunk[0, 0])
+        self.last_ms = int(chunk[-1, 0])
+
+    @property
+    def results(self):
+        return [[rule.result for rule in rules] for rules in self.rules]
+
+
+def chunks(rows, chunk_rows=CHUNK_ROWS):
+    """Arrays of up to chunk_rows rows from an iterator of (ts_epoch_ms, cpu, memory, disk, network)."""
+    from itertools import islice
+    while True:
+        chunk = np.array(list(islice(rows, chunk_rows)), dtype=np.float64)
+        if not len(chunk):
+            return
+        yield chunk
+
+
+def replay(db, start_ms, end_ms, threshold_sets, host, chunk_rows=CHUNK_ROWS):
+    """Replay threshold_sets over host's samples in [start_ms, end_ms); returns the Replay."""
+    result = Replay(threshold_sets)
+    rows = db.iter_range(start_ms, end_ms, host, newest_first=False, columns=COLUMNS, chunk_size=10000)
+    for chunk in chunks(rows, chunk_rows):
+        result.feed(chunk)
+    return result
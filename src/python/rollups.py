@@ -0,0 +1,242 @@
+# SysMoniTool/src/python/rollups.py
+"""Multi-resolution rollups of the raw metrics table.
+
+Each resolution has its own table (metrics_1m, metrics_1h, metrics_1d) with
+one row per host and bucket holding count, min, max, sum and last value of
+every metric, plus a quantile sketch per metric (see sketches.py). Rows are
+merged into the tables with an upsert as samples are written, so the rollups
+never need to be rebuilt from raw data. Buckets are aligned to UTC.
+"""
+from sketches import Sketch
+
+METRIC_FIELDS = ('cpu_usage', 'memory_usage', 'disk_io', 'network_usage')
+
+# Bucket width in milliseconds, finest first
+RESOLUTIONS = {
+    '1m': 60 * 1000,
+    '1h': 60 * 60 * 1000,
+    '1d': 24 * 60 * 60 * 1000,
+}
+
+# Range queries are answered from the finest resolution that returns at
+# most this many rows
+MAX_POINTS = 1000
+
+# Positions inside an aggregate list: count, last_ms, first_ms, then per
+# metric (min, max, sum, last), then one Sketch per metric
+COUNT, LAST_MS, FIRST_MS, FIRST_METRIC = 0, 1, 2, 3
+FIRST_SKETCH = FIRST_METRIC + 4 * len(METRIC_FIELDS)
+
+
+def table_name(resolution):
+    if resolution not in RESOLUTIONS:
+        raise ValueError(f"Unknown resolution: {resolution}")
+    return f'metrics_{resolution}'
+
+
+def create_table_sql(resolution, name=None):
+    columns = ''.join(
+        f', {field}_min REAL, {field}_max REAL, {field}_sum REAL, {field}_last REAL'
+        for field in METRIC_FIELDS
+    ) + ''.join(f', {field}_sketch BLOB' for field in METRIC_FIELDS)
+    return (f'CREATE TABLE IF NOT EXISTS {name or table_name(resolution)} ('
+            f'host TEXT NOT NULL, bucket_ms INTEGER, sample_count INTEGER, last_ms INTEGER, '
+            f'first_ms INTEGER{columns}, '
+            f'PRIMARY KEY (host, bucket_ms))')
+
+
+def create_index_sql(resolution):
+    # Cross-host range queries cannot use the (host, bucket_ms) key
+    table = table_name(resolution)
+    return f'CREATE INDEX IF NOT EXISTS idx_{table}_bucket ON {table} (bucket_ms)'
+
+
+def upsert_sql(resolution):
+    columns = ['host', 'bucket_ms', 'sample_count', 'last_ms', 'first_ms']
+    updates = ['sample_count = sample_count + excluded.sample_count',
+               'first_ms = min(first_ms, excluded.first_ms)']
+    for field in METRIC_FIELDS:
+        columns += [f'{field}_min', f'{field}_max', f'{field}_sum', f'{field}_last']
+        updates += [
+            f'{field}_min = min({field}_min, excluded.{field}_min)',
+            f'{field}_max = max({field}_max, excluded.{field}_max)',
+            f'{field}_sum = {field}_sum + excluded.{field}_sum',
+            f'{field}_last = CASE WHEN excluded.last_ms >= last_ms '
+            f'THEN excluded.{field}_last ELSE {field}_last END',
+        ]
+    for field in METRIC_FIELDS:
+        columns.append(f'{field}_sketch')
+        updates.append(f'{field}_sketch = sketch_merge({field}_sketch, excluded.{field}_sketch)')
+    # SET expressions all see the old row, so last_ms is updated last safely
+    updates.append('last_ms = max(last_ms, excluded.last_ms)')
+    placeholders = ', '.join('?' * len(columns))
+    return (f'INSERT INTO {table_name(resolution)} ({", ".join(columns)}) VALUES ({placeholders}) '
+            f'ON CONFLICT(host, bucket_ms) DO UPDATE SET {", ".join(updates)}')
+
+
+def select_sql(resolution, per_host=True, newest_first=True):
+    """Select (bucket_ms, sample_count, then avg/min/max/last per metric) over a range.
+
+    With per_host the query takes (host, start, end) parameters; otherwise
+    (start, end) and buckets are merged across hosts, with 'last' being the
+    mean of the hosts' last values.
+    """
+    table = table_name(resolution)
+    order = 'DESC' if newest_first else 'ASC'
+    if per_host:
+        columns = ''.join(
+            f', {field}_sum / sample_count, {field}_min, {field}_max, {field}_last'
+            for field in METRIC_FIELDS
+        )
+        return (f'SELECT bucket_ms, sample_count{columns} FROM {table} '
+                f'WHERE host = ? AND bucket_ms >= ? AND bucket_ms < ? ORDER BY bucket_ms {order}')
+
+    columns = ''.join(
+        f', SUM({field}_sum) / SUM(sample_count), MIN({field}_min), MAX({field}_max), AVG({field}_last)'
+        for field in METRIC_FIELDS
+    )
+    return (f'SELECT bucket_ms, SUM(sample_count){columns} FROM {table} '
+            f'WHERE bucket_ms >= ? AND bucket_ms < ? GROUP BY bucket_ms ORDER BY bucket_ms {order}')
+
+
+def sketch_select_sql(resolution, per_host=True):
+    """Select (sample_count, first_ms, last_ms, then one sketch per metric) over a range.
+
+    Parameters are as for select_sql(); rows are per host and bucket.
+    """
+    sketches = ''.join(f', {field}_sketch' for field in METRIC_FIELDS)
+    host = 'host = ? AND ' if per_host else ''
+    return (f'SELECT sample_count, first_ms, last_ms{sketches} FROM {table_name(resolution)} '
+            f'WHERE {host}bucket_ms >= ? AND bucket_ms < ?')
+
+
+def covered_ms(count, first_ms, last_ms):
+    """Estimated time that count samples taken evenly from first_ms to last_ms stand for."""
+    if count < 2:
+        return 0
+    return (last_ms - first_ms) * count / (count - 1)
+
+
+def aggregate(samples, size):
+    """Fold (ts_ms, cpu, memory, disk, network) tuples into {bucket_ms: aggregate}."""
+    buckets = {}
+    for sample in samples:
+        ts = sample[0]
+        bucket = ts - ts % size
+        agg = buckets.get(bucket)
+        if agg is None:
+            agg = [1, ts, ts]
+            for value in sample[1:]:
+                agg += (value, value, value, value)
+            for value in sample[1:]:
+                sketch = Sketch()
+                sketch.add(value)
+                agg.append(sketch)
+            buckets[bucket] = agg
+            continue
+
+        agg[COUNT] += 1
+        newer = ts >= agg[LAST_MS]
+        if newer:
+            agg[LAST_MS] = ts
+        elif ts < agg[FIRST_MS]:
+            agg[FIRST_MS] = ts
+        i = FIRST_METRIC
+        for value in sample[1:]:
+            if value < agg[i]:
+                agg[i] = value
+            if value > agg[i + 1]:
+                agg[i + 1] = value
+            agg[i + 2] += value
+            if newer:
+                agg[i + 3] = value
+            i += 4
+        i = FIRST_SKETCH
+        for value in sample[1:]:
+            agg[i].add(value)
+            i += 1
+    return buckets
+
+
+def coarsen(buckets, size):
+    """Merge finer aggregates (as returned by aggregate()) into buckets of the given size."""
+    merged = {}
+    for bucket, agg in buckets.items():
+        target = bucket - bucket % size
+        into = merged.get(target)
+        if into is None:
+            # Sketches are copied so the finer buckets stay intact
+            merged[target] = agg[:FIRST_SKETCH] + [Sketch(dict(s.counts)) for s in agg[FIRST_SKETCH:]]
+            continue
+
+        into[COUNT] += agg[COUNT]
+        newer = agg[LAST_MS] >= into[LAST_MS]
+        if newer:
+            into[LAST_MS] = agg[LAST_MS]
+        into[FIRST_MS] = min(into[FIRST_MS], agg[FIRST_MS])
+        for i in range(FIRST_METRIC, FIRST_SKETCH, 4):
+            into[i] = min(into[i], agg[i])
+            into[i + 1] = max(into[i + 1], agg[i + 1])
+            into[i + 2] += agg[i + 2]
+            if newer:
+                into[i + 3] = agg[i + 3]
+        for i in range(FIRST_SKETCH, len(agg)):
+            into[i].merge(agg[i])
+    return merged
+
+
+def aggregate_all(samples):
+    """Aggregate samples into every resolution: {resolution: {bucket_ms: aggregate}}."""
+    result = {}
+    buckets = None
+    for resolution, size in RESOLUTIONS.items():
+        buckets = aggregate(samples, size) if buckets is None else coarsen(buckets, size)
+        result[resolution] = buckets
+    return result
+
+
+def upsert_row(host, bucket, agg):
+    """Parameters for upsert_sql() from an aggregate list."""
+    return (host, bucket, *agg[:FIRST_SKETCH], *(sketch.encode() for sketch in agg[FIRST_SKETCH:]))
+
+
+def split_range(start_ms, end_ms):
+    """Cover [start_ms, end_ms) with the fewest whole rollup buckets.
+
+    Returns (pieces, remainder): pieces is a list of (resolution, start, end)
+    spans that consist of whole buckets of that resolution, coarsest
+    possible; remainder lists the sub-minute (start, end) edges, which only
+    raw data can answer.
+    """
+    pieces = []
+    spans = [(start_ms, end_ms)]
+    for resolution, size in sorted(RESOLUTIONS.items(), key=lambda item: -item[1]):
+        rest = []
+        for start, end in spans:
+            inner_start = -(-start // size) * size
+            inner_end = end - end % size
+            if inner_start >= inner_end:
+                rest.append((start, end))
+                continue
+            pieces.append((resolution, inner_start, inner_end))
+            if start < inner_start:
+                rest.append((start, inner_start))
+            if inner_end < end:
+                rest.append((inner_end, end))
+        spans = rest
+    return pieces, spans
+
+
+def choose_resolution(start_ms, end_ms, raw_count, max_points=MAX_POINTS):
+    """Pick the finest resolution that answers the range in at most max_points rows.
+
+    raw_count is the (estimated) number of raw samples in the range; 'raw' is
+    returned when that already fits.
+    """
+    if raw_count <= max_points:
+        return 'raw'
+    span = max(end_ms - start_ms, 1)
+    for resolution, size in RESOLUTIONS.items():
+        if span / size <= max_points:
+            return resolution
+    return resolution
@@ -0,0 +1,325 @@
+# SysMoniTool/src/python/rules.py
+"""Threshold rules evaluated over per-metric sliding windows.
+
+Thresholds are compiled into Rule objects. Every metric value is pushed into
+a fixed-size ring buffer that keeps a running sum, so a rule's signal (the
+raw value, a moving average or a rate of change) is computed in O(1) per
+sample.
+
+A rule becomes *breached* when its signal rises above `trigger`, and stays
+breached until the signal falls to `clear` or below (hysteresis). It *fires*
+once per breach, after the breach has lasted `duration` seconds.
+
+Recognised threshold keys; the level rule needs the base one:
+
+    cpu_usage              trigger level
+    cpu_usage_clear        clear level (default: 90% of trigger)
+    cpu_usage_duration     seconds the breach must last (default: 5)
+    cpu_usage_window       samples in the moving average (default: 1, raw value)
+    cpu_usage_rate         rate-of-change trigger, units per second
+    cpu_usage_rate_window  samples the rate is measured over (default: 5)
+
+Anomaly rules compare each value with a learned baseline instead of a fixed
+level: an exponentially weighted mean and variance (EWMA/EWMVar), optionally
+one per local hour of day so daily cycles are not flagged. Their signal is
+the z-score of the value against the baseline; state is a few floats per
+metric (per hour slot), updated in O(1) per sample, and can be saved with
+RuleEngine.state() and restored after a restart with RuleEngine.restore().
+
+    disk_io_anomaly            z-score trigger; enables the rule
+    disk_io_anomaly_clear      clear level (default: half the trigger)
+    disk_io_anomaly_duration   seconds the breach must last (default: 5)
+    disk_io_anomaly_halflife   samples after which a value's weight halves
+                               (default: 600, or 10800 per hour slot)
+    disk_io_anomaly_seasonal   1 for hour-of-day baselines (default), 0 for one
+    disk_io_anomaly_min_std    floor for the baseline deviation (default: 1.0)
+"""
+import math
+import time
+from array import array
+
+# metric -> (action script, alert type passed to the script, label, unit)
+METRIC_ACTIONS = {
+    'cpu_usage': ('./scripts/cleanup.sh', 'cpu', 'CPU usage', '%'),
+    'memory_usage': ('./scripts/alert.sh', 'memory', 'memory usage', '%'),
+    'disk_io': ('./scripts/cleanup.sh', 'disk', 'disk I/O', ' MB/s'),
+    'network_usage': ('./scripts/alert.sh', 'network', 'network usage', ' MB/s'),
+}
+
+# Thresholds the receiver starts from; stored ones (cli.py --config) override them
+DEFAULT_THRESHOLDS = {
+    'cpu_usage': 80.0,
+    'memory_usage': 90.0,
+    'disk_io': 100.0,  # MB/s
+    'network_usage': 50.0,  # MB/s
+    # Disk and network baselines vary too much for a fixed level to be
+    # enough; also flag values far above their usual hourly level
+    'disk_io_anomaly': 4.0,  # z-score
+    'network_usage_anomaly': 4.0
+}
+
+DEFAULT_DURATION = 5.0
+DEFAULT_CLEAR_RATIO = 0.9
+DEFAULT_RATE_WINDOW = 5
+DEFAULT_ANOMALY_CLEAR_RATIO = 0.5
+DEFAULT_HALFLIFE = 600
+DEFAULT_SEASONAL_HALFLIFE = 10800
+DEFAULT_MIN_STD = 1.0
+# Samples a baseline (slot) must have seen before it can flag anything
+WARMUP_SAMPLES = 60
+SEASONAL_SLOTS = 24
+
+
+class Window:
+    """Ring buffer of the last `size` (time, value) pairs with a running sum."""
+
+    __slots__ = ('size', 'values', 'times', 'index', 'count', 'total')
+
+    def __init__(self, size):
+        self.size = size
+        self.values = array('d', bytes(8 * size))
+        self.times = array('d', bytes(8 * size))
+        self.index = 0
+        self.count = 0
+        self.total = 0.0
+
+    def push(self, t, value):
+        i = self.index
+        if self.count == self.size:
+            self.total -= self.values[i]
+        else:
+            self.count += 1
+        self.values[i] = value
+        self.times[i] = t
+        self.total += value
+        self.index = (i + 1) % self.size
+
+    def last(self):
+        return self.values[self.index - 1]
+
+    def mean(self):
+        return self.total / self.count
+
+    def rate(self):
+        """Change per second between the oldest and newest sample in the window."""
+        newest = self.index - 1
+        oldest = (self.index - self.count) % self.size
+        dt = self.times[newest] - self.times[oldest]
+        if dt <= 0:
+            return 0.0
+        return (self.values[newest] - self.values[oldest]) / dt
+
+
+class Baseline:
+    """EWMA mean and variance of a series, optionally one per local hour of day.
+
+    State is (count, mean, variance) per slot in a flat array of doubles, so
+    it serialises to a few hundred bytes at most.
+    """
+
+    __slots__ = ('alpha', 'slots', 'min_std', 'state', 'utc_offset')
+
+    def __init__(self, halflife, slots=1, min_std=DEFAULT_MIN_STD):
+        self.alpha = 1.0 - 0.5 ** (1.0 / halflife)
+        self.slots = slots
+        self.min_std = min_std
+        self.state = array('d', bytes(8 * 3 * slots))
+        # Hour slots follow local time; a DST change shifts them by an hour
+        # until the next restart
+        self.utc_offset = time.localtime().tm_gmtoff
+
+    def slot(self, t):
+        if self.slots == 1:
+            return 0
+        return int((t + self.utc_offset) // 3600) % self.slots * 3
+
+    def update(self, t, value):
+        """Add value; returns (z-score, mean, std) against the baseline before it, z None while warming up."""
+        state = self.state
+        i = self.slot(t)
+        count, mean, var = state[i], state[i + 1], state[i + 2]
+        std = max(math.sqrt(var), self.min_std)
+        score = (value - mean) / std if count >= WARMUP_SAMPLES else None
+        if count == 0:
+            state[i + 1] = value
+        else:
+            diff = value - mean
+            increment = self.alpha * diff
+            state[i + 1] = mean + increment
+            state[i + 2] = (1.0 - self.alpha) * (var + diff * increment)
+        state[i] = count + 1
+        return score, mean, std
+
+    def dump(self):
+        return self.state.tobytes()
+
+    def load(self, blob):
+        """Restore from dump(); ignored (returns False) if the layout does not match."""
+        if len(blob) != len(self.state) * 8:
+            return False
+        self.state = array('d', blob)
+        return True
+
+
+class Rule:
+    __slots__ = ('name', 'metric', 'kind', 'trigger', 'clear', 'duration', 'window',
+                 'action', 'alert_type', 'breached', 'breach_start', 'fired')
+
+    def __init__(self, name, metric, trigger, clear=None, duration=0.0, kind='level'):
+        self.name = name
+        self.metric = metric
+        self.kind = kind
+        self.trigger = trigger
+        self.clear = trigger if clear is None else min(clear, trigger)
+        self.duration = duration
+        self.window = None
+        self.action, self.alert_type = METRIC_ACTIONS.get(metric, ('./scripts/alert.sh', metric))[:2]
+        self.breached = False
+        self.breach_start = 0.0
+        self.fired = False
+
+    def signal(self):
+        if self.kind == 'rate':
+            return self.window.rate()
+        if self.window.size == 1:
+            return self.window.last()
+        return self.window.mean()
+
+    def update(self, t):
+        """Re-evaluate after the window was updated; True when the rule fires."""
+        return self.check(self.signal(), t)
+
+    def check(self, value, t):
+        if not self.breached:
+            if value <= self.trigger:
+                return False
+            self.breached = True
+            self.breach_start = t
+            self.fired = False
+        elif value <= self.clear:
+            self.breached = False
+            return False
+
+        if not self.fired and t - self.breach_start >= self.duration:
+            self.fired = True
+            return True
+        return False
+
+    def describe(self, value):
+        label, unit = METRIC_ACTIONS.get(self.metric, (None, None, self.metric, ''))[2:]
+        if self.kind == 'rate':
+            return f"Rapidly rising {label} detected: {value}{unit}"
+        return f"High {label} detected: {value}{unit}"
+
+
+class AnomalyRule(Rule):
+    """Rule on the z-score of the latest value against a Baseline."""
+
+    __slots__ = ('baseline', 'mean', 'std')
+
+    def __init__(self, name, metric, trigger, baseline, clear=None, duration=0.0):
+        super().__init__(name, metric, trigger, clear, duration, kind='anomaly')
+        self.baseline = baseline
+        self.mean = 0.0
+        self.std = 0.0
+
+    def update(self, t):
+        score, self.mean, self.std = self.baseline.update(t, self.window.last())
+        if score is None:
+            return False
+        return self.check(score, t)
+
+    def describe(self, value):
+        label, unit = METRIC_ACTIONS.get(self.metric, (None, None, self.metric, ''))[2:]
+        return (f"Unusual {label} detected: {value}{unit} "
+                f"({(value - self.mean) / self.std:.1f} std above its {self.mean:.1f}{unit} baseline)")
+
+
+class RuleEngine:
+    def __init__(self, rules, window_sizes):
+        self.rules = rules
+        # One window per (metric, size), shared by rules that need the same one
+        self.windows = {}
+        for rule, size in zip(rules, window_sizes):
+            rule.window = self.windows.setdefault((rule.metric, size), Window(size))
+
+    @classmethod
+    def compile(cls, thresholds):
+        """Build an engine from a thresholds dict (see the module docstring for keys)."""
+        rules, sizes = [], []
+        for metric in METRIC_ACTIONS:
+            if metric in thresholds:
+                trigger = float(thresholds[metric])
+                rules.append(Rule(
+                    metric, metric, trigger,
+                    clear=thresholds.get(f'{metric}_clear', trigger * DEFAULT_CLEAR_RATIO),
+                    duration=thresholds.get(f'{metric}_duration', DEFAULT_DURATION)
+                ))
+                sizes.append(max(1, int(thresholds.get(f'{metric}_window', 1))))
+
+            rate = thresholds.get(f'{metric}_rate')
+            if rate is not None:
+                rules.append(Rule(
+                    f'{metric}_rate', metric, float(rate),
+                    duration=thresholds.get(f'{metric}_rate_duration', 0.0), kind='rate'
+                ))
+                sizes.append(max(2, int(thresholds.get(f'{metric}_rate_window', DEFAULT_RATE_WINDOW))))
+
+            anomaly = thresholds.get(f'{metric}_anomaly')
+            if anomaly is not None:
+                anomaly = float(anomaly)
+                seasonal = bool(thresholds.get(f'{metric}_anomaly_seasonal', 1))
+                baseline = Baseline(
+                    thresholds.get(f'{metric}_anomaly_halflife',
+                                   DEFAULT_SEASONAL_HALFLIFE if seasonal else DEFAULT_HALFLIFE),
+                    slots=SEASONAL_SLOTS if seasonal else 1,
+                    min_std=thresholds.get(f'{metric}_anomaly_min_std', DEFAULT_MIN_STD)
+                )
+                rules.append(AnomalyRule(
+                    f'{metric}_anomaly', metric, anomaly, baseline,
+                    clear=thresholds.get(f'{metric}_anomaly_clear', anomaly * DEFAULT_ANOMALY_CLEAR_RATIO),
+                    duration=thresholds.get(f'{metric}_anomaly_duration', DEFAULT_DURATION)
+                ))
+                sizes.append(1)
+        return cls(rules, sizes)
+
+    def evaluate(self, metrics, t):
+        """Push one sample taken at time t (seconds) and return the rules that fired."""
+        for (metric, _), window in self.windows.items():
+            window.push(t, metrics[metric])
+        return [rule for rule in self.rules if rule.update(t)]
+
+    def adopt(self, previous):
+        """Carry windows, breach state and baselines over from the engine this one replaces.
+
+        Windows of the same (metric, size) keep their samples, rules of the
+        same name stay breached/fired, and anomaly baselines with the same
+        layout keep what they learned, so a reload neither re-fires an alert
+        nor forgets recent history.
+        """
+        for key, window in previous.windows.items():
+            if key in self.windows:
+                mine = self.windows[key]
+                for rule in self.rules:
+                    if rule.window is mine:
+                        rule.window = window
+                self.windows[key] = window
+        old = {rule.name: rule for rule in previous.rules}
+        for rule in self.rules:
+            before = old.get(rule.name)
+            if before is not None and before.kind == rule.kind:
+                rule.breached, rule.breach_start, rule.fired = before.breached, before.breach_start, before.fired
+        self.restore(previous.state())
+
+    def state(self):
+        """Learned state worth keeping across restarts: {rule name: bytes}."""
+        return {rule.name: rule.baseline.dump() for rule in self.rules if isinstance(rule, AnomalyRule)}
+
+    def restore(self, state):
+        """Load state() output; entries for unknown rules or another layout are skipped."""
+        restored = 0
+        for rule in self.rules:
+            blob = state.get(rule.name) if isinstance(rule, AnomalyRule) else None
+            if blob is not None and rule.baseline.load(blob):
+                restored += 1
+        return restored
@@ -0,0 +1,209 @@
+# SysMoniTool/src/python/sampler.py
+"""In-process system sampler reading /proc directly.
+
+An alternative to the C++ collector for running collection inside the
+receiver process. The /proc files are opened once and re-read with
+os.preadv() into preallocated buffers, so a sample costs four system calls
+and no file opens. Metrics have the same meaning as the collector's:
+
+    cpu_usage      % of non-idle CPU time since the previous sample
+    memory_usage   % of RAM not free (MemFree / MemTotal)
+    disk_io        MB/s read, summed over all physical block devices
+    network_usage  MB/s received, summed over all physical interfaces
+
+Devices and interfaces are rediscovered every REFRESH_INTERVAL seconds, so
+hot-plugged disks and new interfaces are picked up.
+"""
+import os
+import time
+from database import ms_to_timestamp
+
+MIN_RATE_HZ = 0.1
+MAX_RATE_HZ = 100.0
+# Seconds between rescans of /sys for block devices and interfaces
+REFRESH_INTERVAL = 10.0
+SECTOR_SIZE = 512
+MB = 1024.0 * 1024.0
+
+PROC_FILES = ('stat', 'meminfo', 'diskstats', 'net/dev')
+INITIAL_BUFFER_SIZE = 16 * 1024
+
+
+def physical_devices(sys_dir):
+    """Names under sys_dir (e.g. /sys/block) that are not virtual devices.
+
+    Loop, RAM, device-mapper and bridge devices live under
+    /sys/devices/virtual; leaving them out avoids counting I/O twice.
+    """
+    try:
+        names = os.listdir(sys_dir)
+    except OSError:
+        return None
+    return {
+        name for name in names
+        if '/virtual/' not in os.path.realpath(os.path.join(sys_dir, name))
+    }
+
+
+class ProcSampler:
+    """Samples system metrics from held-open /proc files.
+
+    devices and interfaces restrict disk and network totals to the given
+    names; by default every physical device is included (every interface but
+    'lo' when none is physical, as inside containers).
+    """
+
+    def __init__(self, proc_root='/proc', sys_root='/sys', devices=None, interfaces=None):
+        self.proc_root = proc_root
+        self.sys_root = sys_root
+        self.fixed_devices = set(devices) if devices else None
+        self.fixed_interfaces = set(interfaces) if interfaces else None
+        self.fds = {}
+        self.buffers = {}
+        for name in PROC_FILES:
+            self.fds[name] = os.open(os.path.join(proc_root, name), os.O_RDONLY)
+            self.buffers[name] = bytearray(INITIAL_BUFFER_SIZE)
+        self.devices = None
+        self.interfaces = None
+        self.refreshed_at = None
+        self.last_cpu = None
+        self.last_disk = None
+        self.last_net = None
+        self.last_time = None
+
+    def read(self, name):
+        """Re-read one /proc file from offset 0; returns its contents as bytes."""
+        fd = self.fds[name]
+        buffer = self.buffers[name]
+        while True:
+            size = os.preadv(fd, [buffer], 0)
+            if size < len(buffer):
+                return bytes(memoryview(buffer)[:size])
+            # File outgrew the buffer (many devices): grow it and read again
+            buffer = self.buffers[name] = bytearray(2 * len(buffer))
+
+    def refresh_devices(self, now):
+        self.refreshed_at = now
+        block = physical_devices(os.path.join(self.sys_root, 'block'))
+        self.devices = {name.encode() for name in (self.fixed_devices or block or ())} or None
+
+        net = physical_devices(os.path.join(self.sys_root, 'class/net'))
+        if self.fixed_interfaces:
+            net = self.fixed_interfaces
+        elif not net:
+            net = None
+        self.interfaces = {name.encode() for name in net} if net else None
+
+    def read_cpu(self):
+        data = self.read('stat')
+        fields = data[:data.index(b'\n')].split()
+        user, nice, system, idle, iowait, irq, softirq, steal = map(int, fields[1:9])
+        return idle + iowait, user + nice + system + irq + softirq + steal
+
+    def read_memory(self):
+        total = free = None
+        for line in self.read('meminfo').split(b'\n'):
+            if line.startswith(b'MemTotal:'):
+                total = int(line.split()[1])
+            elif line.startswith(b'MemFree:'):
+                free = int(line.split()[1])
+                break
+        if not total or free is None:
+            return 0.0
+        return 100.0 * (1.0 - free / total)
+
+    def read_disk(self):
+        """Bytes read so far over the selected block devices."""
+        sectors = 0
+        devices = self.devices
+        for line in self.read('diskstats').split(b'\n'):
+            fields = line.split(None, 6)
+            if len(fields) < 6:
+                continue
+            name = fields[2]
+            if devices is None:
+                # No /sys to ask: count whole disks, not their partitions
+                if name[-1:].isdigit():
+                    continue
+            elif name not in devices:
+                continue
+            sectors += int(fields[5])
+        return sectors * SECTOR_SIZE
+
+    def read_network(self):
+        """Bytes received so far over the selected interfaces."""
+        total = 0
+        interfaces = self.interfaces
+        # The first two lines are column headers
+        for line in self.read('net/dev').split(b'\n')[2:]:
+            name, _, counters = line.partition(b':')
+            name = name.strip()
+            if not counters:
+                continue
+            if interfaces is None:
+                if name == b'lo':
+                    continue
+            elif name not in interfaces:
+                continue
+            total += int(counters.split(None, 1)[0])
+        return total
+
+    def sample(self):
+        """Take one sample as a metrics dict (same keys as the collector sends).
+
+        Rates are relative to the previous call; the first call reports 0.
+        """
+        now = time.monotonic()
+        if self.refreshed_at is None or now - self.refreshed_at >= REFRESH_INTERVAL:
+            self.refresh_devices(now)
+        ms = int(time.time() * 1000)
+
+        idle, busy = self.read_cpu()
+        disk = self.read_disk()
+        net = self.read_network()
+        cpu_usage = disk_io = network_usage = 0.0
+        if self.last_time is not None:
+            elapsed = max(now - self.last_time, 0.001)
+            total = (idle + busy) - sum(self.last_cpu)
+            if total > 0:
+                cpu_usage = 100.0 * (busy - self.last_cpu[1]) / total
+            # Counters can go backwards when a device disappears
+            disk_io = max(disk - self.last_disk, 0) / MB / elapsed
+            network_usage = max(net - self.last_net, 0) / MB / elapsed
+        self.last_cpu = (idle, busy)
+        self.last_disk = disk
+        self.last_net = net
+        self.last_time = now
+
+        return {
+            'cpu_usage': cpu_usage,
+            'memory_usage': self.read_memory(),
+            'disk_io': disk_io,
+            'network_usage': network_usage,
+            'timestamp': ms_to_timestamp(ms),
+            'ts_epoch_ms': ms,
+        }
+
+    def close(self):
+        for fd in self.fds.values():
+            os.close(fd)
+        self.fds = {}
+
+
+class SampleClock:
+    """Fixed-rate schedule for sampling at rate_hz without accumulating drift."""
+
+    def __init__(self, rate_hz):
+        if not MIN_RATE_HZ <= rate_hz <= MAX_RATE_HZ:
+            raise ValueError(f"Sampling rate must be between {MIN_RATE_HZ} and {MAX_RATE_HZ} Hz")
+        self.interval = 1.0 / rate_hz
+        self.next_time = time.monotonic()
+
+    def wait(self):
+        """Sleep until the next tick. Ticks missed while busy are skipped, not replayed."""
+        self.next_time += self.interval
+        delay = self.next_time - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        elif delay < -self.interval:
+            self.next_time = time.monotonic()
@@ -0,0 +1,211 @@
+# SysMoniTool/src/python/selfstats.py
+"""Counters, gauges and histograms describing the monitoring pipeline itself.
+
+Metrics are created once at import time in the module that records them and
+registered in REGISTRY. Recording is a plain attribute update (a bisect as
+well for histograms), a few hundred nanoseconds, so they stay on all the
+time. Updates from several threads are not locked; under the GIL a racing
+increment can at worst be lost, which is acceptable for monitoring.
+
+MetricsServer serves REGISTRY in the Prometheus text format on a local HTTP
+port; cli.py --selfstats reads it from there.
+"""
+from bisect import bisect_left
+
+DEFAULT_STATS_PORT = 12401
+# Upper bounds in seconds, from 100 µs to 10 s
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+                   0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Upper bounds in seconds, from 10 ms to 10 minutes
+AGE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 5.0, 10.0, 30.0, 60.0, 300.0, 600.0)
+
+
+class Counter:
+    __slots__ = ('name', 'help', 'value')
+    kind = 'counter'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def samples(self):
+        return [(self.name, self.value)]
+
+
+class Gauge:
+    """A value that is set, or read from a function at scrape time."""
+
+    __slots__ = ('name', 'help', 'value', 'function')
+    kind = 'gauge'
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.value = 0
+        self.function = None
+
+    def set(self, value):
+        self.value = value
+
+    def set_function(self, function):
+        self.function = function
+
+    def samples(self):
+        if self.function is not None:
+            try:
+                return [(self.name, self.function())]
+            except Exception:
+                return []
+        return [(self.name, self.value)]
+
+
+class Histogram:
+    __slots__ = ('name', 'help', 'bounds', 'counts', 'sum', 'count')
+    kind = 'histogram'
+
+    def __init__(self, name, help, bounds=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.bounds = tuple(bounds)
+        # One slot per bound plus +Inf
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding quantile q (None if empty or past the last bound)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return None
+
+    def samples(self):
+        result = []
+        cumulative = 0
+        for bound, count in zip(self.bounds, self.counts):
+            cumulative += count
+            result.append((f'{self.name}_bucket{{le="{bound:g}"}}', cumulative))
+        result.append((f'{self.name}_bucket{{le="+Inf"}}', self.count))
+        result.append((f'{self.name}_sum', self.sum))
+        result.append((f'{self.name}_count', self.count))
+        return result
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = {}
+
+    def register(self, metric):
+        # Re-registering a name returns the existing metric, so modules can
+        # be imported more than once (e.g. by tests) without duplicates
+        return self.metrics.setdefault(metric.name, metric)
+
+    def counter(self, name, help):
+        return self.register(Counter(name, help))
+
+    def gauge(self, name, help):
+        return self.register(Gauge(name, help))
+
+    def histogram(self, name, help, bounds=LATENCY_BUCKETS):
+        return self.register(Histogram(name, help, bounds))
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        lines = []
+        for metric in self.metrics.values():
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            lines.extend(f'{name} {value:g}' if isinstance(value, float) else f'{name} {value}'
+                         for name, value in metric.samples())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+
+def parse_text(text):
+    """Parse the Prometheus text format back into {sample name: value}."""
+    values = {}
+    for line in text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        name, _, value = line.rpartition(' ')
+        values[name] = float(value)
+    return values
+
+
+def summarize(values):
+    """(metric, value) rows for display: counters and gauges as they are, histograms as count/mean/p99."""
+    rows = []
+    histograms = {name[:-len('_count')] for name in values if name.endswith('_count')}
+    for name, value in values.items():
+        base = name.split('{')[0]
+        if base.endswith('_bucket') or base.endswith('_sum'):
+            continue
+        if base.endswith('_count') and base[:-len('_count')] in histograms:
+            base = base[:-len('_count')]
+            count = int(value)
+            if not count:
+                rows.append((base, 'no observations'))
+                continue
+            mean = values[f'{base}_sum'] / count
+            # Buckets are rendered in ascending order, +Inf last
+            p99 = next(sample.split('"')[1] for sample, cumulative in values.items()
+                       if sample.startswith(f'{base}_bucket{{') and cumulative >= 0.99 * count)
+            rows.append((base, f"count {count}, mean {mean:.6g}, p99 <= {p99}"))
+            continue
+        rows.append((name, f'{value:g}'))
+    return rows
+
+
+class MetricsServer:
+    """Serves a registry on http://host:port/metrics from a daemon thread."""
+
+    def __init__(self, registry=REGISTRY, host='127.0.0.1', port=DEFAULT_STATS_PORT):
+        # Imported here: every Database user imports this module, and only
+        # the receiver serves HTTP
+        import threading
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        registry_ = registry
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path not in ('/', '/metrics'):
+                    self.send_error(404)
+                    return
+                body = registry_.render().encode()
+                self.send_response(200)
+                self.send_header('Content-Type', 'text/plain; version=0.0.4')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.port = self.server.server_address[1]
+        self.thread = threading.Thread(target=self.server.serve_forever, name='selfstats-http', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
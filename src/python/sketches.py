@@ -0,0 +1,103 @@
+# SysMoniTool/src/python/sketches.py
+"""Mergeable quantile sketches with fixed logarithmic bins.
+
+Values are counted in bins whose bounds grow geometrically by GAMMA, so any
+quantile read from a sketch is within RELATIVE_ACCURACY of the true value
+(the DDSketch scheme). Bins are fixed, so two sketches merge by adding
+counts: a sketch per rollup bucket can be combined into one for any range.
+Values at or below MIN_VALUE, including negatives, share one zero bin.
+
+Sketches are stored as BLOBs of sorted (bin index int16, count uint32)
+pairs. merge_blobs() is registered as the SQLite function sketch_merge() so
+the rollup upsert merges them in place.
+"""
+import math
+import struct
+
+RELATIVE_ACCURACY = 0.01
+GAMMA = (1 + RELATIVE_ACCURACY) / (1 - RELATIVE_ACCURACY)
+LOG_GAMMA = math.log(GAMMA)
+MIN_VALUE = 1e-3
+ZERO_INDEX = -32768
+MAX_INDEX = 32767
+BIN = struct.Struct('<hI')
+
+
+def bin_index(value):
+    if value <= MIN_VALUE:
+        return ZERO_INDEX
+    return min(math.ceil(math.log(value) / LOG_GAMMA), MAX_INDEX)
+
+
+def bin_value(index):
+    """Representative value of a bin, within RELATIVE_ACCURACY of everything in it."""
+    if index == ZERO_INDEX:
+        return 0.0
+    return 2.0 * GAMMA ** index / (GAMMA + 1)
+
+
+class Sketch:
+    __slots__ = ('counts',)
+
+    def __init__(self, counts=None):
+        self.counts = counts if counts is not None else {}
+
+    def add(self, value):
+        index = bin_index(value)
+        counts = self.counts
+        counts[index] = counts.get(index, 0) + 1
+
+    def merge(self, other):
+        counts = self.counts
+        for index, count in other.counts.items():
+            counts[index] = counts.get(index, 0) + count
+        return self
+
+    def count(self):
+        return sum(self.counts.values())
+
+    def quantile(self, q):
+        """Value at quantile q (0..1), or None for an empty sketch."""
+        total = self.count()
+        if not total:
+            return None
+        rank = q * (total - 1)
+        seen = 0
+        for index in sorted(self.counts):
+            seen += self.counts[index]
+            if seen > rank:
+                return bin_value(index)
+        return bin_value(max(self.counts))
+
+    def count_above(self, threshold):
+        """Number of values whose bin lies above threshold."""
+        return sum(count for index, count in self.counts.items() if bin_value(index) > threshold)
+
+    def histogram(self, edges):
+        """Counts between consecutive edges (the last bucket is open-ended)."""
+        result = [0] * len(edges)
+        for index, count in self.counts.items():
+            value = bin_value(index)
+            slot = 0
+            while slot + 1 < len(edges) and value >= edges[slot + 1]:
+                slot += 1
+            result[slot] += count
+        return result
+
+    def encode(self):
+        return b''.join(BIN.pack(index, count) for index, count in sorted(self.counts.items()))
+
+    @classmethod
+    def decode(cls, blob):
+        if not blob:
+            return cls()
+        return cls(dict(BIN.iter_unpack(blob)))
+
+
+def merge_blobs(a, b):
+    """SQLite sketch_merge(a, b): either side may be NULL."""
+    if not a:
+        return b
+    if not b:
+        return a
+    return Sketch.decode(a).merge(Sketch.decode(b)).encode()
@@ -0,0 +1,352 @@
+# SysMoniTool/src/python/supervisor.py
+"""Starts the monitoring processes, restarts them when they crash, stops them cleanly.
+
+    python3 src/python/supervisor.py --child cpp ./build/monitor \\
+        --child python 'python3 src/python/automation.py'
+
+Each child is started with SYSMON_READY_FD naming the write end of a pipe
+and calls notify_ready() (the C++ monitor writes the same line) once it is
+ready to work. Children start in order, each after the previous one is
+ready. When all are ready the supervisor writes the pid file
+({name}_pid for each child, plus supervisor_pid) and reports readiness to
+whoever started it the same way, so start() returns as soon as everything
+is up instead of after fixed sleeps.
+
+A child that exits is restarted after MIN_RESTART_DELAY, doubling up to
+MAX_RESTART_DELAY while it keeps failing; a child that ran for
+STABLE_SECONDS starts again from the minimum. SIGTERM stops the children
+(SIGKILL after STOP_TIMEOUT), removes the pid file and exits; stop() sends
+it and waits. Only the pids in the pid file are ever signalled.
+"""
+import argparse
+import json
+import logging
+import os
+import select
+import shlex
+import signal
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+READY_FD_ENV = 'SYSMON_READY_FD'
+READY = 'READY'
+ERROR = 'ERROR'
+START_TIMEOUT = 10.0
+STOP_TIMEOUT = 5.0
+MIN_RESTART_DELAY = 0.1
+MAX_RESTART_DELAY = 30.0
+STABLE_SECONDS = 30.0
+SUPERVISOR = os.path.abspath(__file__)
+
+
+def notify_ready(message=READY):
+    """Tell the supervisor this process is ready; False when not started by one."""
+    fd = os.environ.pop(READY_FD_ENV, None)
+    if fd is None:
+        return False
+    try:
+        fd = int(fd)
+        os.write(fd, f"{message}\n".encode())
+        os.close(fd)
+    except (OSError, ValueError):
+        return False
+    return True
+
+
+def wait_ready(fd, timeout):
+    """Wait for a readiness line on fd: (True, '') or (False, reason)."""
+    deadline = time.monotonic() + timeout
+    data = b''
+    while b'\n' not in data:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return False, f"not ready after {timeout:g}s"
+        readable, _, _ = select.select([fd], [], [], remaining)
+        if not readable:
+            continue
+        chunk = os.read(fd, 256)
+        if not chunk:
+            return False, "exited before becoming ready"
+        data += chunk
+    line = data.split(b'\n', 1)[0].decode(errors='replace')
+    if line == READY:
+        return True, ''
+    return False, line[len(ERROR):].strip() if line.startswith(ERROR) else line
+
+
+def is_alive(pid):
+    """Whether pid is running; an exited process not yet reaped by its parent counts as gone."""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    try:
+        with open(f'/proc/{pid}/stat') as f:
+            # The state follows the parenthesised command name
+            return f.read().rpartition(')')[2].split()[0] != 'Z'
+    except (OSError, IndexError):
+        return True
+
+
+def read_pid_file(pid_file):
+    """{name: pid} from the pid file, or None if there is none."""
+    try:
+        with open(pid_file, 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return {name: pid for name, pid in data.items() if name.endswith('_pid') and isinstance(pid, int)}
+
+
+class Child:
+    def __init__(self, name, command):
+        self.name = name
+        self.command = command
+        self.process = None
+        self.started = None
+        self.delay = MIN_RESTART_DELAY
+        self.restart_at = None
+        self.restarts = 0
+
+
+class Supervisor:
+    def __init__(self, children, pid_file, timeout=START_TIMEOUT):
+        self.children = [Child(name, command) for name, command in children]
+        self.pid_file = pid_file
+        self.timeout = timeout
+        self.start_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+
+    def spawn(self, child):
+        """Start child and wait for it to report ready: (ok, reason)."""
+        read_fd, write_fd = os.pipe()
+        env = dict(os.environ)
+        env[READY_FD_ENV] = str(write_fd)
+        try:
+            child.process = subprocess.Popen(child.command, env=env, pass_fds=(write_fd,),
+                                             stdin=subprocess.DEVNULL)
+        except OSError as e:
+            os.close(read_fd)
+            child.process = None
+            return False, str(e)
+        finally:
+            os.close(write_fd)
+        child.started = time.monotonic()
+        try:
+            ok, reason = wait_ready(read_fd, self.timeout)
+        finally:
+            os.close(read_fd)
+        if not ok and child.process.poll() is None:
+            try:
+                child.process.wait(timeout=0.1)
+            except subprocess.TimeoutExpired:
+                pass
+        if not ok and child.process.returncode is not None:
+            reason = f"{reason} (exit status {child.process.returncode})"
+        return ok, reason
+
+    def start(self):
+        """Start every child in order: (True, '') or (False, reason) with all stopped again."""
+        for child in self.children:
+            ok, reason = self.spawn(child)
+            if not ok:
+                self.stop()
+                return False, f"{child.name}: {reason}"
+            logging.info(f"Started {child.name} (pid {child.process.pid})")
+        self.write_pid_file()
+        return True, ''
+
+    def write_pid_file(self):
+        pids = {'supervisor_pid': os.getpid()}
+        for child in self.children:
+            if child.process is not None and child.process.returncode is None:
+                pids[f'{child.name}_pid'] = child.process.pid
+        directory = os.path.dirname(self.pid_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temporary = f'{self.pid_file}.tmp'
+        with open(temporary, 'w') as f:
+            json.dump({**pids, 'start_time': self.start_time}, f)
+        os.replace(temporary, self.pid_file)
+
+    def schedule_restart(self, child):
+        now = time.monotonic()
+        if child.started is not None and now - child.started >= STABLE_SECONDS:
+            child.delay = MIN_RESTART_DELAY
+        child.restart_at = now + child.delay
+        logging.warning(f"Restarting {child.name} in {child.delay:g}s")
+        child.delay = min(child.delay * 2, MAX_RESTART_DELAY)
+
+    def reap(self, pid, status):
+        for child in self.children:
+            if child.process is not None and child.process.pid == pid:
+                # Reaped here rather than by Popen, so record the exit for poll()
+                child.process.returncode = os.waitstatus_to_exitcode(status)
+                logging.warning(f"{child.name} (pid {pid}) exited with status {child.process.returncode}")
+                self.schedule_restart(child)
+                self.write_pid_file()
+
+    def restart_due(self):
+        now = time.monotonic()
+        for child in self.children:
+            if child.restart_at is None or child.restart_at > now:
+                continue
+            child.restart_at = None
+            child.restarts += 1
+            ok, reason = self.spawn(child)
+            if ok:
+                logging.info(f"Restarted {child.name} (pid {child.process.pid})")
+            else:
+                logging.error(f"Restarting {child.name} failed: {reason}")
+                if child.process is None or child.process.poll() is not None:
+                    self.schedule_restart(child)
+            self.write_pid_file()
+
+    def run(self):
+        """Restart children as they exit, until interrupted (SIGTERM raises SystemExit)."""
+        while True:
+            pending = [child.restart_at for child in self.children if child.restart_at is not None]
+            if pending:
+                time.sleep(max(0.0, min(pending) - time.monotonic()))
+                try:
+                    pid, status = os.waitpid(-1, os.WNOHANG)
+                except ChildProcessError:
+                    pid, status = 0, 0
+            else:
+                pid, status = os.waitpid(-1, 0)
+            if pid:
+                self.reap(pid, status)
+            self.restart_due()
+
+    def stop(self, timeout=STOP_TIMEOUT):
+        """Terminate the children, wait for them (killing stragglers) and remove the pid file."""
+        running = [child for child in reversed(self.children)
+                   if child.process is not None and child.process.poll() is None]
+        for child in running:
+            child.process.terminate()
+        deadline = time.monotonic() + timeout
+        for child in running:
+            try:
+                child.process.wait(max(0.0, deadline - time.monotonic()))
+            except subprocess.TimeoutExpired:
+                logging.warning(f"{child.name} (pid {child.process.pid}) did not stop, killing it")
+                child.process.kill()
+                child.process.wait()
+        try:
+            os.remove(self.pid_file)
+        except FileNotFoundError:
+            pass
+
+
+def start(children, pid_file, log_file=None, timeout=START_TIMEOUT):
+    """Launch a detached supervisor for [(name, argv)] and wait until every child is ready.
+
+    The supervisor and its children write their output to log_file (default:
+    supervisor.log next to the pid file), so the caller's stdout is not held
+    open. Returns (True, '') or (False, reason).
+    """
+    if log_file is None:
+        log_file = os.path.join(os.path.dirname(pid_file), 'supervisor.log')
+    if os.path.dirname(log_file):
+        os.makedirs(os.path.dirname(log_file), exist_ok=True)
+    read_fd, write_fd = os.pipe()
+    command = [sys.executable, SUPERVISOR, '--detach', '--pid-file', pid_file, '--timeout', str(timeout)]
+    for name, argv in children:
+        command += ['--child', name, shlex.join(argv)]
+    env = dict(os.environ)
+    env[READY_FD_ENV] = str(write_fd)
+    try:
+        # The launched process forks and exits at once, so there is nothing
+        # left to reap here and the supervisor outlives the caller
+        with open(log_file, 'a') as log:
+            subprocess.run(command, env=env, pass_fds=(write_fd,), stdin=subprocess.DEVNULL,
+                           stdout=log, stderr=subprocess.STDOUT, start_new_session=True)
+    finally:
+        os.close(write_fd)
+    try:
+        return wait_ready(read_fd, timeout * (len(children) + 1))
+    finally:
+        os.close(read_fd)
+
+
+def stop(pid_file, timeout=STOP_TIMEOUT):
+    """Stop the supervisor in pid_file and wait for it; False if nothing was running."""
+    pids = read_pid_file(pid_file)
+    if not pids:
+        return False
+    supervisor = pids.get('supervisor_pid')
+    # A pid file without a supervisor is from before the supervisor existed
+    targets = [supervisor] if supervisor else list(pids.values())
+    for pid in targets:
+        try:
+            os.kill(pid, signal.SIGTERM)
+        except ProcessLookupError:
+            pass
+    # The supervisor exits once its children are gone
+    deadline = time.monotonic() + timeout + 1.0
+    while any(is_alive(pid) for pid in targets):
+        if time.monotonic() >= deadline:
+            for pid in targets:
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+            break
+        time.sleep(0.005)
+    # Still there: the supervisor died without cleaning up, so its children
+    # may be orphaned
+    if os.path.exists(pid_file):
+        for name, pid in pids.items():
+            if name != 'supervisor_pid' and is_alive(pid):
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+        os.remove(pid_file)
+    return True
+
+
+def is_running(pid_file):
+    pids = read_pid_file(pid_file)
+    if not pids:
+        return False
+    supervisor = pids.get('supervisor_pid')
+    return is_alive(supervisor) if supervisor else all(is_alive(pid) for pid in pids.values())
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run and restart the monitoring processes')
+    parser.add_argument('--child', nargs=2, action='append', required=True, metavar=('NAME', 'COMMAND'),
+                        help='A process to run, started in the order given (repeatable)')
+    parser.add_argument('--pid-file', default='data/monitor.pid')
+    parser.add_argument('--timeout', type=float, default=START_TIMEOUT,
+                        help='Seconds each child has to become ready')
+    parser.add_argument('--detach', action='store_true',
+                        help='Fork into the background; readiness is still reported')
+    args = parser.parse_args()
+
+    if args.detach and os.fork():
+        os._exit(0)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - supervisor - %(levelname)s - %(message)s')
+
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    supervisor = Supervisor([(name, shlex.split(command)) for name, command in args.child],
+                            args.pid_file, args.timeout)
+    try:
+        ok, reason = supervisor.start()
+        if not ok:
+            logging.error(f"Start failed: {reason}")
+            notify_ready(f"{ERROR} {reason}")
+            sys.exit(1)
+        notify_ready()
+        supervisor.run()
+    finally:
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)
+        supervisor.stop()
+
+
+if __name__ == '__main__':
+    main()
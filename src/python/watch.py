@@ -0,0 +1,89 @@
+# SysMoniTool/src/python/watch.py
+"""Live terminal view that tails new samples incrementally.
+
+LiveView remembers a high-water mark (the newest row id seen in each
+partition) and on each refresh fetches only rows inserted after it, including
+late samples written into an older day's partition. SQLite's data_version
+tells it whether any other connection has committed since the last refresh,
+so idle ticks cost a single PRAGMA and never touch the tables.
+"""
+import time
+from collections import deque
+
+SPARK_CHARS = '▁▂▃▄▅▆▇█'
+# How far back the view is filled from when it starts
+BACKFILL_MS = 5 * 60 * 1000
+DEFAULT_WIDTH = 40
+
+
+def sparkline(values, low=None, high=None):
+    """Render values as a row of block characters scaled between low and high."""
+    if not values:
+        return ''
+    low = min(values) if low is None else low
+    high = max(values) if high is None else high
+    span = high - low
+    top = len(SPARK_CHARS) - 1
+    if span <= 0:
+        return SPARK_CHARS[0] * len(values)
+    return ''.join(
+        SPARK_CHARS[max(0, min(top, int((value - low) / span * top + 0.5)))] for value in values
+    )
+
+
+class LiveView:
+    """Latest sample and recent history per host, kept current by refresh()."""
+
+    def __init__(self, db, host=None, width=DEFAULT_WIDTH):
+        self.db = db
+        self.host = host
+        self.width = width
+        self.latest = {}
+        self.history = {}
+        self.version = db.data_version()
+        self.mark = db.high_water_mark()
+        now_ms = int(time.time() * 1000)
+        for row in db.iter_range(now_ms - BACKFILL_MS, now_ms + 1, host, newest_first=False):
+            self.add(row)
+
+    def add(self, row):
+        host = row[6]
+        if self.host is not None and host != self.host:
+            return
+        # Late samples fill in the history but do not replace a newer latest
+        latest = self.latest.get(host)
+        if latest is None or row[1] >= latest[1]:
+            self.latest[host] = row
+        history = self.history.get(host)
+        if history is None:
+            history = self.history[host] = (deque(maxlen=self.width), deque(maxlen=self.width))
+        history[0].append(row[2])
+        history[1].append(row[3])
+
+    def refresh(self):
+        """Fetch rows committed since the last call; returns False when nothing changed."""
+        version = self.db.data_version()
+        if version == self.version:
+            return False
+        self.version = version
+        rows, self.mark = self.db.rows_since(self.mark)
+        for row in rows:
+            self.add(row)
+        return True
+
+    def render(self):
+        if not self.latest:
+            return "Waiting for metrics...\n"
+        lines = [
+            f"{'Host':<16} {'Timestamp':<19} {'CPU %':>6} {'Mem %':>6} {'Disk MB/s':>9} "
+            f"{'Net MB/s':>9}  CPU / memory (last {self.width})"
+        ]
+        for host in sorted(self.latest):
+            row = self.latest[host]
+            cpu, memory = self.history[host]
+            lines.append(
+                f"{host[:16]:<16} {row[1]:<19} {row[2]:>6.1f} {row[3]:>6.1f} {row[4]:>9.1f} "
+                f"{row[5]:>9.1f}  {sparkline(cpu, 0, 100)}"
+            )
+            lines.append(f"{'':<72}{sparkline(memory, 0, 100)}")
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,44 @@
+# SysMoniTool/tests/test_actions.py
+
+import unittest
+import sys
+import time
+from context import *
+from actions import ActionExecutor
+
+SLEEP = [sys.executable, '-c', 'import time; time.sleep(5)']
+NOOP = [sys.executable, '-c', 'pass']
+
+class TestActionExecutor(unittest.TestCase):
+    def setUp(self):
+        self.executor = ActionExecutor(workers=1, max_queue=1, timeout=0.5, cooldown=60.0)
+
+    def tearDown(self):
+        self.executor.shutdown()
+
+    def test_submit_does_not_block(self):
+        start = time.monotonic()
+        self.assertTrue(self.executor.submit('cpu_usage', SLEEP))
+        self.assertLess(time.monotonic() - start, 0.1)
+
+    def test_deduplication_and_cooldown(self):
+        self.assertTrue(self.executor.submit('cpu_usage', NOOP))
+        # Same rule again while queued/running or cooling down is dropped
+        self.assertFalse(self.executor.submit('cpu_usage', NOOP))
+        time.sleep(0.5)
+        self.assertFalse(self.executor.submit('cpu_usage', NOOP))
+
+    def test_queue_depth_limit(self):
+        self.assertTrue(self.executor.submit('cpu_usage', SLEEP))
+        time.sleep(0.2)  # let the worker pick it up
+        self.assertTrue(self.executor.submit('memory_usage', SLEEP))
+        self.assertFalse(self.executor.submit('disk_io', SLEEP))
+        self.assertEqual(self.executor.queue_depth(), 1)
+
+    def test_timeout_kills_action(self):
+        start = time.monotonic()
+        self.assertIsNone(self.executor.run_command(SLEEP))
+        self.assertLess(time.monotonic() - start, 2.0)
+
+if __name__ == '__main__':
+    unittest.main()
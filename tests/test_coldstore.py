@@ -0,0 +1,66 @@
+# SysMoniTool/tests/test_coldstore.py
+
+import os
+import shutil
+import tempfile
+import unittest
+from context import *
+import coldstore
+from coldstore import ColdStore, encode_ints, decode_ints, encode_floats, decode_floats
+
+FIRST_MS = 1704110400000
+
+class TestColdStore(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.store = ColdStore(os.path.join(self.test_dir, 'cold'))
+        self.block_rows = coldstore.BLOCK_ROWS
+        coldstore.BLOCK_ROWS = 10
+
+    def tearDown(self):
+        coldstore.BLOCK_ROWS = self.block_rows
+        self.store.close()
+        shutil.rmtree(self.test_dir)
+
+    def rows(self, count=35):
+        # Two hosts sampled every second, the second one 500 ms later
+        return [(i + 1, FIRST_MS + (i // 2) * 1000 + (i % 2) * 500, f'node-{i % 2}',
+                 round(40.0 + (i % 7) * 1.25, 2), 55.5, float(i), -1.0 if i == 3 else 0.1 * i)
+                for i in range(count)]
+
+    def test_codecs_round_trip(self):
+        for values in ([], [7], [FIRST_MS, FIRST_MS + 1000, FIRST_MS + 2000, FIRST_MS + 2999], [5, -3, 2 ** 40, 0]):
+            self.assertEqual(decode_ints(encode_ints(values)), values)
+        values = [0.0, -0.0, 12.34, 12.35, 1e300, float('inf'), 5e-324]
+        self.assertEqual(decode_floats(encode_floats(values)), values)
+        # A steady interval is all zero deltas of deltas
+        steady = encode_ints([FIRST_MS + i * 1000 for i in range(10000)])
+        self.assertLess(len(steady), 200)
+
+    def test_write_and_read_range(self):
+        rows = self.rows()
+        size = self.store.write('metrics_p20240101', rows)
+        self.assertEqual(size, os.path.getsize(self.store.path('metrics_p20240101')))
+        self.assertEqual(self.store.names(), ['metrics_p20240101'])
+
+        columns = ('id', 'ts_epoch_ms', 'host', 'cpu_usage', 'memory_usage', 'disk_io', 'network_usage')
+        self.assertEqual(list(self.store.iter_range('metrics_p20240101', 0, 2 ** 62, newest_first=False,
+                                                    columns=columns)), rows)
+        start, end = FIRST_MS + 3000, FIRST_MS + 12500
+        expected = [row for row in rows if start <= row[1] < end and row[2] == 'node-1']
+        result = list(self.store.iter_range('metrics_p20240101', start, end, 'node-1', columns=columns))
+        self.assertEqual(result, expected[::-1])
+        # Only the blocks overlapping the range are decoded
+        self.assertEqual(len(self.store.blocks('metrics_p20240101', start, end)), 3)
+        self.assertEqual(len(self.store.open('metrics_p20240101').blocks), 4)
+
+    def test_replaced_file_is_remapped(self):
+        self.store.write('metrics_p20240101', self.rows(5))
+        self.assertEqual(len(list(self.store.iter_range('metrics_p20240101', 0, 2 ** 62))), 5)
+        self.store.write('metrics_p20240101', self.rows(8))
+        self.assertEqual(len(list(self.store.iter_range('metrics_p20240101', 0, 2 ** 62))), 8)
+        self.store.remove('metrics_p20240101')
+        self.assertEqual(self.store.names(), [])
+
+if __name__ == '__main__':
+    unittest.main()
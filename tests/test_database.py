@@ -5,15 +5,19 @@ import sqlite3
 import os
 from datetime import datetime
 from context import *
-from database import Database
+from database import Database, timestamp_to_ms, date_to_ms, ms_to_timestamp
 import tempfile
 
+# Test samples are dated 2024; keep them regardless of the retention policy
+# (and in SQLite: tests pass cold_after=None unless they test archiving)
+KEEP_ALL = {'raw': None, '1m': None, '1h': None, '1d': None}
+
 class TestDatabase(unittest.TestCase):
     def setUp(self):
         # Create a temporary directory for test database
         self.test_dir = tempfile.mkdtemp()
         self.test_db_file = os.path.join(self.test_dir, 'test_logs.db')
-        self.db = Database(self.test_db_file)
+        self.db = Database(self.test_db_file, retention=KEEP_ALL, cold_after=None)
 
     def tearDown(self):
         self.db.__del__()
@@ -72,6 +76,274 @@ class TestDatabase(unittest.TestCase):
         with self.assertRaises(sqlite3.Error):
             self.db.insert_data(invalid_metrics)
 
+    def _sample(self, second, cpu=50.0):
+        return {
+            'timestamp': f'2024-01-01 12:00:{second:02d}',
+            'cpu_usage': cpu,
+            'memory_usage': 60.0,
+            'disk_io': 70.0,
+            'network_usage': 80.0
+        }
+
+    def test_insert_many(self):
+        self.db.insert_many([self._sample(i, cpu=float(i)) for i in range(10)])
+        rows = self.db.query_data('2024-01-01', '2024-01-02')
+        self.assertEqual(len(rows), 10)
+        self.assertEqual(rows[0][2], 9.0)
+
+    def test_insert_many_rejects_invalid_batch(self):
+        batch = [self._sample(0), self._sample(1, cpu='not_a_number')]
+        with self.assertRaises(sqlite3.Error):
+            self.db.insert_many(batch)
+        self.assertEqual(self.db.query_data('2024-01-01', '2024-01-02'), [])
+
+    def test_write_behind_buffer(self):
+        db_file = os.path.join(self.test_dir, 'buffered.db')
+        db = Database(db_file, batch_size=3, flush_interval=3600, retention=KEEP_ALL, cold_after=None)
+        reader = sqlite3.connect(db_file)
+        count = lambda: reader.execute('SELECT COUNT(*) FROM metrics').fetchone()[0]
+        try:
+            db.buffer_data(self._sample(0))
+            db.buffer_data(self._sample(1))
+            self.assertEqual(count(), 0)
+
+            # Reaching batch_size commits the whole batch at once
+            db.buffer_data(self._sample(2))
+            self.assertEqual(count(), 3)
+
+            # Invalid samples are dropped at flush without losing the rest
+            db.buffer_data(self._sample(3))
+            db.buffer_data(self._sample(4, cpu=None))
+            db.flush()
+            self.assertEqual(count(), 4)
+            self.assertEqual(reader.execute('PRAGMA journal_mode').fetchone()[0], 'wal')
+        finally:
+            reader.close()
+            db.close()
+
+    def test_non_finite_values_dropped(self):
+        self.db.buffer_data(self._sample(0))
+        self.db.buffer_data(self._sample(1, cpu=float('nan')))
+        self.db.buffer_data(self._sample(2, cpu='inf'))
+        self.db.buffer_data(self._sample(3, cpu=float('-inf')))
+        self.db.flush()
+        self.assertEqual(self.db.pending, [])
+        self.assertEqual(len(self.db.query_data('2024-01-01', '2024-01-02')), 1)
+        with self.assertRaises(sqlite3.Error):
+            self.db.insert_data(self._sample(4, cpu=float('nan')))
+
+    def test_default_retention_keeps_raw_history(self):
+        db = Database(os.path.join(self.test_dir, 'defaults.db'), cold_after=None)
+        try:
+            db.insert_data(self._sample(0))
+            db.insert_data({**self._sample(0), 'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')})
+            self.assertEqual(len(db.query_data('2024-01-01', '2024-01-02')), 1)
+        finally:
+            db.close()
+
+    def test_retention_failure_does_not_fail_write(self):
+        def fail(now_ms=None):
+            raise sqlite3.Error("disk I/O error")
+        self.db.apply_retention = fail
+        self.db.buffer_data(self._sample(0))
+        self.db.flush()
+        self.assertEqual(self.db.pending, [])
+        self.db.flush()
+        self.assertEqual(len(self.db.query_data('2024-01-01', '2024-01-02')), 1)
+        self.assertEqual(self.db.query_rollup(0, 2 ** 62, '1d')[0][1], 1)
+
+    def test_migrates_legacy_database(self):
+        db_file = os.path.join(self.test_dir, 'legacy.db')
+        conn = sqlite3.connect(db_file)
+        conn.execute('''
+            CREATE TABLE metrics (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP,
+                cpu_usage REAL, memory_usage REAL, disk_io REAL, network_usage REAL
+            )
+        ''')
+        conn.execute("INSERT INTO metrics (timestamp, cpu_usage, memory_usage, disk_io, network_usage) "
+                     "VALUES ('2024-03-10 08:30:15', 1.0, 2.0, 3.0, 4.0)")
+        conn.commit()
+        conn.close()
+
+        db = Database(db_file, retention=KEEP_ALL, cold_after=None)
+        try:
+            epoch = db.conn.execute('SELECT ts_epoch_ms FROM metrics').fetchone()[0]
+            self.assertEqual(epoch, timestamp_to_ms('2024-03-10 08:30:15'))
+            self.assertEqual(len(db.query_data('2024-03-10', '2024-03-11')), 1)
+            # Existing history is folded into the rollups during migration
+            hourly = db.query_rollup(epoch, epoch + 1, '1h')
+            self.assertEqual(hourly[0][1:3], (1, 1.0))
+            # Samples from before the host column belong to the local collector
+            self.assertEqual(db.get_hosts(), ['localhost'])
+            self.assertEqual(db.get_latest_metrics(host='localhost')[6], 'localhost')
+
+            # The migrated table is archived like a daily partition
+            self.assertEqual(db.archive_partitions(date_to_ms('2024-04-01')), 1)
+            self.assertEqual(db.cold.names(), ['metrics_legacy'])
+            self.assertEqual(len(db.query_data('2024-03-10', '2024-03-11')), 1)
+            self.assertEqual(db.query_data('2024-03-11', '2024-03-12'), [])
+            db.retention['raw'] = 86400000
+            db.apply_retention(now_ms=date_to_ms('2024-03-11'))
+            self.assertEqual(db.cold.names(), ['metrics_legacy'])
+            db.apply_retention(now_ms=date_to_ms('2024-03-12'))
+            self.assertEqual(db.cold.names(), [])
+        finally:
+            db.close()
+
+    def test_time_queries_use_index(self):
+        self.db.insert_data(self._sample(0))
+        partition = self.db.partitions_between(0, 2 ** 62)[0]
+        for query in (f'SELECT * FROM {partition} WHERE ts_epoch_ms >= 0 AND ts_epoch_ms < 1 ORDER BY ts_epoch_ms DESC',
+                      f'SELECT * FROM {partition} ORDER BY ts_epoch_ms DESC LIMIT 1'):
+            plan = ' '.join(row[-1] for row in self.db.conn.execute('EXPLAIN QUERY PLAN ' + query))
+            self.assertIn(f'idx_{partition}_ts_epoch', plan)
+            self.assertNotIn('TEMP B-TREE', plan)
+        plan = ' '.join(row[-1] for row in self.db.conn.execute(
+            'EXPLAIN QUERY PLAN DELETE FROM process_samples WHERE ts_epoch_ms < 1'))
+        self.assertIn('idx_process_samples_ts', plan)
+
+    def test_rollups_updated_incrementally(self):
+        # Two separate batches landing in the same minute bucket
+        self.db.insert_many([self._sample(0, cpu=10.0), self._sample(30, cpu=30.0)])
+        self.db.insert_many([self._sample(59, cpu=20.0)])
+        self.db.insert_data({**self._sample(0, cpu=90.0), 'timestamp': '2024-01-01 12:01:00'})
+
+        start, end = date_to_ms('2024-01-01'), date_to_ms('2024-01-02')
+        minutes = self.db.query_rollup(start, end, '1m')
+        self.assertEqual(len(minutes), 2)
+        bucket, count, cpu_avg, cpu_min, cpu_max, cpu_last = minutes[1][:6]
+        self.assertEqual(bucket, timestamp_to_ms('2024-01-01 12:00:00'))
+        self.assertEqual((count, cpu_avg, cpu_min, cpu_max, cpu_last), (3, 20.0, 10.0, 30.0, 20.0))
+
+        day = self.db.query_rollup(start, end, '1d')
+        self.assertEqual(len(day), 1)
+        self.assertEqual(day[0][1], 4)
+        self.assertEqual(day[0][2:6], (37.5, 10.0, 90.0, 90.0))
+
+    def test_choose_resolution(self):
+        self.db.insert_many([self._sample(i) for i in range(60)])
+        start = date_to_ms('2024-01-01')
+        self.assertEqual(self.db.choose_resolution(start, start + 86400000), 'raw')
+        self.assertEqual(self.db.choose_resolution(start, start + 86400000, max_points=50), '1h')
+        self.assertEqual(self.db.choose_resolution(start, start + 365 * 86400000, max_points=50), '1d')
+
+    def test_partitions_and_retention(self):
+        self.db.insert_many([
+            {**self._sample(0), 'timestamp': f'2024-01-0{day} 12:00:00'} for day in (1, 2, 3)
+        ])
+        self.assertEqual(len(self.db.partitions_between(0, 2 ** 62)), 3)
+        # Range queries only touch overlapping partitions
+        day2 = timestamp_to_ms('2024-01-02 12:00:00')
+        self.assertEqual(len(self.db.partitions_between(day2, day2 + 1)), 1)
+        self.assertEqual(len(self.db.query_data('2024-01-02', '2024-01-04')), 2)
+
+        self.db.retention.update({'raw': 2 * 86400000, '1m': 2 * 86400000})
+        self.db.apply_retention(now_ms=date_to_ms('2024-01-04') + 12 * 3600000)
+        rows = self.db.query_data('2024-01-01', '2024-01-04')
+        self.assertEqual([row[1] for row in rows], ['2024-01-03 12:00:00', '2024-01-02 12:00:00'])
+        self.assertEqual(len(self.db.partitions_between(0, 2 ** 62)), 2)
+        self.assertEqual(self.db.conn.execute('SELECT COUNT(*) FROM metrics').fetchone()[0], 2)
+        # Hourly rollups have a longer retention than raw data
+        self.assertEqual(len(self.db.query_rollup(0, 2 ** 62, '1m')), 2)
+        self.assertEqual(len(self.db.query_rollup(0, 2 ** 62, '1h')), 3)
+
+    def test_stats_from_sketches(self):
+        # Two days of one sample a minute, plus a few seconds past the last minute
+        first = timestamp_to_ms('2024-01-01 00:00:00')
+        self.db.insert_many([
+            {**self._sample(0, cpu=float(i % 100)), 'timestamp': ms_to_timestamp(first + i * 60000)}
+            for i in range(2 * 1440)
+        ] + [{**self._sample(0, cpu=99.0), 'timestamp': ms_to_timestamp(first + 2 * 86400000 + s * 1000)}
+             for s in range(5)])
+
+        sketches, covered, above = self.db.stats(first, first + 2 * 86400000 + 10000,
+                                                 thresholds={'cpu_usage': 84.5})
+        cpu = sketches['cpu_usage']
+        self.assertEqual(cpu.count(), 2 * 1440 + 5)
+        self.assertAlmostEqual(cpu.quantile(0.5), 49.5, delta=1.0)
+        self.assertAlmostEqual(cpu.quantile(0.99), 99.0, delta=1.0)
+        self.assertEqual(sketches['disk_io'].quantile(0.5), sketches['disk_io'].quantile(0.99))
+        # The share of time above the threshold follows the share of samples
+        share = sum(1 for i in range(2 * 1440) if i % 100 > 84.5) / (2 * 1440)
+        self.assertAlmostEqual(above['cpu_usage'] / covered, share, delta=0.01)
+        self.assertEqual(self.db.stats(0, 1000)[1], 0)
+
+    def test_migration_backfills_sketches(self):
+        self.db.insert_many([self._sample(i, cpu=float(i)) for i in range(10)])
+        # A v4 database: rollups without sketches
+        self.db.conn.execute('UPDATE metrics_1m SET cpu_usage_sketch = NULL')
+        self.db.conn.execute('PRAGMA user_version = 4')
+        self.db.conn.commit()
+        self.db.close()
+
+        self.db = Database(self.test_db_file, retention=KEEP_ALL, cold_after=None)
+        start = date_to_ms('2024-01-01')
+        cpu = self.db.stats(start, start + 60000 * 60 * 12 + 60000)[0]['cpu_usage']
+        self.assertEqual(cpu.count(), 10)
+
+    def test_archived_partitions_read_transparently(self):
+        self.db.insert_many([
+            {**self._sample(i % 60, cpu=float(i)), 'timestamp': f'2024-01-0{day} 12:00:{i % 60:02d}',
+             'host': f'node-{i % 2}'}
+            for day in (1, 2) for i in range(20)
+        ])
+        before = self.db.query_data('2024-01-01', '2024-01-03')
+        node = self.db.query_range(0, 2 ** 62, 'node-1')
+        export_rows = list(self.db.iter_range(0, 2 ** 62, newest_first=False,
+                                              columns='timestamp, ts_epoch_ms, host, cpu_usage'))
+
+        self.assertEqual(self.db.archive_partitions(date_to_ms('2024-01-03')), 2)
+        self.assertEqual(self.db.partitions_between(0, 2 ** 62), [])
+        self.assertEqual(len(self.db.cold.names()), 2)
+        self.assertEqual(self.db.query_data('2024-01-01', '2024-01-03'), before)
+        self.assertEqual(self.db.query_range(0, 2 ** 62, 'node-1'), node)
+        self.assertEqual(list(self.db.iter_range(0, 2 ** 62, newest_first=False,
+                                                 columns='timestamp, ts_epoch_ms, host, cpu_usage')),
+                         export_rows)
+        self.assertEqual(self.db.get_latest_metrics(), before[0])
+
+        # A late sample brings its day back into SQLite without losing the rest
+        self.db.cold_after = 86400000
+        self.db.insert_data({**self._sample(59, cpu=99.0), 'timestamp': '2024-01-01 13:00:00'})
+        self.assertEqual(len(self.db.query_data('2024-01-01', '2024-01-02')), 21)
+        self.assertEqual(len(self.db.query_data('2024-01-02', '2024-01-03')), 20)
+        # It stays in SQLite for further late samples instead of being
+        # archived again by the write that thawed it
+        self.assertEqual(self.db.partitions_between(0, 2 ** 62), ['metrics_p20240101'])
+        self.db.insert_data({**self._sample(59, cpu=98.0), 'timestamp': '2024-01-01 13:00:01'})
+        self.assertEqual(len(self.db.query_data('2024-01-01', '2024-01-02')), 22)
+        # The next new day archives it once with everything that arrived
+        self.db.insert_data({**self._sample(0), 'timestamp': '2024-01-05 12:00:00'})
+        self.assertNotIn('metrics_p20240101', self.db.partitions_between(0, 2 ** 62))
+        self.assertEqual(len(self.db.query_data('2024-01-01', '2024-01-02')), 22)
+
+        # Archived data still expires with the raw retention
+        self.db.retention['raw'] = 86400000
+        self.db.apply_retention(now_ms=date_to_ms('2024-01-07'))
+        self.assertEqual(self.db.cold.names(), [])
+        self.assertEqual(self.db.query_data('2024-01-01', '2024-01-07'), [])
+
+    def test_process_samples(self):
+        first = timestamp_to_ms('2024-01-01 12:00:00')
+        self.db.buffer_processes('localhost', first, [(10, 'worker', 90.0, 4096, 0.0)])
+        self.db.buffer_processes('localhost', first + 1000, [(11, 'db', 5.0, 8192, 100.0),
+                                                              (12, 'web', 50.0, 1024, 0.0)])
+        self.db.buffer_processes('node-1', first + 2000, [(13, 'other', 1.0, 1, 0.0)])
+
+        tick, rows = self.db.query_processes()
+        self.assertEqual(tick, first + 1000)
+        self.assertEqual([row[1] for row in rows], ['web', 'db'])
+        # The tick at or before a timestamp, e.g. when an alert fired
+        self.assertEqual(self.db.query_processes(first + 999)[1], [(10, 'worker', 90.0, 4096, 0.0)])
+        self.assertEqual(self.db.query_processes(first - 1), (None, []))
+        self.assertEqual(self.db.query_processes(host='node-1')[0], first + 2000)
+
+        self.db.retention['raw'] = 500
+        self.db.apply_retention(now_ms=first + 1200)
+        self.assertEqual(self.db.query_processes(first + 999), (None, []))
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,58 @@
+# SysMoniTool/tests/test_export.py
+
+import unittest
+import io
+import json
+import os
+import shutil
+import tempfile
+from context import *
+from database import Database, date_to_ms
+import export
+
+KEEP_ALL = {'raw': None, '1m': None, '1h': None, '1d': None}
+
+class TestExport(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.db = Database(os.path.join(self.test_dir, 'export.db'), retention=KEEP_ALL)
+        # Two days, so the range spans two partitions
+        self.db.insert_many([
+            {'timestamp': f'2024-01-0{day} 12:00:{second:02d}', 'cpu_usage': day * 100 + second,
+             'memory_usage': 1.0, 'disk_io': 2.0, 'network_usage': 3.0}
+            for day in (1, 2) for second in range(5)
+        ])
+        self.start, self.end = date_to_ms('2024-01-01'), date_to_ms('2024-01-03')
+
+    def tearDown(self):
+        self.db.close()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_iter_range_streams_in_time_order(self):
+        rows = self.db.iter_range(self.start, self.end, newest_first=False, chunk_size=2)
+        self.assertEqual(next(rows)[2], 100.0)
+        self.assertEqual([row[2] for row in rows], [101, 102, 103, 104, 200, 201, 202, 203, 204])
+        newest = list(self.db.iter_range(self.start, self.end, chunk_size=3))
+        self.assertEqual(newest, self.db.query_range(self.start, self.end))
+        self.assertEqual(newest[0][2], 204.0)
+
+    def test_csv_export(self):
+        out = io.StringIO()
+        rows = self.db.iter_range(self.start, self.end, newest_first=False, columns=export.RAW_SELECT)
+        self.assertEqual(export.write_rows(rows, export.RAW_COLUMNS, out), 10)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], 'timestamp,ts_epoch_ms,host,cpu_usage,memory_usage,disk_io,network_usage')
+        self.assertEqual(lines[1], f"2024-01-01 12:00:00,{date_to_ms('2024-01-01 12:00:00')},"
+                                   f"localhost,100.0,1.0,2.0,3.0")
+        self.assertEqual(len(lines), 11)
+
+    def test_ndjson_rollup_export(self):
+        out = io.StringIO()
+        rows = self.db.iter_rollup(self.start, self.end, '1d', newest_first=False)
+        export.write_rows(rows, export.ROLLUP_COLUMNS, out, 'ndjson')
+        days = [json.loads(line) for line in out.getvalue().splitlines()]
+        self.assertEqual([day['sample_count'] for day in days], [5, 5])
+        self.assertEqual(days[1]['cpu_usage_max'], 204.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+# SysMoniTool/tests/test_ingest_server.py
+
+import unittest
+import asyncio
+import tempfile
+import shutil
+import os
+import time
+import sqlite3
+from context import *
+from database import Database, date_to_ms
+from ingest_server import IngestServer
+
+class TestIngestServer(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.test_dir, 'ingest.db')
+        # Today, so the server's default retention keeps the samples
+        self.day = time.strftime('%Y-%m-%d')
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def _record(self, second, cpu):
+        return f"{cpu},50.0,1.0,2.0,{self.day} 00:00:{second:02d}\n".encode()
+
+    def test_samples_tagged_per_host(self):
+        async def scenario():
+            server = IngestServer('127.0.0.1', 0, self.db_path, flush_interval=0.05)
+            await server.start()
+
+            async def agent(name, count, cpu):
+                reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+                if name:
+                    writer.write(f"#host {name}\n".encode())
+                for second in range(count):
+                    writer.write(self._record(second, cpu))
+                    await writer.drain()
+                # Unterminated final record from a legacy collector
+                writer.write(self._record(59, cpu).rstrip(b'\n'))
+                writer.close()
+                await writer.wait_closed()
+
+            await asyncio.gather(*(agent(f'node-{i}', 10, float(i)) for i in range(20)),
+                                 agent(None, 3, 99.0))
+            # Let the connections finish and the writer drain
+            for _ in range(100):
+                await asyncio.sleep(0.02)
+                if not server.connections and server.queue.empty():
+                    break
+            await server.stop()
+
+        asyncio.run(scenario())
+
+        db = Database(self.db_path)
+        try:
+            start = date_to_ms(self.day)
+            end = start + 24 * 60 * 60 * 1000
+            hosts = db.get_hosts()
+            self.assertEqual(len(hosts), 21)
+            self.assertIn('127.0.0.1', hosts)
+
+            rows = db.query_range(start, end, host='node-7')
+            self.assertEqual(len(rows), 11)
+            self.assertTrue(all(row[2] == 7.0 and row[6] == 'node-7' for row in rows))
+            self.assertEqual(len(db.query_range(start, end, host='127.0.0.1')), 4)
+            self.assertEqual(len(db.query_range(start, end)), 20 * 11 + 4)
+
+            self.assertEqual(db.get_latest_metrics(host='node-3')[2], 3.0)
+            bucket = db.query_rollup(start, end, '1d', host='node-5')
+            self.assertEqual(bucket[0][1], 11)
+            merged = db.query_rollup(start, end, '1d')
+            self.assertEqual(merged[0][1], 20 * 11 + 4)
+        finally:
+            db.close()
+
+    def test_invalid_sample_does_not_drop_batch(self):
+        async def scenario():
+            server = IngestServer('127.0.0.1', 0, self.db_path, flush_interval=0.2)
+            await server.start()
+            for name, records in (('good', [self._record(0, 1.0), self._record(1, 2.0)]),
+                                  ('bad', [b"3.0,50.0,1.0,2.0,yesterday\n"])):
+                reader, writer = await asyncio.open_connection('127.0.0.1', server.port)
+                writer.write(f"#host {name}\n".encode() + b''.join(records))
+                await writer.drain()
+                writer.close()
+                await writer.wait_closed()
+            for _ in range(100):
+                await asyncio.sleep(0.02)
+                if not server.connections and server.queue.empty():
+                    break
+            await server.stop()
+
+        asyncio.run(scenario())
+
+        db = Database(self.db_path)
+        try:
+            self.assertEqual(len(db.query_range(0, 2 ** 62, host='good')), 2)
+            self.assertEqual(db.query_range(0, 2 ** 62, host='bad'), [])
+        finally:
+            db.close()
+
+    def test_failed_write_is_retried(self):
+        async def scenario():
+            server = IngestServer('127.0.0.1', 0, self.db_path, flush_interval=0.05)
+            await server.start()
+            write_rows = server.db.write_rows
+            failures = []
+
+            def locked_once(rows):
+                if not failures:
+                    failures.append(len(rows))
+                    raise sqlite3.OperationalError('database is locked')
+                write_rows(rows)
+
+            server.db.write_rows = locked_once
+            await server.write_batch([{'cpu_usage': 1.0, 'memory_usage': 50.0, 'disk_io': 1.0,
+                                       'network_usage': 2.0, 'timestamp': f'{self.day} 00:00:00',
+                                       'host': 'node-1'}])
+            await server.stop()
+            return failures
+
+        self.assertEqual(asyncio.run(scenario()), [1])
+        db = Database(self.db_path)
+        try:
+            self.assertEqual(len(db.query_range(0, 2 ** 62, host='node-1')), 1)
+        finally:
+            db.close()
+
+if __name__ == '__main__':
+    unittest.main()
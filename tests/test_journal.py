@@ -0,0 +1,181 @@
+# SysMoniTool/tests/test_journal.py
+
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import json
+import sqlite3
+from unittest import mock
+from context import *
+from database import Database, ms_to_timestamp
+from journal import Journal, Persister, encode_sample, decode_sample, RECORD, SEGMENT_HEADER, JOURNAL_NAME, \
+    REJECT_LOG
+
+SEGMENT_BYTES = 1024
+
+class TestJournal(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.directory = os.path.join(self.test_dir, 'spill')
+        self.start_ms = int(time.time() * 1000) - 3600 * 1000
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir)
+
+    def sample(self, i):
+        ts_ms = self.start_ms + i * 1000
+        return {'timestamp': ms_to_timestamp(ts_ms), 'ts_epoch_ms': ts_ms, 'cpu_usage': float(i),
+                'memory_usage': 50.0, 'disk_io': 1.5, 'network_usage': 2.5, 'host': 'node-1'}
+
+    def append(self, journal, first, count):
+        return [journal.append(encode_sample(self.sample(i), self.start_ms + i * 1000))
+                for i in range(first, first + count)]
+
+    def wait_committed(self, journal):
+        for _ in range(500):
+            if not journal.pending():
+                return
+            time.sleep(0.01)
+
+    def segments(self):
+        return sorted(name for name in os.listdir(self.directory) if name.endswith('.seg'))
+
+    def test_append_read_release(self):
+        journal = Journal(self.directory, segment_bytes=SEGMENT_BYTES)
+        self.assertEqual(self.append(journal, 0, 40), list(range(1, 41)))
+        self.assertGreater(len(self.segments()), 2)
+        self.assertEqual(journal.pending(), 40)
+
+        records = journal.read(25)
+        self.assertEqual([seq for seq, _ in records], list(range(1, 26)))
+        self.assertEqual(decode_sample(records[3][1]), self.sample(3))
+        journal.release(25)
+        self.assertEqual(journal.pending(), 15)
+        # Segments holding only released records are gone
+        first = int(self.segments()[0].split('.')[0])
+        self.assertLessEqual(first, 26)
+        self.assertGreater(first, 1)
+        self.assertEqual([seq for seq, _ in journal.read(100)], list(range(26, 41)))
+        journal.close()
+
+        # Reopened with the applied seq: the rest is replayed and appends continue
+        journal = Journal(self.directory, 26, segment_bytes=SEGMENT_BYTES)
+        self.assertEqual(journal.replayed, 15)
+        self.assertEqual(self.append(journal, 40, 1), [41])
+        self.assertEqual([seq for seq, _ in journal.read(100)], list(range(26, 42)))
+        journal.close()
+
+    def test_torn_record_ignored(self):
+        journal = Journal(self.directory, segment_bytes=SEGMENT_BYTES)
+        self.append(journal, 0, 3)
+        segment = journal.segments[-1]
+        # A crash after the header of the next record but before its payload
+        RECORD.pack_into(segment.mm, segment.end, 20, 12345, 4)
+        journal.close()
+
+        journal = Journal(self.directory, segment_bytes=SEGMENT_BYTES)
+        self.assertEqual(journal.pending(), 3)
+        self.assertEqual(self.append(journal, 3, 1), [4])
+        self.assertEqual(decode_sample(journal.read(10)[-1][1]), self.sample(3))
+        journal.close()
+
+    def test_full_journal_waits_for_release(self):
+        journal = Journal(self.directory, segment_bytes=SEGMENT_BYTES, max_segments=2)
+        with self.assertRaises(OSError):
+            Journal(self.directory)
+        size = RECORD.size + len(encode_sample(self.sample(0), self.start_ms))
+        per_segment = (SEGMENT_BYTES - SEGMENT_HEADER.size) // size
+        self.append(journal, 0, 2 * per_segment)
+        self.assertEqual(len(self.segments()), 2)
+        self.assertAlmostEqual(journal.fill(), 1.0, delta=0.1)
+
+        appended = []
+        writer = threading.Thread(target=lambda: appended.extend(self.append(journal, 100, 1)))
+        writer.start()
+        writer.join(0.2)
+        self.assertTrue(writer.is_alive())
+        journal.read(per_segment)
+        journal.release(per_segment)
+        writer.join(5)
+        self.assertEqual(appended, [2 * per_segment + 1])
+        journal.close()
+
+    def test_persister_replays_idempotently(self):
+        db_path = os.path.join(self.test_dir, 'test.db')
+        journal = Journal(self.directory, segment_bytes=SEGMENT_BYTES)
+        self.append(journal, 0, 50)
+        journal.close()
+
+        # A crash after committing the first 20 but before their segments
+        # were released
+        db = Database(db_path, cold_after=None)
+        db.write_rows(db.prepare_rows([self.sample(i) for i in range(20)]), (JOURNAL_NAME, 20))
+
+        journal = Journal(self.directory, db.journal_applied(JOURNAL_NAME) + 1, segment_bytes=SEGMENT_BYTES)
+        persister = Persister(db_path, journal, batch_size=8)
+        persister.start()
+        persister.submit_processes('node-1', self.start_ms, [(1, 'init', 0.5, 4096, 0.0)])
+        self.append(journal, 50, 10)
+        persister.stop(10)
+        self.assertFalse(persister.is_alive())
+        journal.close()
+
+        rows = db.query_range(self.start_ms, self.start_ms + 3600 * 1000)
+        self.assertEqual(sorted(row[2] for row in rows), [float(i) for i in range(60)])
+        self.assertEqual(db.journal_applied(JOURNAL_NAME), 60)
+        self.assertEqual(db.query_processes(host='node-1')[1][0][:2], (1, 'init'))
+        db.close()
+
+    def test_persister_retry_skips_committed_records(self):
+        class FailAfterCommit(Persister):
+            failed = False
+
+            def commit(self, db, batch):
+                super().commit(db, batch)
+                if not self.failed:
+                    self.failed = True
+                    raise sqlite3.Error("disk I/O error")
+
+        db_path = os.path.join(self.test_dir, 'test.db')
+        journal = Journal(self.directory, segment_bytes=SEGMENT_BYTES)
+        self.append(journal, 0, 10)
+        persister = FailAfterCommit(db_path, journal, flush_interval=0.01)
+        with mock.patch('journal.MIN_RETRY_DELAY', 0.001):
+            persister.start()
+            self.wait_committed(journal)
+            persister.stop(10)
+        self.assertTrue(persister.failed)
+        journal.close()
+
+        db = Database(db_path, cold_after=None)
+        self.assertEqual(sorted(row[2] for row in db.query_range(0, 2 ** 62)), [float(i) for i in range(10)])
+        self.assertEqual(db.query_rollup(0, 2 ** 62, '1d')[0][1], 10)
+        db.close()
+
+    def test_persister_rejects_record_that_keeps_failing(self):
+        db_path = os.path.join(self.test_dir, 'test.db')
+        journal = Journal(self.directory, segment_bytes=SEGMENT_BYTES)
+        self.append(journal, 0, 3)
+        journal.append(b'garbage')
+        self.append(journal, 3, 3)
+        persister = Persister(db_path, journal, flush_interval=0.01)
+        with mock.patch('journal.MIN_RETRY_DELAY', 0.001):
+            persister.start()
+            self.wait_committed(journal)
+            persister.stop(10)
+        self.assertEqual(journal.pending(), 0)
+        journal.close()
+
+        db = Database(db_path, cold_after=None)
+        self.assertEqual(sorted(row[2] for row in db.query_range(0, 2 ** 62)), [float(i) for i in range(6)])
+        self.assertEqual(db.journal_applied(JOURNAL_NAME), 7)
+        db.close()
+        with open(os.path.join(self.directory, REJECT_LOG)) as f:
+            rejected = [json.loads(line) for line in f]
+        self.assertEqual([(r['seq'], r['payload']) for r in rejected], [(4, b'garbage'.hex())])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+# SysMoniTool/tests/test_loadgen.py
+
+import unittest
+import os
+import shutil
+import socket
+import tempfile
+import threading
+from context import *
+from database import Database
+from protocol import RecordBuffer, parse_records
+import loadgen
+import bench
+
+class TestLoadGenerator(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_push_collector_speaks_protocol(self):
+        server = socket.create_server(('127.0.0.1', 0), backlog=2)
+        port = server.getsockname()[1]
+        received = {}
+
+        def read_all(conn):
+            stream = RecordBuffer()
+            while True:
+                chunk = conn.recv(65536)
+                if not chunk:
+                    break
+                stream.feed(chunk)
+            records = []
+            while True:
+                record = stream.next_record()
+                if record is None:
+                    break
+                records.append(record)
+            received[records[0]] = [parse_records(record)[0] for record in records[1:]]
+            conn.close()
+
+        def accept():
+            threads = []
+            for _ in range(2):
+                conn, _ = server.accept()
+                thread = threading.Thread(target=read_all, args=(conn,))
+                thread.start()
+                threads.append(thread)
+            for thread in threads:
+                thread.join()
+
+        acceptor = threading.Thread(target=accept)
+        acceptor.start()
+        collector = loadgen.SyntheticCollector('127.0.0.1', port, rate=0, hosts=2, count=700, stamp=True)
+        self.assertEqual(collector.run(), 1400)
+        acceptor.join(5)
+        server.close()
+
+        self.assertEqual(sorted(received), [b'#host synthetic-0', b'#host synthetic-1'])
+        samples = received[b'#host synthetic-1']
+        self.assertEqual(len(samples), 700)
+        # Stamped samples carry their send time
+        self.assertGreater(samples[0]['network_usage'], 1e12)
+
+    def test_fill_database(self):
+        db_path = os.path.join(self.test_dir, 'fill.db')
+        first, last = loadgen.fill_database(db_path, 1000, hosts=2, batch_size=300)
+        db = Database(db_path)
+        try:
+            self.assertEqual(len(db.query_range(first, last + 1)), 1000)
+            self.assertEqual(db.get_hosts(), ['synthetic-0', 'synthetic-1'])
+        finally:
+            db.close()
+
+    def test_compare_flags_regressions(self):
+        old = {'results': {'ingest': {'samples_per_s': 1000.0, 'commit_latency_ms': {'p99': 10.0}},
+                           'query': {'1000': {'query_data_hour_rows': 5}}}}
+        new = {'results': {'ingest': {'samples_per_s': 700.0, 'commit_latency_ms': {'p99': 11.0}},
+                           'query': {'1000': {'query_data_hour_rows': 50}}}}
+        self.assertEqual(bench.compare(old, new, 0.2), [('ingest.samples_per_s', 1000.0, 700.0)])
+        self.assertEqual(bench.percentiles([3, 1, 2], scale=1000.0)['max'], 3000.0)
+
+if __name__ == '__main__':
+    unittest.main()
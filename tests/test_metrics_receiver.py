@@ -6,6 +6,8 @@ import threading
 import time
 from context import *
 from automation import MetricsReceiver
+from database import Database, timestamp_to_ms
+from protocol import encode_frame
 import tempfile
 import json
 import os
@@ -38,7 +40,14 @@ class TestMetricsReceiver(unittest.TestCase):
         time.sleep(0.1)  # Small delay to ensure server is ready
         
     def tearDown(self):
+        self.receiver.close()
         try:
+            # shutdown() wakes a mock server still blocked in accept() so the
+            # port is actually released for the next test
+            try:
+                self.mock_server.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
             self.mock_server.close()
             time.sleep(0.1)  # Allow time for socket to close
         except Exception as e:
@@ -90,6 +99,134 @@ class TestMetricsReceiver(unittest.TestCase):
         metrics = self.receiver.receive_metrics()
         self.assertIsNone(metrics)
 
+    def test_streamed_records_split_across_reads(self):
+        # One connection carries several records, split at arbitrary points
+        class MockSocket:
+            def __init__(self):
+                self.chunks = [
+                    b"50.0,60.0,70.0,80.0,2024-01-01 12:00:00\n51.0,6",
+                    b"1.0,71.0,81.0,2024-01-01 12:",
+                    b"00:01\n52.0,62.0,72.0,82.0,2024-01-01 12:00:02\n",
+                    b""
+                ]
+            def recv(self, size):
+                return self.chunks.pop(0)
+            def close(self):
+                pass
+
+        self.receiver.socket = MockSocket()
+        cpu_values = []
+        for _ in range(3):
+            metrics = self.receiver.receive_metrics()
+            self.assertIsNotNone(metrics)
+            cpu_values.append(metrics['cpu_usage'])
+        self.assertEqual(cpu_values, [50.0, 51.0, 52.0])
+        self.assertEqual(metrics['timestamp'], '2024-01-01 12:00:02')
+
+        # EOF drops the connection so run() reconnects
+        self.assertIsNone(self.receiver.receive_metrics())
+        self.assertIsNone(self.receiver.socket)
+
+    def test_binary_frames_mixed_with_csv(self):
+        ms = timestamp_to_ms('2024-01-01 12:00:00')
+        # A fifth field from a newer collector is ignored
+        frame = encode_frame([(ms, 10.0, 20.0, 30.0, 40.0, 99.0),
+                              (ms + 1500, 11.0, 21.0, 31.0, 41.0, 99.0)], fields=5)
+
+        class MockSocket:
+            def __init__(self):
+                self.chunks = [frame[:5], frame[5:30],
+                               frame[30:] + b"52.0,62.0,72.0,82.0,2024-01-01 12:00:02\n", b""]
+            def recv(self, size):
+                return self.chunks.pop(0)
+            def close(self):
+                pass
+
+        self.receiver.socket = MockSocket()
+        samples = [self.receiver.receive_metrics() for _ in range(3)]
+        self.assertEqual([m['cpu_usage'] for m in samples], [10.0, 11.0, 52.0])
+        self.assertEqual(samples[1]['network_usage'], 41.0)
+        self.assertEqual(samples[1]['ts_epoch_ms'], ms + 1500)
+        self.assertEqual(samples[1]['timestamp'], '2024-01-01 12:00:01')
+        self.assertIsNone(self.receiver.receive_metrics())
+
+    def test_unsupported_frame_version(self):
+        frame = bytearray(encode_frame([(0, 1.0, 2.0, 3.0, 4.0)]))
+        frame[2] = 2
+
+        class MockSocket:
+            def recv(self, size):
+                return bytes(frame)
+            def close(self):
+                pass
+
+        self.receiver.socket = MockSocket()
+        self.assertIsNone(self.receiver.receive_metrics())
+        self.assertEqual(len(self.receiver.stream.buffer), 0)
+
+    def test_non_finite_metrics_rejected(self):
+        ms = timestamp_to_ms('2024-01-01 12:00:00')
+        frame = encode_frame([(ms, float('inf'), 20.0, 30.0, 40.0)])
+
+        class MockSocket:
+            def __init__(self):
+                self.chunks = [b"nan,60.0,70.0,80.0,2024-01-01 12:00:00\n" + frame +
+                               b"52.0,62.0,72.0,82.0,2024-01-01 12:00:02\n", b""]
+            def recv(self, size):
+                return self.chunks.pop(0)
+            def close(self):
+                pass
+
+        self.receiver.socket = MockSocket()
+        self.assertIsNone(self.receiver.receive_metrics())
+        self.assertIsNone(self.receiver.receive_metrics())
+        metrics = self.receiver.receive_metrics()
+        self.assertEqual(metrics['cpu_usage'], 52.0)
+
+    def test_thresholds_reloaded_when_changed(self):
+        rules = self.receiver.rules
+        # Not due yet, and nothing changed
+        self.assertFalse(self.receiver.check_thresholds())
+        self.receiver.request_reload()
+        self.assertFalse(self.receiver.check_thresholds())
+        self.assertIs(self.receiver.rules, rules)
+
+        other = Database(self.db_path)
+        try:
+            other.update_threshold('cpu_usage', 42.0)
+        finally:
+            other.close()
+        self.receiver.next_reload_check = 0
+        self.assertTrue(self.receiver.check_thresholds())
+        self.assertEqual(self.receiver.thresholds['cpu_usage'], 42.0)
+        self.assertEqual(self.receiver.rules.rules[0].trigger, 42.0)
+        self.assertIsNot(self.receiver.rules, rules)
+
+        # Other writes to the database do not trigger a reload
+        self.receiver.next_reload_check = 0
+        self.assertFalse(self.receiver.check_thresholds())
+
+    def test_detector_state_checkpointed(self):
+        start = timestamp_to_ms('2024-01-01 12:00:00')
+        for i in range(70):
+            self.receiver.handle_sample({'timestamp': '2024-01-01 12:00:00', 'ts_epoch_ms': start + i * 1000,
+                                         'cpu_usage': 1.0, 'memory_usage': 1.0,
+                                         'disk_io': 2.0, 'network_usage': 3.0})
+        # Checkpointed once a minute of samples has been seen and on close,
+        # committed by the persister with the samples
+        self.receiver.close()
+        db = Database(self.db_path)
+        try:
+            saved = db.load_detector_state('localhost')
+            self.assertEqual(set(saved), {'disk_io_anomaly', 'network_usage_anomaly'})
+            self.assertEqual(db.journal_applied('spill'), self.receiver.journal.next_seq - 1)
+        finally:
+            db.close()
+
+        self.receiver = MetricsReceiver(host='localhost', port=self.port, db_path=self.db_path)
+        baseline = self.receiver.rules.rules[-1].baseline
+        self.assertEqual(baseline.dump(), saved['network_usage_anomaly'])
+
 if __name__ == '__main__':
     unittest.main()
 
@@ -0,0 +1,90 @@
+# SysMoniTool/tests/test_processes.py
+
+import unittest
+import tempfile
+import shutil
+import os
+from unittest import mock
+from context import *
+import processes
+from processes import ProcessSampler, parse_stat, CLOCK_TICKS, PAGE_SIZE
+
+def stat_line(pid, name, ticks, start_time, rss_pages):
+    # Fields 3-24 of proc(5): state, then zeros except utime, starttime and rss
+    fields = ['S'] + ['0'] * 21
+    fields[11] = str(ticks)
+    fields[19] = str(start_time)
+    fields[21] = str(rss_pages)
+    return f"{pid} ({name}) {' '.join(fields)} 0 0\n"
+
+class TestProcessSampler(unittest.TestCase):
+    def setUp(self):
+        self.proc = tempfile.mkdtemp()
+        self.clock = [100.0]
+        patcher = mock.patch.object(processes.time, 'monotonic', lambda: self.clock[0])
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        shutil.rmtree(self.proc, ignore_errors=True)
+
+    def _write(self, pid, name, ticks, start_time=1, rss_pages=1, io=None):
+        directory = os.path.join(self.proc, str(pid))
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, 'stat'), 'w') as f:
+            f.write(stat_line(pid, name, ticks, start_time, rss_pages))
+        if io is not None:
+            with open(os.path.join(directory, 'io'), 'w') as f:
+                f.write(f"rchar: 1\nread_bytes: {io}\nwrite_bytes: 0\n")
+
+    def test_parse_stat_with_awkward_name(self):
+        name, ticks, start, rss = parse_stat(stat_line(7, 'a) b', 42, 9, 3).encode())
+        self.assertEqual((name, ticks, start, rss), ('a) b', 42, 9, 3))
+
+    def test_cpu_deltas_and_top_lists(self):
+        self._write(10, 'busy', 0, rss_pages=10, io=0)
+        self._write(11, 'big', 0, rss_pages=1000, io=0)
+        self._write(12, 'idle', 0, rss_pages=1, io=0)
+        sampler = ProcessSampler(top_n=1, proc_root=self.proc)
+        try:
+            sampler.sample()
+            self._write(10, 'busy', CLOCK_TICKS, rss_pages=10, io=1000)
+            self._write(11, 'big', 0, rss_pages=1000, io=5000)
+            self.clock[0] += 2.0
+            top = sampler.sample()
+            rows = {row[0]: row for row in top}
+            # Top CPU and top RSS; idle is in neither list
+            self.assertEqual(set(rows), {10, 11})
+            self.assertEqual(rows[10][2], 50.0)
+            self.assertEqual(rows[11][3], 1000 * PAGE_SIZE)
+            self.assertEqual(rows[10][4], 500.0)
+            # big used no CPU, so its io file is not re-read
+            self.assertEqual(rows[11][4], 0.0)
+
+            # Exited and reused PIDs are forgotten
+            shutil.rmtree(os.path.join(self.proc, '10'))
+            self._write(11, 'reused', 0, start_time=2)
+            self.clock[0] += 1.0
+            sampler.sample()
+            self.assertEqual(set(sampler.processes), {12})
+            self.assertEqual(sampler.open_files, 1)
+            self.clock[0] += 1.0
+            sampler.sample()
+            self.assertEqual(sampler.processes[11].name, 'reused')
+        finally:
+            sampler.close()
+        self.assertEqual(sampler.open_files, 0)
+
+    def test_descriptor_budget(self):
+        for pid in range(20, 25):
+            self._write(pid, f'p{pid}', pid)
+        sampler = ProcessSampler(proc_root=self.proc, max_open_files=2)
+        try:
+            sampler.sample()
+            self.assertEqual(len(sampler.processes), 5)
+            self.assertEqual(sampler.open_files, 2)
+        finally:
+            sampler.close()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,204 @@
+# SysMoniTool/tests/test_query_server.py
+
+import json
+import os
+import shutil
+import socket
+import tempfile
+import threading
+import time
+import unittest
+from context import *
+from database import Database, ms_to_timestamp
+from query_server import QueryServer, RemoteDatabase, ResultCache, CLOSED_AFTER_MS
+
+class TestQueryServer(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.test_dir, 'test.db')
+        self.socket_path = os.path.join(self.test_dir, 'query.sock')
+        self.now_ms = int(time.time() * 1000)
+        db = Database(self.db_path, cold_after=None)
+        for i in range(60):
+            ts_ms = self.now_ms - 3600 * 1000 + i * 60 * 1000
+            db.insert_data({'timestamp': ms_to_timestamp(ts_ms), 'ts_epoch_ms': ts_ms,
+                            'cpu_usage': 10.0 + i, 'memory_usage': 50.0, 'disk_io': 1.0, 'network_usage': 2.0})
+        db.close()
+        self.server, self.thread = self.serve()
+
+    def tearDown(self):
+        self.stop(self.server, self.thread)
+        shutil.rmtree(self.test_dir)
+
+    def serve(self):
+        server = QueryServer(self.db_path, self.socket_path).open()
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        return server, thread
+
+    def stop(self, server, thread):
+        if thread.is_alive():
+            server.shutdown()
+            thread.join(5)
+
+    def test_closed_ranges_are_cached(self):
+        server = QueryServer(self.db_path)
+
+        def request(method, *args):
+            return json.loads(server.handle(json.dumps({'method': method, 'args': args}).encode()))
+
+        # The newest sample is a minute old
+        closed_end = self.now_ms - 3 * CLOSED_AFTER_MS
+        first = request('query_range', self.now_ms - 7200 * 1000, closed_end)
+        self.assertEqual(len(first['result']), 57)
+        self.assertEqual(request('query_range', self.now_ms - 7200 * 1000, closed_end), first)
+        self.assertEqual((server.cache.hits, server.cache.misses), (1, 1))
+
+        # A range that is still open is always read again
+        request('query_range', self.now_ms - 7200 * 1000, self.now_ms)
+        request('query_range', self.now_ms - 7200 * 1000, self.now_ms)
+        self.assertEqual(len(server.cache.entries), 1)
+
+        self.assertIn('error', request('update_threshold', 'cpu_usage', 1.0))
+        server.close()
+
+    def test_cache_waits_for_lagging_host_and_clears_on_archiving(self):
+        db = Database(self.db_path, cold_after=None)
+        lag_ms = self.now_ms - 1800 * 1000
+        db.insert_data({'timestamp': ms_to_timestamp(lag_ms), 'ts_epoch_ms': lag_ms, 'host': 'node-1',
+                        'cpu_usage': 1.0, 'memory_usage': 1.0, 'disk_io': 1.0, 'network_usage': 1.0})
+        server = QueryServer(self.db_path)
+
+        def request(*args):
+            return json.loads(server.handle(json.dumps({'method': 'query_range', 'args': args}).encode()))
+
+        # Closed by the clock, but node-1's samples since then may still arrive
+        start, end = self.now_ms - 7200 * 1000, self.now_ms - 1200 * 1000
+        for host in ('node-1', None):
+            request(start, end, host)
+        self.assertEqual(len(server.cache.entries), 0)
+        early = request(start, lag_ms - 2 * CLOSED_AFTER_MS)
+        self.assertEqual(len(server.cache.entries), 1)
+
+        # Archiving changes where past results come from
+        self.assertEqual(db.archive_partitions(self.now_ms + 2 * 86400 * 1000), 1)
+        db.close()
+        self.assertEqual(request(start, lag_ms - 2 * CLOSED_AFTER_MS), early)
+        self.assertEqual((server.cache.hits, len(server.cache.entries)), (0, 1))
+        server.close()
+
+    def test_late_sample_replaces_cached_result(self):
+        server = QueryServer(self.db_path)
+
+        def request(*args):
+            return json.loads(server.handle(json.dumps({'method': 'query_range', 'args': args}).encode()))
+
+        start, end = self.now_ms - 7200 * 1000, self.now_ms - 3 * CLOSED_AFTER_MS
+        self.assertEqual(len(request(start, end)['result']), 57)
+        # e.g. a journal replay writing into the partition after the range closed
+        db = Database(self.db_path, cold_after=None)
+        late_ms = self.now_ms - 3599 * 1000
+        db.insert_data({'timestamp': ms_to_timestamp(late_ms), 'ts_epoch_ms': late_ms,
+                        'cpu_usage': 1.0, 'memory_usage': 1.0, 'disk_io': 1.0, 'network_usage': 1.0})
+        db.close()
+        self.assertEqual(len(request(start, end)['result']), 58)
+        self.assertEqual(len(request(start, end)['result']), 58)
+        self.assertEqual((server.cache.hits, server.cache.misses), (1, 2))
+        server.close()
+
+    def test_remote_database_matches_local(self):
+        local = Database(self.db_path, readonly=True)
+        remote = RemoteDatabase.connect(self.socket_path, lambda: local)
+        start, end = self.now_ms - 7200 * 1000, self.now_ms - 2 * CLOSED_AFTER_MS
+        self.assertEqual(remote.query_range(start, end), local.query_range(start, end))
+        self.assertEqual(remote.get_latest_metrics(), local.get_latest_metrics())
+        self.assertEqual(remote.get_hosts(), local.get_hosts())
+        merged, covered_ms, _ = remote.stats(start, end)
+        expected, expected_ms, _ = local.stats(start, end)
+        self.assertEqual(covered_ms, expected_ms)
+        self.assertEqual(merged['cpu_usage'].count(), expected['cpu_usage'].count())
+        # Methods the server does not serve go to the local database
+        self.assertEqual(remote.data_version(), local.data_version())
+        remote.close()
+
+    def test_idle_client_does_not_block_others(self):
+        idle = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        idle.connect(self.socket_path)
+        # Half a request: the server must not wait for the rest
+        idle.sendall(b'{"method": ')
+        local = Database(self.db_path, readonly=True)
+        remote = RemoteDatabase(self.socket_path, lambda: local)
+        started = time.monotonic()
+        self.assertEqual(remote.get_latest_metrics(), local.get_latest_metrics())
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertIsNotNone(remote.sock)
+        idle.sendall(b'"get_hosts"}\n')
+        self.assertEqual(json.loads(idle.makefile('rb').readline()), {'result': ['localhost']})
+        idle.close()
+        remote.close()
+
+    def test_client_not_reading_replies_does_not_block_others(self):
+        stalled = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        stalled.connect(self.socket_path)
+        # Far more reply bytes than the socket buffers hold, never read
+        request = json.dumps({'method': 'query_range', 'args': [0, self.now_ms]}).encode() + b'\n'
+        stalled.sendall(request * 300)
+        time.sleep(0.2)
+        local = Database(self.db_path, readonly=True)
+        remote = RemoteDatabase(self.socket_path, lambda: local)
+        started = time.monotonic()
+        self.assertEqual(remote.get_hosts(), ['localhost'])
+        self.assertLess(time.monotonic() - started, 1.0)
+        self.assertIsNotNone(remote.sock)
+        # Its replies are all still delivered once it reads
+        reader = stalled.makefile('rb')
+        for _ in range(300):
+            self.assertEqual(len(json.loads(reader.readline())['result']), 60)
+        reader.close()
+        stalled.close()
+        remote.close()
+
+    def test_connects_on_first_served_call(self):
+        local = Database(self.db_path, readonly=True)
+        remote = RemoteDatabase(self.socket_path, lambda: local)
+        remote.data_version()
+        self.assertIsNone(remote.sock)
+        remote.get_hosts()
+        self.assertIsNotNone(remote.sock)
+        remote.close()
+
+    def test_empty_database(self):
+        empty_path = os.path.join(self.test_dir, 'empty.db')
+        Database(empty_path).close()
+        server = QueryServer(empty_path)
+        response = json.loads(server.handle(json.dumps({'method': 'get_latest_metrics'}).encode()))
+        self.assertEqual(response, {'result': None})
+        server.close()
+
+    def test_falls_back_without_server(self):
+        self.stop(self.server, self.thread)
+        self.assertFalse(os.path.exists(self.socket_path))
+        self.assertIsNone(RemoteDatabase.connect(self.socket_path, lambda: None))
+
+        # A connection the server dropped is replaced by the local database
+        self.server, self.thread = self.serve()
+        local = Database(self.db_path, readonly=True)
+        remote = RemoteDatabase.connect(self.socket_path, lambda: local)
+        remote.sock.shutdown(socket.SHUT_RDWR)
+        self.assertEqual(remote.get_hosts(), local.get_hosts())
+        self.assertIsNone(remote.sock)
+        remote.close()
+
+    def test_cache_evicts_least_recently_used_bytes(self):
+        cache = ResultCache(max_bytes=10)
+        cache.put('a', b'1234')
+        cache.put('b', b'1234')
+        cache.get('a')
+        cache.put('c', b'1234')
+        self.assertEqual(list(cache.entries), ['a', 'c'])
+        self.assertEqual(cache.size, 8)
+        cache.put('d', b'x' * 11)
+        self.assertIsNone(cache.get('d'))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,80 @@
+# SysMoniTool/tests/test_recent.py
+
+import unittest
+import os
+import shutil
+import struct
+import tempfile
+from context import *
+from recent import RecentHistory, HEADER_SIZE, SEQ_OFFSET
+
+class TestRecentHistory(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.test_dir, 'recent.mmap')
+        self.writer = RecentHistory.create(self.path, capacity=4)
+
+    def tearDown(self):
+        self.writer.close()
+        shutil.rmtree(self.test_dir)
+
+    def test_missing_file(self):
+        self.assertIsNone(RecentHistory.open(os.path.join(self.test_dir, 'missing.mmap')))
+
+    def test_reader_sees_writer_samples(self):
+        reader = RecentHistory.open(self.path)
+        try:
+            self.assertIsNone(reader.latest())
+            self.writer.append(1000, 10.0, 20.0, 30.0, 40.0)
+            self.writer.append(2000, 11.0, 21.0, 31.0, 41.0)
+            latest = reader.latest()
+            self.assertEqual(latest[2:], (11.0, 21.0, 31.0, 41.0))
+            self.assertEqual(reader.latest_ms(), 2000)
+        finally:
+            reader.close()
+
+    def test_since_wraps_and_reports_coverage(self):
+        for i in range(6):
+            self.writer.append(1000 * i, float(i), 0.0, 0.0, 0.0)
+        reader = RecentHistory.open(self.path)
+        try:
+            # Capacity 4: samples 2..5 remain, newest first
+            rows = reader.since(3000)
+            self.assertEqual([row[2] for row in rows], [5.0, 4.0, 3.0])
+            # Samples before 2000 were overwritten, so the window is not covered
+            self.assertIsNone(reader.since(1000))
+        finally:
+            reader.close()
+
+    def test_reopen_keeps_history(self):
+        self.writer.append(1000, 10.0, 20.0, 30.0, 40.0)
+        self.writer.close()
+        self.writer = RecentHistory.create(self.path, capacity=4)
+        self.assertEqual(self.writer.latest_ms(), 1000)
+
+    def test_stuck_writer_does_not_hang_readers(self):
+        self.writer.append(1000, 10.0, 20.0, 30.0, 40.0)
+        # A writer killed mid-append leaves the sequence odd
+        self.writer.seq += 1
+        struct.pack_into('<Q', self.writer.mm, SEQ_OFFSET, self.writer.seq)
+        reader = RecentHistory.open(self.path)
+        try:
+            self.assertIsNone(reader.latest())
+            self.assertIsNone(reader.latest_ms())
+            self.assertIsNone(reader.since(0))
+        finally:
+            reader.close()
+        # The next writer starts from an even sequence
+        self.writer.close()
+        self.writer = RecentHistory.create(self.path, capacity=4)
+        self.assertEqual(self.writer.seq % 2, 0)
+        self.assertEqual(self.writer.latest_ms(), 1000)
+
+    def test_open_while_being_resized(self):
+        # create() truncates a file it cannot reuse before growing it again
+        with open(self.path, 'r+b') as f:
+            f.truncate(HEADER_SIZE)
+        self.assertIsNone(RecentHistory.open(self.path))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,113 @@
+# SysMoniTool/tests/test_replay.py
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from context import *
+from database import Database, ms_to_timestamp, DEFAULT_HOST
+from rules import RuleEngine
+
+try:
+    import numpy
+    from replay import Replay, chunks, replay, recurrence
+except ImportError:
+    numpy = None
+
+START_MS = 1704110400000
+
+THRESHOLD_SETS = [
+    {'cpu_usage': 80.0, 'cpu_usage_duration': 5.0, 'memory_usage': 70.0, 'memory_usage_window': 10,
+     'memory_usage_clear': 60.0, 'memory_usage_duration': 0.0, 'disk_io_rate': 3.0,
+     'disk_io_anomaly': 3.0, 'disk_io_anomaly_duration': 2.0, 'network_usage_anomaly': 2.5,
+     'network_usage_anomaly_seasonal': 0, 'network_usage_anomaly_halflife': 50},
+    {'cpu_usage': 90.0, 'cpu_usage_clear': 50.0, 'cpu_usage_duration': 0.0,
+     'cpu_usage_window': 3, 'disk_io': 20.0, 'disk_io_duration': 30.0},
+    # Same signals as the first set at other levels
+    {'cpu_usage': 70.0, 'disk_io_anomaly': 2.0, 'network_usage_anomaly': 3.0,
+     'network_usage_anomaly_seasonal': 0, 'network_usage_anomaly_halflife': 50},
+]
+
+
+def series(count, seed=7):
+    """Random-walk samples at 1 Hz with occasional spikes and gaps."""
+    rng = random.Random(seed)
+    rows, ts, values = [], START_MS, [50.0, 50.0, 10.0, 5.0]
+    for i in range(count):
+        ts += 1000 if rng.random() > 0.01 else 60000
+        values = [min(100.0, max(0.0, v + rng.gauss(0, 4))) for v in values]
+        spike = 40.0 if rng.random() < 0.02 else 0.0
+        rows.append((ts, values[0], values[1], values[2] + spike, values[3] + spike / 2))
+    return rows
+
+
+def expected(thresholds, rows):
+    """Per rule (episodes, fires, first, last) from the receiver's RuleEngine, sample by sample."""
+    engine = RuleEngine.compile(thresholds)
+    stats = {rule.name: [0, 0, None, None] for rule in engine.rules}
+    for ts, cpu, memory, disk, network in rows:
+        was = {rule.name: rule.breached for rule in engine.rules}
+        t = ts / 1000.0
+        fired = engine.evaluate({'cpu_usage': cpu, 'memory_usage': memory, 'disk_io': disk,
+                                 'network_usage': network}, t)
+        for rule in engine.rules:
+            if rule.breached and not was[rule.name]:
+                stats[rule.name][0] += 1
+        for rule in fired:
+            entry = stats[rule.name]
+            entry[1] += 1
+            entry[2] = t if entry[2] is None else entry[2]
+            entry[3] = t
+    return stats
+
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class TestReplay(unittest.TestCase):
+    def assertMatches(self, results, rows):
+        for thresholds, rules in zip(THRESHOLD_SETS, results):
+            want = expected(thresholds, rows)
+            got = {r.name: [r.episodes, r.fires, r.first, r.last] for r in rules}
+            self.assertEqual(got, want)
+            self.assertTrue(any(r.fires for r in rules))
+
+    def test_matches_rule_engine(self):
+        rows = series(5000)
+        # Small chunks: windows, baselines and breaches carry across them
+        for chunk_rows in (len(rows), 333):
+            result = Replay(THRESHOLD_SETS)
+            for chunk in chunks(iter(rows), chunk_rows):
+                result.feed(chunk)
+            self.assertEqual(result.samples, len(rows))
+            self.assertMatches(result.results, rows)
+
+    def test_recurrence(self):
+        b = numpy.linspace(-1.0, 1.0, 1000)
+        for c in (0.999, 0.5, 1.0):
+            y, want = 3.0, []
+            for value in b:
+                y = c * y + value
+                want.append(y)
+            numpy.testing.assert_allclose(recurrence(c, b, 3.0), want, rtol=1e-9, atol=1e-9)
+
+    def test_replay_from_database(self):
+        test_dir = tempfile.mkdtemp()
+        try:
+            db = Database(os.path.join(test_dir, 'test.db'), cold_after=None, retention={'raw': None})
+            rows = series(2000, seed=3)
+            db.insert_many([{'timestamp': ms_to_timestamp(ts), 'ts_epoch_ms': ts, 'cpu_usage': cpu,
+                             'memory_usage': memory, 'disk_io': disk, 'network_usage': network}
+                            for ts, cpu, memory, disk, network in rows])
+            db.insert_data({'timestamp': ms_to_timestamp(START_MS), 'ts_epoch_ms': START_MS + 1,
+                            'cpu_usage': 99.0, 'memory_usage': 99.0, 'disk_io': 99.0,
+                            'network_usage': 99.0, 'host': 'other'})
+            result = replay(db, START_MS, rows[-1][0] + 1, THRESHOLD_SETS, DEFAULT_HOST, chunk_rows=500)
+            self.assertEqual(result.samples, len(rows))
+            self.assertEqual((result.first_ms, result.last_ms), (rows[0][0], rows[-1][0]))
+            self.assertMatches(result.results, rows)
+            db.close()
+        finally:
+            shutil.rmtree(test_dir)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+# SysMoniTool/tests/test_rules.py
+
+import unittest
+from context import *
+from rules import RuleEngine, Window, Baseline, WARMUP_SAMPLES
+
+def sample(cpu, memory=10.0, disk=0.0, network=0.0):
+    return {'cpu_usage': cpu, 'memory_usage': memory, 'disk_io': disk, 'network_usage': network}
+
+class TestRuleEngine(unittest.TestCase):
+    def fired(self, engine, cpu_values):
+        """Feed one CPU value per second and return the times at which rules fired."""
+        return [t for t, cpu in enumerate(cpu_values) if engine.evaluate(sample(cpu), float(t))]
+
+    def test_single_spike_does_not_fire(self):
+        engine = RuleEngine.compile({'cpu_usage': 80.0, 'cpu_usage_duration': 3})
+        self.assertEqual(self.fired(engine, [10, 95, 10, 10, 10]), [])
+
+    def test_sustained_breach_fires_once(self):
+        engine = RuleEngine.compile({'cpu_usage': 80.0, 'cpu_usage_duration': 3})
+        self.assertEqual(self.fired(engine, [10, 90, 90, 90, 90, 90, 90]), [4])
+
+    def test_hysteresis(self):
+        engine = RuleEngine.compile({'cpu_usage': 80.0, 'cpu_usage_clear': 60.0,
+                                     'cpu_usage_duration': 0})
+        # Dipping to 70 does not clear the breach, so it fires only once;
+        # dropping to 50 clears it and the next breach fires again
+        self.assertEqual(self.fired(engine, [90, 70, 90, 50, 90]), [0, 4])
+
+    def test_moving_average(self):
+        engine = RuleEngine.compile({'cpu_usage': 80.0, 'cpu_usage_window': 4,
+                                     'cpu_usage_duration': 0})
+        # Alternating spikes average out; a sustained level does not
+        self.assertEqual(self.fired(engine, [10, 100, 10, 100, 10, 100, 100, 100, 100]), [8])
+
+    def test_rate_of_change(self):
+        engine = RuleEngine.compile({'cpu_usage': 1000.0, 'cpu_usage_rate': 10.0,
+                                     'cpu_usage_rate_window': 3})
+        fired = [engine.evaluate(sample(cpu), float(t)) for t, cpu in enumerate([10, 12, 14, 50, 50, 50])]
+        self.assertEqual([[rule.name for rule in rules] for rules in fired],
+                         [[], [], [], ['cpu_usage_rate'], [], []])
+
+    def test_window_statistics(self):
+        window = Window(3)
+        for t, value in enumerate([1.0, 2.0, 3.0, 10.0]):
+            window.push(float(t), value)
+        self.assertEqual(window.last(), 10.0)
+        self.assertEqual(window.mean(), 5.0)
+        self.assertEqual(window.rate(), 4.0)
+
+    def test_anomaly_against_baseline(self):
+        engine = RuleEngine.compile({'disk_io_anomaly': 4.0, 'disk_io_anomaly_seasonal': 0,
+                                     'disk_io_anomaly_duration': 0})
+        values = [10.0 + (t % 5) for t in range(WARMUP_SAMPLES)] + [12.0, 40.0, 40.0, 11.0, 40.0]
+        fired = [t for t, disk in enumerate(values)
+                 if engine.evaluate(sample(10.0, disk=disk), float(t))]
+        # The spike fires once; the baseline absorbs part of it, so the
+        # return to normal clears the breach and the next spike fires again
+        self.assertEqual(fired, [WARMUP_SAMPLES + 1, WARMUP_SAMPLES + 4])
+        rule = engine.rules[-1]
+        self.assertIn('Unusual disk I/O', rule.describe(40.0))
+
+    def test_seasonal_baselines_per_hour(self):
+        baseline = Baseline(halflife=100, slots=24)
+        baseline.utc_offset = 0
+        for i in range(WARMUP_SAMPLES):
+            baseline.update(i, 5.0)
+            baseline.update(3600 + i, 50.0)
+        # Each hour is compared with its own history
+        self.assertEqual(baseline.update(120, 5.0)[0], 0.0)
+        self.assertEqual(baseline.update(3720, 50.0)[0], 0.0)
+        self.assertGreater(baseline.update(180, 50.0)[0], 40.0)
+
+    def test_adopt_keeps_windows_and_breaches(self):
+        old = RuleEngine.compile({'cpu_usage': 80.0, 'cpu_usage_window': 2, 'cpu_usage_duration': 0})
+        self.assertEqual(self.fired(old, [90, 90]), [0])
+        new = RuleEngine.compile({'cpu_usage': 85.0, 'cpu_usage_window': 2, 'cpu_usage_duration': 0,
+                                  'memory_usage': 50.0})
+        new.adopt(old)
+        self.assertEqual(new.rules[0].window.mean(), 90.0)
+        # Still the same breach under the new trigger, so it does not fire again
+        self.assertEqual(new.evaluate(sample(90.0), 2.0), [])
+        self.assertTrue(new.rules[0].breached)
+
+    def test_state_round_trip(self):
+        thresholds = {'network_usage_anomaly': 3.0}
+        engine = RuleEngine.compile(thresholds)
+        for t in range(100):
+            engine.evaluate(sample(10.0, network=float(t % 7)), float(t))
+        state = engine.state()
+        self.assertEqual(list(state), ['network_usage_anomaly'])
+
+        restored = RuleEngine.compile(thresholds)
+        self.assertEqual(restored.restore(state), 1)
+        self.assertEqual(restored.rules[-1].baseline.state, engine.rules[-1].baseline.state)
+        # A checkpoint taken with another layout is ignored
+        other = RuleEngine.compile({**thresholds, 'network_usage_anomaly_seasonal': 0})
+        self.assertEqual(other.restore(state), 0)
+
+if __name__ == '__main__':
+    unittest.main()
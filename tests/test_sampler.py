@@ -0,0 +1,102 @@
+# SysMoniTool/tests/test_sampler.py
+
+import unittest
+import tempfile
+import shutil
+import os
+import time
+from unittest import mock
+from context import *
+import sampler
+from sampler import ProcSampler, SampleClock
+
+STAT = "cpu  {busy} 0 0 {idle} 0 0 0 0 0 0\ncpu0 1 0 0 1 0 0 0 0 0 0\n"
+MEMINFO = "MemTotal:        1000 kB\nMemFree:          250 kB\nMemAvailable:     500 kB\n"
+DISKSTATS = ("   7       0 loop0 1 0 {loop} 0 0 0 0 0 0 0 0\n"
+             "   8       0 sda 1 0 {sda} 0 0 0 0 0 0 0 0\n"
+             "   8       1 sda1 1 0 {sda} 0 0 0 0 0 0 0 0\n"
+             " 259       0 nvme0n1 1 0 {nvme} 0 0 0 0 0 0 0 0\n")
+NET_DEV = ("Inter-|   Receive\n face |bytes    packets\n"
+           "    lo: {lo} 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0\n"
+           "  eth0: {eth0} 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0\n"
+           "br-0a1b2c3d4e: {br} 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0\n")
+
+class TestProcSampler(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.proc = os.path.join(self.test_dir, 'proc')
+        self.sys = os.path.join(self.test_dir, 'sys')
+        os.makedirs(os.path.join(self.proc, 'net'))
+        devices = os.path.join(self.sys, 'devices')
+        for path in ('pci/block/sda', 'pci/block/nvme0n1', 'virtual/block/loop0',
+                     'pci/net/eth0', 'virtual/net/lo', 'virtual/net/br-0a1b2c3d4e'):
+            os.makedirs(os.path.join(devices, path))
+        os.makedirs(os.path.join(self.sys, 'block'))
+        os.makedirs(os.path.join(self.sys, 'class/net'))
+        for name in ('sda', 'nvme0n1', 'loop0'):
+            kind = 'virtual' if name == 'loop0' else 'pci'
+            os.symlink(os.path.join(devices, kind, 'block', name), os.path.join(self.sys, 'block', name))
+        for name in ('eth0', 'lo', 'br-0a1b2c3d4e'):
+            kind = 'pci' if name == 'eth0' else 'virtual'
+            os.symlink(os.path.join(devices, kind, 'net', name), os.path.join(self.sys, 'class/net', name))
+        self._write(busy=100, idle=900, sda=0, nvme=0, loop=0, eth0=0, lo=0, br=0)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def _write(self, busy, idle, sda, nvme, loop, eth0, lo, br):
+        files = {
+            'stat': STAT.format(busy=busy, idle=idle),
+            'meminfo': MEMINFO,
+            'diskstats': DISKSTATS.format(sda=sda, nvme=nvme, loop=loop),
+            'net/dev': NET_DEV.format(lo=lo, eth0=eth0, br=br),
+        }
+        for name, content in files.items():
+            # Truncated and rewritten in place, so the sampler's open
+            # descriptors see the new contents
+            with open(os.path.join(self.proc, name), 'w') as f:
+                f.write(content)
+
+    def test_rates_over_physical_devices(self):
+        clock = [100.0]
+        proc_sampler = ProcSampler(self.proc, self.sys)
+        try:
+            with mock.patch.object(sampler.time, 'monotonic', lambda: clock[0]):
+                first = proc_sampler.sample()
+                self.assertEqual(first['cpu_usage'], 0.0)
+                self.assertEqual(first['memory_usage'], 75.0)
+
+                # 2 MiB read on sda, 2 MiB on nvme0n1 (its partitions and
+                # loop devices are ignored), 1 MiB received on eth0, over 2s
+                self._write(busy=300, idle=1500, sda=4096, nvme=4096, loop=999999,
+                            eth0=1024 * 1024, lo=10 ** 9, br=10 ** 9)
+                clock[0] += 2.0
+                second = proc_sampler.sample()
+        finally:
+            proc_sampler.close()
+
+        self.assertEqual(second['cpu_usage'], 25.0)
+        self.assertEqual(second['disk_io'], 2.0)
+        self.assertEqual(second['network_usage'], 0.5)
+        self.assertIn('ts_epoch_ms', second)
+
+    def test_buffer_grows_for_large_files(self):
+        proc_sampler = ProcSampler(self.proc, self.sys)
+        try:
+            proc_sampler.buffers['diskstats'] = bytearray(16)
+            self.assertEqual(proc_sampler.read('diskstats'),
+                             DISKSTATS.format(sda=0, nvme=0, loop=0).encode())
+        finally:
+            proc_sampler.close()
+
+    def test_sample_clock_rate_limits(self):
+        with self.assertRaises(ValueError):
+            SampleClock(500)
+        clock = SampleClock(100)
+        start = time.monotonic()
+        for _ in range(10):
+            clock.wait()
+        self.assertGreaterEqual(time.monotonic() - start, 0.09)
+
+if __name__ == '__main__':
+    unittest.main()
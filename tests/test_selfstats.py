@@ -0,0 +1,50 @@
+# SysMoniTool/tests/test_selfstats.py
+
+import unittest
+import urllib.request
+from context import *
+from selfstats import Registry, MetricsServer, parse_text, summarize
+
+class TestSelfStats(unittest.TestCase):
+    def setUp(self):
+        self.registry = Registry()
+        self.samples = self.registry.counter('test_samples_total', 'Samples')
+        self.depth = self.registry.gauge('test_queue_depth', 'Queue depth')
+        self.latency = self.registry.histogram('test_seconds', 'Latency', bounds=(0.001, 0.01, 0.1))
+
+    def test_render_prometheus_text(self):
+        self.samples.inc()
+        self.samples.inc(2)
+        self.depth.set_function(lambda: 7)
+        for value in (0.0005, 0.005, 0.005, 5.0):
+            self.latency.observe(value)
+        # Registering a name again returns the existing metric
+        self.assertIs(self.registry.counter('test_samples_total', 'Samples'), self.samples)
+
+        text = self.registry.render()
+        self.assertIn('# TYPE test_seconds histogram', text)
+        values = parse_text(text)
+        self.assertEqual(values['test_samples_total'], 3)
+        self.assertEqual(values['test_queue_depth'], 7)
+        self.assertEqual(values['test_seconds_bucket{le="0.01"}'], 3)
+        self.assertEqual(values['test_seconds_bucket{le="+Inf"}'], 4)
+        self.assertEqual(values['test_seconds_count'], 4)
+        self.assertEqual(self.latency.quantile(0.5), 0.01)
+        self.assertIsNone(self.latency.quantile(1.0))
+
+        rows = dict(summarize(values))
+        self.assertEqual(rows['test_samples_total'], '3')
+        self.assertTrue(rows['test_seconds'].startswith('count 4'))
+        self.assertTrue(rows['test_seconds'].endswith('p99 <= +Inf'))
+
+    def test_http_endpoint(self):
+        self.samples.inc()
+        server = MetricsServer(self.registry, port=0).start()
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{server.port}/metrics', timeout=5) as response:
+                self.assertIn('test_samples_total 1', response.read().decode())
+        finally:
+            server.stop()
+
+if __name__ == '__main__':
+    unittest.main()
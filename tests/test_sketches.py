@@ -0,0 +1,54 @@
+# SysMoniTool/tests/test_sketches.py
+
+import unittest
+import random
+from context import *
+from sketches import Sketch, merge_blobs, RELATIVE_ACCURACY
+import rollups
+
+class TestSketch(unittest.TestCase):
+    def test_quantiles_within_relative_accuracy(self):
+        rng = random.Random(7)
+        values = sorted(rng.lognormvariate(2, 1) for _ in range(5000))
+        sketch = Sketch()
+        for value in values:
+            sketch.add(value)
+        self.assertEqual(sketch.count(), 5000)
+        for q in (0.5, 0.95, 0.99):
+            exact = values[int(q * (len(values) - 1))]
+            self.assertLessEqual(abs(sketch.quantile(q) - exact), exact * RELATIVE_ACCURACY)
+        self.assertIsNone(Sketch().quantile(0.5))
+
+    def test_merge_matches_single_sketch(self):
+        whole, left, right = Sketch(), Sketch(), Sketch()
+        for i in range(200):
+            whole.add(i * 0.5)
+            (left if i % 2 else right).add(i * 0.5)
+        merged = merge_blobs(left.encode(), right.encode())
+        self.assertEqual(merged, whole.encode())
+        self.assertEqual(merge_blobs(None, merged), merged)
+        self.assertEqual(Sketch.decode(merged).counts, whole.counts)
+
+    def test_count_above_and_histogram(self):
+        sketch = Sketch()
+        for value in (0.0, 5.0, 15.0, 50.0, 95.0):
+            sketch.add(value)
+        self.assertEqual(sketch.count_above(80.0), 1)
+        self.assertEqual(sketch.count_above(-1.0), 5)
+        self.assertEqual(sketch.histogram([0, 10, 20]), [2, 1, 2])
+
+class TestSplitRange(unittest.TestCase):
+    def test_coarsest_buckets_then_raw_edges(self):
+        day, hour, minute = (rollups.RESOLUTIONS[r] for r in ('1d', '1h', '1m'))
+        start = 10 * day - hour - minute - 500
+        end = 12 * day + hour + 700
+        pieces, edges = rollups.split_range(start, end)
+        self.assertEqual(pieces, [('1d', 10 * day, 12 * day),
+                                  ('1h', 10 * day - hour, 10 * day),
+                                  ('1h', 12 * day, 12 * day + hour),
+                                  ('1m', 10 * day - hour - minute, 10 * day - hour)])
+        self.assertEqual(edges, [(start, 10 * day - hour - minute), (12 * day + hour, end)])
+        self.assertEqual(rollups.split_range(0, 500), ([], [(0, 500)]))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+# SysMoniTool/tests/test_startup.py
+
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from context import *
+from database import Database, ms_to_timestamp
+
+SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/python'))
+# Modules only some commands need; importing cli must not pull them in
+HEAVY_MODULES = ('psutil', 'tabulate', 'automation', 'urllib.request', 'http.server',
+                 'subprocess', 'export', 'watch', 'asyncio')
+
+class TestStartup(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.db_path = os.path.join(self.workdir, 'test.db')
+
+    def tearDown(self):
+        for name in os.listdir(self.workdir):
+            os.remove(os.path.join(self.workdir, name))
+        os.rmdir(self.workdir)
+
+    def test_cli_import_is_light(self):
+        code = (f"import sys; sys.path.insert(0, {SRC!r}); import cli; "
+                f"print(sorted(m for m in {HEAVY_MODULES!r} if m in sys.modules))")
+        output = subprocess.run([sys.executable, '-c', code], cwd=self.workdir,
+                                capture_output=True, text=True, check=True).stdout
+        self.assertEqual(output.strip(), '[]')
+        # Importing cli does not set up file logging
+        self.assertEqual(os.listdir(self.workdir), [])
+
+    def test_readonly_open(self):
+        db = Database(self.db_path)
+        now_ms = int(time.time() * 1000)
+        db.insert_many([{'timestamp': ms_to_timestamp(now_ms), 'cpu_usage': 10.0,
+                            'memory_usage': 20.0, 'disk_io': 1.0, 'network_usage': 2.0}])
+        db.close()
+        modified = os.path.getmtime(self.db_path)
+
+        db = Database(self.db_path, readonly=True)
+        self.assertEqual(len(db.query_data(ms_to_timestamp(now_ms - 60000), ms_to_timestamp(now_ms + 60000))), 1)
+        with self.assertRaises(sqlite3.OperationalError):
+            db.update_threshold('cpu_usage', 50.0)
+        db.close()
+        self.assertEqual(os.path.getmtime(self.db_path), modified)
+
+    def test_readonly_open_missing_file(self):
+        with self.assertRaises(sqlite3.Error):
+            Database(os.path.join(self.workdir, 'missing.db'), readonly=True)
+        self.assertFalse(os.path.exists(os.path.join(self.workdir, 'missing.db')))
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+# SysMoniTool/tests/test_supervisor.py
+
+import json
+import os
+import sys
+import tempfile
+import time
+import unittest
+from context import *
+import supervisor
+
+SRC = os.path.abspath(os.path.join(os.path.dirname(__file__), '../src/python'))
+# Reports ready, then exits once if CRASH_MARKER does not exist yet
+CHILD = (f"import os, sys, time; sys.path.insert(0, {SRC!r}); import supervisor; "
+         "supervisor.notify_ready(); marker = os.environ.get('CRASH_MARKER'); "
+         "crash = marker and not os.path.exists(marker); "
+         "crash and open(marker, 'w').close(); "
+         "sys.exit(3) if crash else time.sleep(60)")
+
+class TestSupervisor(unittest.TestCase):
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.pid_file = os.path.join(self.workdir, 'monitor.pid')
+
+    def tearDown(self):
+        supervisor.stop(self.pid_file)
+        for name in os.listdir(self.workdir):
+            os.remove(os.path.join(self.workdir, name))
+        os.rmdir(self.workdir)
+
+    def read_pids(self):
+        with open(self.pid_file) as f:
+            return json.load(f)
+
+    def test_start_waits_for_ready_and_stop_waits_for_exit(self):
+        ok, reason = supervisor.start([('first', [sys.executable, '-c', CHILD]),
+                                       ('second', [sys.executable, '-c', CHILD])], self.pid_file)
+        self.assertTrue(ok, reason)
+        pids = self.read_pids()
+        self.assertTrue(supervisor.is_running(self.pid_file))
+        for name in ('supervisor_pid', 'first_pid', 'second_pid'):
+            self.assertTrue(supervisor.is_alive(pids[name]))
+
+        self.assertTrue(supervisor.stop(self.pid_file))
+        self.assertFalse(os.path.exists(self.pid_file))
+        for name in ('supervisor_pid', 'first_pid', 'second_pid'):
+            self.assertFalse(supervisor.is_alive(pids[name]))
+        self.assertFalse(supervisor.stop(self.pid_file))
+
+    def test_crashed_child_is_restarted(self):
+        os.environ['CRASH_MARKER'] = os.path.join(self.workdir, 'crashed')
+        try:
+            ok, reason = supervisor.start([('child', [sys.executable, '-c', CHILD])], self.pid_file)
+        finally:
+            del os.environ['CRASH_MARKER']
+        self.assertTrue(ok, reason)
+        first = self.read_pids()['child_pid']
+
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            pid = self.read_pids().get('child_pid')
+            if pid not in (None, first) and supervisor.is_alive(pid):
+                break
+            time.sleep(0.05)
+        else:
+            self.fail("child was not restarted")
+        self.assertFalse(supervisor.is_alive(first))
+
+    def test_child_failing_before_ready(self):
+        ok, reason = supervisor.start([('broken', [sys.executable, '-c', 'import sys; sys.exit(2)'])],
+                                      self.pid_file)
+        self.assertFalse(ok)
+        self.assertIn('broken', reason)
+        self.assertIn('exit status 2', reason)
+        self.assertFalse(os.path.exists(self.pid_file))
+
+    def test_notify_ready_without_supervisor(self):
+        self.assertFalse(supervisor.notify_ready())
+
+if __name__ == '__main__':
+    unittest.main()
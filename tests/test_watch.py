@@ -0,0 +1,82 @@
+# SysMoniTool/tests/test_watch.py
+
+import unittest
+import os
+import shutil
+import tempfile
+import time
+from context import *
+from database import Database, ms_to_timestamp, DAY_MS
+from watch import LiveView, sparkline
+
+class TestLiveView(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        db_file = os.path.join(self.test_dir, 'watch.db')
+        self.writer = Database(db_file)
+        self.reader = Database(db_file)
+        self.now_ms = int(time.time() * 1000)
+
+    def tearDown(self):
+        self.reader.close()
+        self.writer.close()
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def _insert(self, ms, cpu, host='localhost'):
+        self.writer.insert_data({'timestamp': ms_to_timestamp(ms), 'cpu_usage': cpu, 'memory_usage': 50.0,
+                                 'disk_io': 1.0, 'network_usage': 2.0, 'host': host})
+
+    def test_refresh_fetches_only_new_rows(self):
+        self._insert(self.now_ms - 60000, 10.0)
+        view = LiveView(self.reader)
+        # Backfilled from recent history
+        self.assertEqual(list(view.history['localhost'][0]), [10.0])
+
+        # Nothing committed: the tables are not queried
+        self.assertFalse(view.refresh())
+
+        self._insert(self.now_ms - 1000, 20.0)
+        self._insert(self.now_ms, 30.0, host='node-1')
+        self.assertTrue(view.refresh())
+        self.assertEqual(list(view.history['localhost'][0]), [10.0, 20.0])
+        self.assertEqual(view.latest['node-1'][2], 30.0)
+        self.assertIn('node-1', view.render())
+
+        # Rows landing in a new daily partition are picked up too
+        self._insert(self.now_ms + DAY_MS, 40.0)
+        self.assertTrue(view.refresh())
+        self.assertEqual(view.latest['localhost'][2], 40.0)
+        self.assertEqual(self.reader.rows_since(view.mark), ([], view.mark))
+
+        # A late sample for an older day is picked up, but is not the latest
+        self._insert(self.now_ms - 2000, 50.0)
+        self.assertTrue(view.refresh())
+        self.assertEqual(list(view.history['localhost'][0]), [10.0, 20.0, 40.0, 50.0])
+        self.assertEqual(view.latest['localhost'][2], 40.0)
+
+    def test_late_sample_into_archived_partition(self):
+        # Archived by hand only, so the thawed day stays in SQLite
+        self.writer.cold_after = None
+        self._insert(self.now_ms - 10 * DAY_MS, 10.0)
+        self._insert(self.now_ms, 20.0)
+        self.writer.archive_partitions(self.now_ms - 5 * DAY_MS)
+        view = LiveView(self.reader)
+        self._insert(self.now_ms - 10 * DAY_MS + 1000, 30.0)
+        view.refresh()
+        # Only the late sample, not the archived rows copied back with it
+        self.assertEqual(list(view.history['localhost'][0]), [20.0, 30.0])
+
+    def test_host_filter(self):
+        view = LiveView(self.reader, host='node-1')
+        self._insert(self.now_ms, 10.0)
+        self._insert(self.now_ms, 20.0, host='node-1')
+        view.refresh()
+        self.assertEqual(list(view.latest), ['node-1'])
+
+    def test_sparkline(self):
+        self.assertEqual(sparkline([0, 50, 100], 0, 100), '▁▅█')
+        self.assertEqual(sparkline([5, 5]), '▁▁')
+        self.assertEqual(sparkline([]), '')
+
+if __name__ == '__main__':
+    unittest.main()